@@ -1,11 +1,123 @@
+from datetime import datetime
+
 from django.contrib import admin
-from .models import User, GymBranch, WorkoutPlan, WorkoutTask, ActivityLog
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+
+from .models import User, GymBranch, WorkoutPlan, WorkoutTask, ActivityLog, SlowQuery
+from .pagination import EstimatedCountPaginator
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Free-text exact-match filter instead of a dropdown of every distinct value"""
+    template = 'admin/gym_api/input_filter.html'
+    lookup = None
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        # has_output() needs at least one entry; choices() renders the input instead
+        return [('', '')]
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if value:
+            return queryset.filter(**{self.lookup: value})
+        return queryset
+
+    def choices(self, changelist):
+        hidden = [(name, value) for name, value in changelist.params.items() if name != self.parameter_name]
+        yield {
+            'parameter_name': self.parameter_name,
+            'value': self.value() or '',
+            'placeholder': self.placeholder,
+            'hidden': hidden,
+            'clear_query_string': changelist.get_query_string(remove=[self.parameter_name]),
+        }
+
+
+class MemberEmailFilter(InputFilter):
+    title = 'member email'
+    parameter_name = 'member_email'
+    lookup = 'member__email'
+    placeholder = 'member@example.com'
+
+
+class TrainerEmailFilter(InputFilter):
+    title = 'trainer email'
+    parameter_name = 'created_by_email'
+    lookup = 'created_by__email'
+    placeholder = 'trainer@example.com'
+
+
+class UserEmailFilter(InputFilter):
+    title = 'user email'
+    parameter_name = 'user_email'
+    lookup = 'user__email'
+    placeholder = 'user@example.com'
+
+
+class ModelNameFilter(InputFilter):
+    title = 'model name'
+    parameter_name = 'model_name'
+    lookup = 'model_name'
+    placeholder = 'WorkoutTask'
+
+
+class DrilldownQuerySet(QuerySet):
+    """
+    ``datetimes()`` for the admin date hierarchy without a DISTINCT over the
+    whole table: the range comes from MIN/MAX and each candidate year, month
+    or day is probed with an indexed EXISTS range query.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo, is_dst)
+        tz = tzinfo or timezone.get_current_timezone()
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+
+        periods = []
+        start = _truncate(bounds['first'].astimezone(tz), kind)
+        last = bounds['last'].astimezone(tz)
+        while start <= last:
+            end = _next_period(start, kind)
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists():
+                periods.append(start)
+            start = end
+        return periods if order == 'ASC' else periods[::-1]
+
+
+def _truncate(value, kind):
+    month = value.month if kind != 'year' else 1
+    day = value.day if kind == 'day' else 1
+    return datetime(value.year, month, day, tzinfo=value.tzinfo)
+
+
+def _next_period(value, kind):
+    if kind == 'year':
+        return value.replace(year=value.year + 1)
+    if kind == 'month':
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return datetime.fromordinal(value.toordinal() + 1).replace(tzinfo=value.tzinfo)
+
+
+class ScalableChangeListMixin:
+    """Changelist settings for large tables: estimated counts and index-backed drilldowns"""
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DrilldownQuerySet(model=queryset.model, query=queryset.query.chain(), using=queryset.db)
 
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ['email', 'first_name', 'last_name', 'role', 'gym_branch', 'is_active', 'created_at']
     list_filter = ['role', 'gym_branch', 'is_active', 'created_at']
+    list_select_related = ['gym_branch']
     search_fields = ['email', 'first_name', 'last_name']
     readonly_fields = ['created_at', 'updated_at']
 
@@ -21,22 +133,45 @@ class GymBranchAdmin(admin.ModelAdmin):
 @admin.register(WorkoutPlan)
 class WorkoutPlanAdmin(admin.ModelAdmin):
     list_display = ['title', 'created_by', 'gym_branch', 'created_at']
-    list_filter = ['gym_branch', 'created_by', 'created_at']
+    list_filter = ['gym_branch', TrainerEmailFilter, 'created_at']
+    list_select_related = ['created_by', 'gym_branch']
     search_fields = ['title', 'description']
+    autocomplete_fields = ['created_by', 'gym_branch']
     readonly_fields = ['created_at', 'updated_at']
 
 
 @admin.register(WorkoutTask)
-class WorkoutTaskAdmin(admin.ModelAdmin):
+class WorkoutTaskAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ['workout_plan', 'member', 'status', 'due_date', 'created_at']
-    list_filter = ['status', 'created_by', 'created_at', 'due_date']
+    list_filter = ['status', MemberEmailFilter, TrainerEmailFilter, 'due_date']
+    list_select_related = ['workout_plan__created_by', 'member']
     search_fields = ['member__email', 'workout_plan__title']
+    autocomplete_fields = ['workout_plan', 'member', 'created_by']
+    date_hierarchy = 'created_at'
     readonly_fields = ['created_at', 'updated_at']
 
 
 @admin.register(ActivityLog)
-class ActivityLogAdmin(admin.ModelAdmin):
+class ActivityLogAdmin(ScalableChangeListMixin, admin.ModelAdmin):
     list_display = ['user', 'action', 'model_name', 'created_at']
-    list_filter = ['action', 'model_name', 'created_at']
+    list_filter = ['action', ModelNameFilter, UserEmailFilter]
+    list_select_related = ['user']
     search_fields = ['user__email', 'object_id']
+    autocomplete_fields = ['user']
+    date_hierarchy = 'created_at'
     readonly_fields = ['created_at']
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['fingerprint', 'view', 'count', 'total_ms', 'max_ms', 'last_seen']
+    list_filter = ['view', 'last_seen']
+    search_fields = ['normalized_sql', 'view', 'frame']
+    ordering = ['-total_ms']
+    readonly_fields = [
+        'fingerprint', 'normalized_sql', 'sample_sql', 'view', 'frame', 'explain',
+        'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen'
+    ]
+
+    def has_add_permission(self, request):
+        return False
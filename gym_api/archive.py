@@ -0,0 +1,78 @@
+"""
+Archival of completed workout tasks.
+
+Tasks completed more than ``TASK_ARCHIVE_AFTER_DAYS`` days ago are copied
+to ``ArchivedWorkoutTask`` and removed from the live table, one chunk of
+``TASK_ARCHIVE_BATCH_SIZE`` rows per transaction, so the live table and its
+indexes only hold recent and open tasks. Archiving is not a deletion: no
+tombstones are written (sync clients keep the finished tasks they have) and
+leaderboard counts stay. Archived tasks are only read when history is asked
+for explicitly.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedWorkoutTask, WorkoutTask
+
+COPIED_FIELDS = (
+    'id', 'workout_plan_id', 'member_id', 'status', 'due_date', 'created_by_id', 'gym_branch_id',
+    'recurrence_id', 'occurrence_date', 'completed_at', 'created_at', 'updated_at',
+)
+
+_local = threading.local()
+
+
+@contextmanager
+def archiving():
+    """Deletes in this thread move tasks to the archive instead of removing them"""
+    _local.active = getattr(_local, 'active', 0) + 1
+    try:
+        yield
+    finally:
+        _local.active -= 1
+
+
+def in_progress():
+    return getattr(_local, 'active', 0) > 0
+
+
+def archived_tasks_for(user):
+    """Archived tasks visible to ``user``, scoped like its live tasks"""
+    queryset = ArchivedWorkoutTask.objects.all()
+    if user.role == 'super_admin':
+        return queryset
+    if user.role in ('gym_manager', 'trainer'):
+        return queryset.filter(gym_branch_id=user.gym_branch_id)
+    if user.role == 'member':
+        return queryset.filter(member_id=user.id)
+    return queryset.none()
+
+
+def archive_completed(older_than=None, batch_size=None):
+    """Move completed tasks finished before ``older_than``; return how many were moved"""
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=getattr(settings, 'TASK_ARCHIVE_AFTER_DAYS', 180))
+    batch_size = batch_size or getattr(settings, 'TASK_ARCHIVE_BATCH_SIZE', 1000)
+    candidates = WorkoutTask.objects.filter(status='completed', completed_at__lt=older_than)
+
+    moved = 0
+    last_id = 0
+    while True:
+        with transaction.atomic(), archiving():
+            # skip rows being edited right now; a later run picks them up
+            rows = list(
+                candidates.filter(id__gt=last_id).order_by('id')
+                .select_for_update(skip_locked=True).values(*COPIED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            ArchivedWorkoutTask.objects.bulk_create([ArchivedWorkoutTask(**row) for row in rows])
+            WorkoutTask.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        last_id = rows[-1]['id']
+    return moved
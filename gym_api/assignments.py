@@ -0,0 +1,139 @@
+"""
+Automatic trainer assignment.
+
+Every member of a branch gets one ``TrainerAssignment``. A trainer's load is
+the number of active (pending or in progress) tasks they assigned plus the
+number of members assigned to them, so trainers without tasks yet still fill
+up evenly. ``assign_members`` keeps the branch's trainers in a min-heap keyed
+by load: each member goes to the least loaded trainer, whose load then grows
+by one. All assignments of a run are written with one bulk upsert in one
+transaction, holding the branch row lock so concurrent runs (and members
+created meanwhile) cannot unbalance each other.
+
+New members are not assigned inside the transaction that creates them:
+``schedule`` queues them and one ``assign_members`` run per branch follows the
+commit, so user creation never waits on the branch lock and an import that
+creates many members in one transaction pays for the load query once.
+"""
+import heapq
+import threading
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import GymBranch, TrainerAssignment, User, WorkoutTask
+
+ACTIVE_STATUSES = ('pending', 'in_progress')
+
+_pending = threading.local()
+
+
+def trainer_loads(branch_id, exclude_members=()):
+    """``{trainer_id: load}`` of the branch's active trainers"""
+    loads = dict.fromkeys(
+        User.objects.filter(role='trainer', gym_branch_id=branch_id, is_active=True)
+        .order_by('id').values_list('id', flat=True),
+        0,
+    )
+    tasks = (
+        WorkoutTask.objects.filter(gym_branch_id=branch_id, status__in=ACTIVE_STATUSES, created_by_id__in=loads)
+        .values_list('created_by_id').annotate(total=Count('id')).order_by()
+    )
+    members = (
+        TrainerAssignment.objects.filter(gym_branch_id=branch_id, trainer_id__in=loads)
+        .exclude(member_id__in=exclude_members)
+        .values_list('trainer_id').annotate(total=Count('id')).order_by()
+    )
+    for rows in (tasks, members):
+        for trainer_id, total in rows:
+            loads[trainer_id] += total
+    return loads
+
+
+def _save(branch_id, pairs, batch_size):
+    TrainerAssignment.objects.bulk_create(
+        [TrainerAssignment(member_id=member_id, trainer_id=trainer_id, gym_branch_id=branch_id) for member_id, trainer_id in pairs],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['member'],
+        update_fields=['trainer', 'gym_branch', 'updated_at'],
+    )
+
+
+def _lock_branch(branch_id):
+    list(GymBranch.objects.select_for_update().filter(pk=branch_id).values_list('id', flat=True))
+
+
+def _branch_members(branch_id, member_ids, reassign=True):
+    members = User.objects.filter(role='member', gym_branch_id=branch_id, is_active=True)
+    if member_ids is not None:
+        members = members.filter(id__in=member_ids)
+    if member_ids is None or not reassign:
+        # everyone without a trainer yet
+        members = members.filter(trainer_assignment__isnull=True)
+    return list(members.order_by('id').values_list('id', flat=True))
+
+
+def assign_members(branch_id, member_ids=None, batch_size=1000, reassign=True):
+    """
+    Assign members of a branch to its least loaded trainers and return
+    ``{trainer_id: load}`` after the run plus the number of members
+    assigned. Without ``member_ids`` every unassigned member is assigned;
+    listed members are (re)assigned even if they already have a trainer,
+    unless ``reassign`` is false.
+    """
+    with transaction.atomic():
+        _lock_branch(branch_id)
+        members = _branch_members(branch_id, member_ids, reassign)
+        # members being reassigned do not weigh on their current trainer
+        loads = trainer_loads(branch_id, exclude_members=members if member_ids is not None and reassign else ())
+        if not loads or not members:
+            return loads, 0
+        heap = [(load, trainer_id) for trainer_id, load in loads.items()]
+        heapq.heapify(heap)
+        pairs = []
+        for member_id in members:
+            load, trainer_id = heap[0]
+            pairs.append((member_id, trainer_id))
+            heapq.heapreplace(heap, (load + 1, trainer_id))
+        _save(branch_id, pairs, batch_size)
+    return {trainer_id: load for load, trainer_id in sorted(heap, key=lambda item: item[1])}, len(pairs)
+
+
+def schedule(member):
+    """Assign a new member, together with the others of its transaction, once that commits"""
+    connection = transaction.get_connection()
+    queued = any(_assign_pending in hook for hook in connection.run_on_commit)
+    if not queued:
+        # whatever is left belongs to a transaction that was rolled back
+        _pending.members = {}
+    _pending.members.setdefault(member.gym_branch_id, set()).add(member.pk)
+    if not queued:
+        transaction.on_commit(_assign_pending)
+
+
+def _assign_pending():
+    pending, _pending.members = _pending.members, {}
+    for branch_id, member_ids in pending.items():
+        assign_members(branch_id, sorted(member_ids), reassign=False)
+
+
+def assign_to_trainer(trainer, member_ids, batch_size=1000):
+    """Assign members of the trainer's branch to one trainer; return how many were assigned"""
+    with transaction.atomic():
+        _lock_branch(trainer.gym_branch_id)
+        members = _branch_members(trainer.gym_branch_id, member_ids)
+        _save(trainer.gym_branch_id, [(member_id, trainer.id) for member_id in members], batch_size)
+    return len(members)
+
+
+def drop_stale(user):
+    """Remove the assignments a role, branch or active change of ``user`` made invalid"""
+    as_member = TrainerAssignment.objects.filter(member=user)
+    as_trainer = TrainerAssignment.objects.filter(trainer=user)
+    if user.is_active and user.role == 'member':
+        as_member = as_member.exclude(gym_branch_id=user.gym_branch_id)
+    if user.is_active and user.role == 'trainer':
+        as_trainer = as_trainer.exclude(gym_branch_id=user.gym_branch_id)
+    as_member.delete()
+    as_trainer.delete()
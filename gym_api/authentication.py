@@ -0,0 +1,65 @@
+import logging
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .timing import phase
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """JWT authentication that reports its duration in Server-Timing"""
+    def authenticate(self, request):
+        with phase('auth'):
+            return super().authenticate(request)
+
+
+def issue_stream_ticket(user):
+    """Short-lived, single-use ticket that opens one event stream for ``user``"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(f'events:ticket:{ticket}', user.id, timeout=getattr(settings, 'EVENTS_TICKET_TTL', 30))
+    return ticket
+
+
+def redeem_stream_ticket(ticket):
+    """User id of a valid ticket, or None; the ticket is used up either way"""
+    key = f'events:ticket:{ticket}'
+    user_id = cache.get(key)
+    # only the request that actually deletes the key may use it
+    if user_id is None or not cache.delete(key):
+        return None
+    return user_id
+
+
+def authenticate_event_stream(request):
+    """
+    User of an event stream request, or None. EventSource cannot send
+    headers, so it passes a ticket from ``POST /workout-tasks/events/ticket/``
+    as ``?ticket=`` instead of the access token, which would end up in
+    access logs.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is not None:
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+        except AuthenticationFailed:
+            return None
+    ticket = request.GET.get('ticket')
+    if not ticket:
+        return None
+    try:
+        user_id = redeem_stream_ticket(ticket)
+    except Exception:
+        logger.warning('Stream tickets unavailable', exc_info=True)
+        return None
+    if user_id is None:
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
@@ -0,0 +1,175 @@
+"""
+In-process execution of batched API sub-requests.
+
+Sub-requests are dispatched straight to the resolved view, authenticated as
+the user of the batch request (no JWT decoding or user lookup per call) and
+without the middleware stack. In the default mode each run of consecutive
+GETs executes concurrently on up to ``BATCH_MAX_WORKERS`` threads, while
+writes run one at a time in order. In transactional mode everything runs in
+order inside one transaction, which is rolled back as soon as a sub-request
+fails; the remaining ones are skipped.
+"""
+import asyncio
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections, transaction
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+FORWARDED_HEADERS = ('ETag', 'Location', 'Retry-After')
+API_PREFIX = '/api/v1/'
+
+
+class BatchError(ValueError):
+    pass
+
+
+class _Rollback(Exception):
+    pass
+
+
+def parse_requests(data):
+    """Validate the ``requests`` list of a batch body"""
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError('requests must be a non-empty list')
+    max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(items) > max_requests:
+        raise BatchError(f'A batch can contain at most {max_requests} requests')
+
+    parsed = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise BatchError(f'requests[{index}] must be an object')
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        if method not in ALLOWED_METHODS:
+            raise BatchError(f'requests[{index}]: unsupported method {method}')
+        if not isinstance(path, str) or not path.startswith(API_PREFIX):
+            raise BatchError(f'requests[{index}]: path must start with {API_PREFIX}')
+        if urlsplit(path).path.rstrip('/') == f'{API_PREFIX}batch':
+            raise BatchError(f'requests[{index}]: batches cannot be nested')
+        parsed.append((method, path, item.get('body')))
+    return parsed
+
+
+def _build_request(parent, method, path, body):
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body).encode()
+    environ = {
+        key: value for key, value in parent.META.items()
+        if key in ('REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL', 'HTTP_HOST',
+                   'HTTP_USER_AGENT', 'HTTP_X_FORWARDED_FOR', 'wsgi.url_scheme')
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(payload),
+    })
+    environ.setdefault('wsgi.url_scheme', parent.scheme)
+    request = WSGIRequest(environ)
+    # DRF authenticates these as the batch user (ForcedAuthentication)
+    request._force_auth_user = parent.user
+    request._force_auth_token = parent.auth
+    return request
+
+
+def _result(response):
+    result = {'status': response.status_code}
+    headers = {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)}
+    if headers:
+        result['headers'] = headers
+    if isinstance(response, Response):
+        result['body'] = response.data
+    elif response.streaming:
+        result['body'] = None
+    else:
+        content = response.content.decode(response.charset or 'utf-8', errors='replace')
+        try:
+            result['body'] = json.loads(content) if content else None
+        except ValueError:
+            result['body'] = content
+    return result
+
+
+def dispatch(parent, method, path, body):
+    """Run one sub-request and return its ``{'status', 'body'}`` result"""
+    request = _build_request(parent, method, path, body)
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return {'status': 404, 'body': {'error': 'Not found'}}
+    if asyncio.iscoroutinefunction(match.func):
+        return {'status': 400, 'body': {'error': 'Streaming endpoints cannot be batched'}}
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+    except Http404:
+        return {'status': 404, 'body': {'error': 'Not found'}}
+    except Exception:
+        logger.exception('Batch sub-request %s %s failed', method, path)
+        return {'status': 500, 'body': {'error': 'Internal server error'}}
+    return _result(response)
+
+
+def _dispatch_in_thread(parent, method, path, body):
+    try:
+        return dispatch(parent, method, path, body)
+    finally:
+        connections.close_all()
+
+
+def _run_concurrently(parent, items):
+    workers = min(getattr(settings, 'BATCH_MAX_WORKERS', 4), len(items))
+    if workers <= 1:
+        return [dispatch(parent, *item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as executor:
+        return list(executor.map(lambda item: _dispatch_in_thread(parent, *item), items))
+
+
+def run(parent, items):
+    """Run consecutive GETs concurrently and everything else in order"""
+    results = []
+    reads = []
+    for item in items:
+        if item[0] == 'GET':
+            reads.append(item)
+            continue
+        if reads:
+            results.extend(_run_concurrently(parent, reads))
+            reads = []
+        results.append(dispatch(parent, *item))
+    if reads:
+        results.extend(_run_concurrently(parent, reads))
+    return results
+
+
+def run_atomic(parent, items):
+    """Run all sub-requests in one transaction; roll back on the first failure"""
+    results = []
+    try:
+        with transaction.atomic():
+            for item in items:
+                result = dispatch(parent, *item)
+                results.append(result)
+                if result['status'] >= 400:
+                    raise _Rollback
+    except _Rollback:
+        skipped = {'status': 424, 'body': {'error': 'Not executed, an earlier request failed'}}
+        results.extend(dict(skipped) for _ in range(len(items) - len(results)))
+        return results, False
+    return results, True
@@ -0,0 +1,50 @@
+"""
+Cache calls that survive an unreachable cache.
+
+The shared cache (Redis when ``REDIS_URL`` is set) is an optimization, so
+its failures must not fail requests. ``call()`` runs one cache operation
+and, if it raises, returns the caller's fallback instead. A failure also
+opens a circuit breaker for ``CACHE_BREAKER_SECONDS``: during that time the
+cache is not tried at all, so requests do not each wait for connection
+timeouts while it is down, and the outage is logged once rather than per
+call.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# alias -> time.monotonic() until which the cache is skipped
+_open_until = {}
+
+
+def is_available(alias):
+    return _open_until.get(alias, 0) <= time.monotonic()
+
+
+def call(alias, method, *args, fallback=None, **kwargs):
+    """
+    ``caches[alias].<method>(*args, **kwargs)``, or ``fallback()`` (None
+    without one) if the cache fails or its breaker is open
+    """
+    return run(alias, lambda cache: getattr(cache, method)(*args, **kwargs), fallback=fallback)
+
+
+def run(alias, func, fallback=None):
+    """``func(caches[alias])``, guarded like ``call()``"""
+    if is_available(alias):
+        try:
+            return func(caches[alias])
+        except Exception:
+            seconds = getattr(settings, 'CACHE_BREAKER_SECONDS', 30)
+            _open_until[alias] = time.monotonic() + seconds
+            logger.warning('Cache %r unavailable, skipping it for %ss', alias, seconds, exc_info=True)
+    return fallback() if fallback is not None else None
+
+
+def reset():
+    """Close all breakers (tests, or after the cache is known to be back)"""
+    _open_until.clear()
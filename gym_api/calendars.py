@@ -0,0 +1,54 @@
+"""
+Calendar helpers: local date ranges in a client time zone, mapped to UTC
+bounds for index range scans on ``due_date``, and grouping by local day.
+"""
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+
+
+class CalendarRangeError(ValueError):
+    pass
+
+
+def parse_range(params):
+    """``(start, end, tz)`` from ``start``/``end`` (inclusive dates) and ``tz`` parameters"""
+    try:
+        start = date.fromisoformat(params.get('start', ''))
+        end = date.fromisoformat(params.get('end', ''))
+    except ValueError:
+        raise CalendarRangeError('start and end are required as YYYY-MM-DD dates')
+    if end < start:
+        raise CalendarRangeError('end must not be before start')
+    max_days = getattr(settings, 'CALENDAR_MAX_DAYS', 62)
+    if (end - start).days + 1 > max_days:
+        raise CalendarRangeError(f'The range cannot be longer than {max_days} days')
+
+    tz_name = params.get('tz') or settings.TIME_ZONE
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise CalendarRangeError(f'Unknown time zone: {tz_name}')
+    return start, end, tz
+
+
+def bounds(start, end, tz):
+    """Aware ``[lower, upper)`` datetimes covering the local days ``start`` to ``end``"""
+    lower = datetime.combine(start, time.min, tzinfo=tz)
+    upper = datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz)
+    return lower, upper
+
+
+def days(start, end):
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+def group_by_day(items, moments, start, end, tz):
+    """``{date: [item, ...]}`` for every day of the range, items placed by their local date"""
+    grouped = {day: [] for day in days(start, end)}
+    for item, moment in zip(items, moments):
+        local_day = moment.astimezone(tz).date()
+        if local_day in grouped:
+            grouped[local_day].append(item)
+    return grouped
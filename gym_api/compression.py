@@ -0,0 +1,163 @@
+"""
+Negotiated response compression.
+
+Supports ``br`` (when the optional ``brotli`` package is installed), ``gzip``
+and ``deflate``, chosen from the client's ``Accept-Encoding`` q-values.
+Regular responses below ``COMPRESSION_MIN_SIZE`` bytes are left alone;
+streaming responses (sync or async) are compressed chunk by chunk with a sync
+flush after each chunk, so nothing is buffered and event streams stay live.
+
+Only API payloads, metrics and event streams are compressed. HTML pages (the
+admin, the browsable API) carry CSRF tokens next to reflected input, which
+compression would expose to a BREACH attack.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+DEFAULT_CONTENT_TYPES = (
+    'application/json',
+    'text/event-stream',
+    'text/plain',
+)
+
+
+class _ZlibCompressor:
+    def __init__(self, level, wbits):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def chunk(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b''):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def chunk(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self, data=b''):
+        return self._compressor.process(data) + self._compressor.finish()
+
+
+def available_encodings():
+    encodings = ['gzip', 'deflate']
+    if brotli is not None:
+        encodings.insert(0, 'br')
+    return encodings
+
+
+def make_compressor(encoding):
+    level = getattr(settings, 'COMPRESSION_LEVEL', 6)
+    if encoding == 'br':
+        return _BrotliCompressor(getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    if encoding == 'gzip':
+        return _ZlibCompressor(level, 16 + zlib.MAX_WBITS)
+    return _ZlibCompressor(level, zlib.MAX_WBITS)
+
+
+def parse_accept_encoding(header):
+    """Map of coding -> q-value from an Accept-Encoding header"""
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(header):
+    """Best supported coding accepted by the client, or None"""
+    if not header:
+        return None
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = codings.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.has_header('Content-Encoding'):
+        return False
+    if 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    content_types = getattr(settings, 'COMPRESSION_CONTENT_TYPES', DEFAULT_CONTENT_TYPES)
+    return content_type in content_types
+
+
+def _weaken_etag(response):
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+
+
+def _compress_iterator(iterator, compressor):
+    for data in iterator:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+async def _compress_async_iterator(iterator, compressor):
+    async for data in iterator:
+        if data:
+            yield compressor.chunk(data)
+    yield compressor.finish()
+
+
+def compress_response(request, response):
+    if not getattr(settings, 'COMPRESSION_ENABLED', True) or not _compressible(response):
+        return response
+
+    if not response.streaming:
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return response
+
+    compressor = make_compressor(encoding)
+    if response.streaming:
+        if getattr(response, 'is_async', False):
+            response.streaming_content = _compress_async_iterator(response.streaming_content, compressor)
+        else:
+            response.streaming_content = _compress_iterator(response.streaming_content, compressor)
+        del response['Content-Length']
+    else:
+        compressed = compressor.finish(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+
+    _weaken_etag(response)
+    response['Content-Encoding'] = encoding
+    return response
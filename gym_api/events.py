@@ -0,0 +1,216 @@
+"""
+Real-time task events, streamed to clients as Server-Sent Events.
+
+Streams are off unless ``EVENTS_ENABLED`` is set, since they need the ASGI
+application (``gym_management.asgi``) and, with more than one worker
+process, a shared broker. Views publish events after their transaction
+commits; the broker fans them out to the open event streams whose scope
+matches (branch for managers and trainers, own tasks for members).
+``LocalBroker`` works inside one process; ``RedisBroker`` relays events
+between processes over Redis pub/sub (``REDIS_URL``).
+
+Each subscriber has a bounded queue (``EVENTS_QUEUE_SIZE``). A consumer that
+falls that far behind is sent a final ``overflow`` event and disconnected
+instead of buffering without limit; it should resync through the delta-sync
+endpoint and reconnect.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW = object()
+
+_ids = itertools.count(1)
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    """Bounded event queue of one stream, fed from any thread"""
+
+    def __init__(self, matches, maxsize):
+        self.matches = matches
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class LocalBroker:
+    """In-process fan-out to the subscriptions of this worker"""
+
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, matches):
+        subscription = Subscription(matches, getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if not subscription.matches(event):
+                continue
+            try:
+                subscription.offer(event)
+            except RuntimeError:
+                # the stream's event loop is gone
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Publishes to a Redis channel; one listener thread per process fans the
+    channel out to the subscriptions of that process.
+    """
+
+    def __init__(self):
+        import redis
+
+        super().__init__()
+        self.channel = getattr(settings, 'EVENTS_REDIS_CHANNEL', 'gym-api:task-events')
+        self._redis = redis.Redis.from_url(settings.REDIS_URL)
+        self._listener = None
+
+    def subscribe(self, matches):
+        subscription = super().subscribe(matches)
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='task-events', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def publish(self, event):
+        try:
+            self._redis.publish(self.channel, json.dumps(event))
+        except Exception:
+            # events are best effort, clients catch up through delta sync
+            logger.warning('Could not publish task event %s', event['id'], exc_info=True)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    super().publish(json.loads(message['data']))
+            except Exception:
+                logger.warning('Task event listener lost Redis, reconnecting', exc_info=True)
+                time.sleep(1)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'EVENT_BROKER_BACKEND', 'gym_api.events.LocalBroker')
+                _broker = import_string(backend)()
+    return _broker
+
+
+def scope_for(user):
+    """Predicate selecting the events a user may receive"""
+    if user.role == 'super_admin':
+        return lambda event: True
+    if user.role in ('gym_manager', 'trainer'):
+        branch_id = user.gym_branch_id
+        return lambda event: branch_id is not None and event['branch'] == branch_id
+    if user.role == 'member':
+        return lambda event: event['member'] == user.id
+    return lambda event: False
+
+
+def task_event(event_type, task, previous_status=None):
+    return {
+        'id': next(_ids),
+        'type': event_type,
+        'task': task.id,
+        'status': task.status,
+        'previous_status': previous_status,
+        'member': task.member_id,
+        'workout_plan': task.workout_plan_id,
+        'branch': task.gym_branch_id,
+        'at': timezone.now().isoformat(),
+    }
+
+
+def publish_task_event(event_type, task, previous_status=None):
+    """Publish once the current transaction commits"""
+    if not getattr(settings, 'EVENTS_ENABLED', False):
+        return
+    event = task_event(event_type, task, previous_status)
+    transaction.on_commit(lambda: get_broker().publish(event))
+
+
+def format_event(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+async def stream(matches, broker=None):
+    """
+    SSE body for one client. Ends after ``EVENTS_MAX_DURATION`` seconds (the
+    browser reconnects on its own) so streams of vanished clients are reaped.
+    """
+    broker = broker or get_broker()
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + getattr(settings, 'EVENTS_MAX_DURATION', 300)
+
+    subscription = broker.subscribe(matches)
+    try:
+        yield f'retry: {getattr(settings, "EVENTS_RETRY_MS", 3000)}\n\n'.encode()
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                event = await subscription.get(min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            if event is OVERFLOW:
+                yield format_event('overflow', {'detail': 'Too many pending events, resync and reconnect'})
+                break
+            yield format_event(event['type'], event, event['id'])
+    finally:
+        broker.unsubscribe(subscription)
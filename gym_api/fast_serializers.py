@@ -0,0 +1,177 @@
+"""
+Read-only fast path for high-volume list endpoints.
+
+``ValuesReader`` compiles a (possibly sparse) ModelSerializer into a single
+generated function that turns ``values_list()`` rows into the exact dicts the
+serializer would produce, skipping model instantiation and DRF's per-field
+machinery. Only plain model fields, primary-key relations, nested model
+serializers and method fields declared with columns in
+``Meta.expandable_fields`` can be compiled; anything else makes
+``compile_reader`` return None and the view falls back to the serializer.
+Writes always go through the normal serializers.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# fields whose to_representation() returns database values unchanged
+IDENTITY_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.JSONField,
+    serializers.PrimaryKeyRelatedField,
+    serializers.ReadOnlyField,
+)
+
+# (serializer class, kept fields) -> reader, least recently used first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class NotCompilable(Exception):
+    pass
+
+
+class ValuesReader:
+    """Builds serializer-identical dicts from ``values_list()`` rows"""
+
+    def __init__(self, lookups, build, source):
+        self.lookups = lookups
+        self.build = build
+        self.source = source
+
+    def prepare(self, queryset):
+        return queryset.values_list(*self.lookups)
+
+    def build_many(self, rows):
+        build = self.build
+        return [build(row) for row in rows]
+
+
+class _Compiler:
+    def __init__(self):
+        self.lookups = []
+        self.namespace = {}
+
+    def column(self, lookup):
+        if lookup not in self.lookups:
+            self.lookups.append(lookup)
+        return f'row[{self.lookups.index(lookup)}]'
+
+    def converter(self, field):
+        if isinstance(field, serializers.JSONField) and field.binary:
+            return None
+        if isinstance(field, IDENTITY_FIELDS):
+            return ''
+        name = f'convert_{len(self.namespace)}'
+        self.namespace[name] = _iso_datetime_converter(field) or field.to_representation
+        return name
+
+    def value(self, field, lookup):
+        column = self.column(lookup)
+        converter = self.converter(field)
+        if converter is None:
+            raise NotCompilable(lookup)
+        if not converter:
+            return column
+        return f'(None if {column} is None else {converter}({column}))'
+
+    def serializer(self, serializer, model, prefix=''):
+        expandable = {}
+        if hasattr(serializer, 'get_expandable_fields'):
+            expandable = serializer.get_expandable_fields()
+
+        items = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            source = field.source
+            if isinstance(field, serializers.SerializerMethodField):
+                spec = expandable.get(name)
+                if spec is None or spec[1] is None:
+                    raise NotCompilable(name)
+                relation, columns = spec
+                related_model = model._meta.get_field(relation).related_model
+                if not all(_is_column(related_model, column) for column in columns):
+                    raise NotCompilable(name)
+                nested = ', '.join(
+                    f'{column!r}: {self.column(f"{prefix}{relation}__{column}")}' for column in columns
+                )
+                expression = f'(None if {self.column(prefix + relation)} is None else {{{nested}}})'
+            elif isinstance(field, serializers.ModelSerializer):
+                related_model = model._meta.get_field(source).related_model
+                nested = self.serializer(field, related_model, f'{prefix}{source}__')
+                expression = f'(None if {self.column(prefix + source)} is None else {nested})'
+            elif isinstance(field, serializers.BaseSerializer) or not _is_column(model, source):
+                raise NotCompilable(name)
+            else:
+                expression = self.value(field, prefix + source)
+            items.append(f'{name!r}: {expression}')
+        return '{' + ', '.join(items) + '}'
+
+
+def _iso_datetime_converter(field):
+    """
+    Inlined DateTimeField.to_representation for aware datetimes in ISO 8601,
+    the common case, which skips DRF's per-value format and timezone lookups.
+    """
+    if type(field) is not serializers.DateTimeField or not settings.USE_TZ:
+        return None
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return None
+    if getattr(field, 'timezone', None) is not None:
+        return None
+    fallback = field.to_representation
+    get_current_timezone = timezone.get_current_timezone
+
+    def convert(value):
+        if not value or isinstance(value, str) or value.tzinfo is None:
+            return fallback(value)
+        value = value.astimezone(get_current_timezone()).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _is_column(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return field.concrete and not field.many_to_many
+
+
+def compile_reader(serializer):
+    """Compiled reader for a serializer instance, or None if it has unsupported fields"""
+    # ``fields`` only holds declared fields (sparse fieldsets drop the others,
+    # unknown names included) in declared order, so each class has a bounded
+    # number of keys; the cache is capped anyway, since clients pick them
+    key = (type(serializer), tuple(serializer.fields))
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    compiler = _Compiler()
+    try:
+        body = compiler.serializer(serializer, serializer.Meta.model)
+    except (NotCompilable, FieldDoesNotExist):
+        reader = None
+    else:
+        source = f'def build(row):\n    return {body}\n'
+        exec(compile(source, f'<values reader {type(serializer).__name__}>', 'exec'), compiler.namespace)
+        reader = ValuesReader(compiler.lookups, compiler.namespace['build'], source)
+    with _cache_lock:
+        _cache[key] = reader
+        while len(_cache) > getattr(settings, 'VALUES_READER_CACHE_SIZE', 256):
+            _cache.popitem(last=False)
+    return reader
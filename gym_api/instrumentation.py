@@ -0,0 +1,53 @@
+"""
+Shared helpers for request instrumentation (metrics, slow query log, timings)
+"""
+import time
+
+
+class QueryTimer:
+    """Database execute wrapper that counts queries and sums their duration"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def view_label(request, view_func=None):
+    """
+    Stable, low-cardinality label for the view handling a request.
+
+    Router viewsets are labelled ``<model>-<action>`` (e.g. ``workouttask-list``),
+    everything else falls back to the URL name (e.g. ``login``).
+    """
+    if view_func is not None:
+        actions = getattr(view_func, 'actions', None)
+        cls = getattr(view_func, 'cls', None)
+        if actions and cls is not None:
+            action = actions.get(request.method.lower(), request.method.lower())
+            queryset = getattr(cls, 'queryset', None)
+            if queryset is not None:
+                prefix = queryset.model._meta.model_name
+            else:
+                prefix = cls.__name__.lower()
+            return f'{prefix}-{action}'
+
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.url_name or match.view_name or 'unnamed'
+
+
+def user_role(request):
+    """Role of the authenticated user, or ``anonymous``"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    return getattr(user, 'role', None) or 'unknown'
@@ -0,0 +1,162 @@
+"""
+Per-branch completion leaderboard.
+
+``LeaderboardEntry`` keeps one counter per (branch, member, week or month).
+When a task moves into ``completed`` the counters of the periods containing
+its ``completed_at`` go up by one; when it moves out of ``completed`` (or a
+completed task is deleted) those counters go back down. A task that changes
+branch, on its own or with its plan, takes its completion along. Periods are local
+(``TIME_ZONE``) weeks starting on Monday and calendar months.
+
+Reads never touch tasks: the top of a period is an index range scan in
+score order, and a member's rank is one plus the number of entries of the
+period with a higher count (ties share a rank).
+"""
+from datetime import timedelta
+from itertools import chain
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import ArchivedWorkoutTask, LeaderboardEntry, WorkoutTask
+
+PERIODS = ('week', 'month')
+
+
+def period_start(day, period):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _bump(key, amount):
+    if LeaderboardEntry.objects.filter(**key).update(completed=Greatest(F('completed') + amount, 0)):
+        return
+    if amount < 0:
+        # completed before any counter existed (e.g. before a rebuild)
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardEntry.objects.create(completed=amount, **key)
+    except IntegrityError:
+        # a concurrent completion created the counter first
+        LeaderboardEntry.objects.filter(**key).update(completed=F('completed') + amount)
+
+
+def _keys(branch_id, member_id, moment):
+    day = timezone.localtime(moment).date()
+    for period in PERIODS:
+        yield {
+            'gym_branch_id': branch_id,
+            'member_id': member_id,
+            'period': period,
+            'period_start': period_start(day, period),
+        }
+
+
+def _add(branch_id, member_id, moment, amount):
+    for key in _keys(branch_id, member_id, moment):
+        _bump(key, amount)
+
+
+def record_completion(task, previous_completed_at, previous_branch_id=None):
+    """
+    Move the counters after ``task.completed_at`` changed from
+    ``previous_completed_at`` or its branch from ``previous_branch_id``
+    """
+    if previous_branch_id is None:
+        previous_branch_id = task.gym_branch_id
+    if task.completed_at == previous_completed_at and task.gym_branch_id == previous_branch_id:
+        return
+    if previous_completed_at is not None and previous_branch_id is not None:
+        _add(previous_branch_id, task.member_id, previous_completed_at, -1)
+    if task.completed_at is not None and task.gym_branch_id is not None:
+        _add(task.gym_branch_id, task.member_id, task.completed_at, 1)
+
+
+def move_branch(rows, branch_id):
+    """
+    Move the completions of ``rows`` (``(gym_branch_id, member_id,
+    completed_at)`` of completed tasks) to ``branch_id``, for tasks whose
+    branch is changed with a bulk update
+    """
+    counts = {}
+    for old_branch_id, member_id, completed_at in rows:
+        if old_branch_id == branch_id or old_branch_id is None:
+            continue
+        for key in _keys(old_branch_id, member_id, completed_at):
+            key = tuple(key.items())
+            counts[key] = counts.get(key, 0) + 1
+    for key, count in counts.items():
+        key = dict(key)
+        _bump(key, -count)
+        _bump({**key, 'gym_branch_id': branch_id}, count)
+
+
+def record_deletion(task):
+    if task.gym_branch_id is not None and task.completed_at is not None:
+        _add(task.gym_branch_id, task.member_id, task.completed_at, -1)
+
+
+def _entries(branch_id, period, start):
+    return LeaderboardEntry.objects.filter(
+        gym_branch_id=branch_id, period=period, period_start=start, completed__gt=0
+    )
+
+
+def top(branch_id, period, start, limit):
+    """``[(rank, entry), ...]`` of the best ``limit`` members, highest count first"""
+    entries = _entries(branch_id, period, start).select_related('member').order_by('-completed', 'member_id')[:limit]
+    ranked = []
+    for position, entry in enumerate(entries, start=1):
+        if ranked and ranked[-1][1].completed == entry.completed:
+            ranked.append((ranked[-1][0], entry))
+        else:
+            ranked.append((position, entry))
+    return ranked
+
+
+def rank_of(branch_id, member_id, period, start):
+    """``(rank, completed)`` of one member; rank is None without completions"""
+    entries = _entries(branch_id, period, start)
+    completed = entries.filter(member_id=member_id).values_list('completed', flat=True).first()
+    if completed is None:
+        return None, 0
+    return entries.filter(completed__gt=completed).count() + 1, completed
+
+
+def rebuild(since=None):
+    """Recount all counters (or those of periods from ``since`` on) from live and archived tasks"""
+    sources = [
+        model.objects.filter(completed_at__isnull=False, gym_branch__isnull=False)
+        for model in (WorkoutTask, ArchivedWorkoutTask)
+    ]
+    entries = LeaderboardEntry.objects.all()
+    first = None
+    if since is not None:
+        # whole periods, so counters are replaced rather than half recounted
+        first = min(period_start(since, period) for period in PERIODS)
+        sources = [tasks.filter(completed_at__date__gte=first) for tasks in sources]
+        entries = entries.filter(period_start__gte=first)
+    counts = {}
+    rows = chain.from_iterable(tasks.values('gym_branch_id', 'member_id', 'completed_at').iterator() for tasks in sources)
+    for row in rows:
+        day = timezone.localtime(row['completed_at']).date()
+        for period in PERIODS:
+            start = period_start(day, period)
+            if first is not None and start < first:
+                continue
+            key = (row['gym_branch_id'], row['member_id'], period, start)
+            counts[key] = counts.get(key, 0) + 1
+    with transaction.atomic():
+        entries.delete()
+        LeaderboardEntry.objects.bulk_create(
+            (
+                LeaderboardEntry(gym_branch_id=branch, member_id=member, period=period, period_start=start, completed=count)
+                for (branch, member, period, start), count in counts.items()
+            ),
+            batch_size=1000,
+        )
+    return len(counts)
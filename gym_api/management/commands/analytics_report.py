@@ -0,0 +1,54 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gym_api.analytics import adherence, latest_snapshot, load_snapshot
+
+
+def quarter_range(value):
+    """``'2024Q1'`` -> ``(date(2024, 1, 1), date(2024, 4, 1))``"""
+    year, _, quarter = value.upper().partition('Q')
+    year, quarter = int(year), int(quarter)
+    if not 1 <= quarter <= 4:
+        raise ValueError(value)
+    start = date(year, 3 * quarter - 2, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+    return start, end
+
+
+class Command(BaseCommand):
+    help = 'Task adherence by member cohort, trainer or plan, computed from an analytics snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', choices=['cohort', 'trainer', 'plan'], default='cohort')
+        parser.add_argument('--quarter', help='Tasks due in this quarter, e.g. 2024Q1')
+        parser.add_argument('--start', type=date.fromisoformat, help='First due date (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Day after the last due date (YYYY-MM-DD)')
+        parser.add_argument('--gym-branch', type=int, help='Only tasks of this branch')
+        parser.add_argument('--snapshot', help='Snapshot directory (default: the latest one)')
+
+    def handle(self, *args, **options):
+        if options['quarter']:
+            try:
+                start, end = quarter_range(options['quarter'])
+            except ValueError:
+                raise CommandError('--quarter must look like 2024Q1')
+        elif options['start'] and options['end']:
+            start, end = options['start'], options['end']
+        else:
+            raise CommandError('Pass --quarter or both --start and --end')
+
+        path = options['snapshot'] or latest_snapshot()
+        if path is None:
+            raise CommandError('No snapshot found, run snapshot_analytics first')
+        snapshot = load_snapshot(path)
+        rows = adherence(snapshot, options['by'], start, end, options['gym_branch'])
+        report = {
+            'snapshot': snapshot.manifest['taken_at'],
+            'by': options['by'],
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'rows': rows,
+        }
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gym_api.archive import archive_completed
+
+
+class Command(BaseCommand):
+    help = 'Move tasks completed more than TASK_ARCHIVE_AFTER_DAYS days ago to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override the age (days since completion) to archive at')
+        parser.add_argument('--batch-size', type=int, help='Rows moved per transaction')
+
+    def handle(self, *args, **options):
+        older_than = None
+        if options['days'] is not None:
+            older_than = timezone.now() - timedelta(days=options['days'])
+        moved = archive_completed(older_than, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} completed tasks'))
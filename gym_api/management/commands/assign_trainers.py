@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from gym_api.assignments import assign_members
+from gym_api.models import GymBranch
+
+
+class Command(BaseCommand):
+    help = "Assign members without a trainer to their branch's least loaded trainers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gym-branch', type=int, help='Only this branch (default: all active branches)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        branches = GymBranch.objects.filter(is_active=True).order_by('id')
+        if options['gym_branch'] is not None:
+            branches = GymBranch.objects.filter(pk=options['gym_branch'])
+        total = 0
+        for branch_id in branches.values_list('id', flat=True):
+            loads, assigned = assign_members(branch_id, batch_size=options['batch_size'])
+            total += assigned
+            if assigned:
+                self.stdout.write(f'Branch {branch_id}: {assigned} members, trainer loads {loads}')
+        self.stdout.write(self.style.SUCCESS(f'Assigned {total} members'))
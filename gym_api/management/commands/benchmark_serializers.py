@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from gym_api.fast_serializers import compile_reader
+from gym_api.models import User, GymBranch, WorkoutPlan, WorkoutTask, ActivityLog
+from gym_api.serializers import WorkoutTaskSerializer, UserSerializer, ActivityLogSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF serializers with the compiled values_list() reader (rows per second)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Rows generated per table')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._create_data(options['rows'])
+                self._run(options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _create_data(self, rows):
+        self.stdout.write(f'Generating {rows} rows per table (rolled back afterwards)...')
+        branch = GymBranch.objects.create(name='Benchmark Gym', location='Nowhere')
+        trainer = User.objects.create(
+            email='bench-trainer@example.com', username='bench-trainer',
+            role='trainer', gym_branch=branch
+        )
+        members = User.objects.bulk_create([
+            User(email=f'bench-{i}@example.com', username=f'bench-{i}', first_name='Bench',
+                 last_name=str(i), role='member', gym_branch=branch)
+            for i in range(rows)
+        ])
+        plan = WorkoutPlan.objects.create(
+            title='Benchmark plan', description='x' * 500, created_by=trainer, gym_branch=branch
+        )
+        due = timezone.now()
+        WorkoutTask.objects.bulk_create([
+            WorkoutTask(workout_plan=plan, member=member, created_by=trainer, gym_branch=branch, due_date=due)
+            for member in members
+        ])
+        ActivityLog.objects.bulk_create([
+            ActivityLog(user=member, action='login', model_name='User', object_id=str(member.id))
+            for member in members
+        ])
+
+    def _run(self, repeat):
+        cases = [
+            ('WorkoutTask', WorkoutTaskSerializer,
+             WorkoutTask.objects.select_related('member', 'created_by', 'workout_plan')),
+            ('User', UserSerializer, User.objects.all()),
+            ('ActivityLog', ActivityLogSerializer, ActivityLog.objects.all()),
+        ]
+        for label, serializer_class, queryset in cases:
+            reader = compile_reader(serializer_class())
+            drf = self._best(repeat, lambda: serializer_class(queryset.all(), many=True).data)
+            fast = self._best(repeat, lambda: reader.build_many(reader.prepare(queryset.all())))
+            self.stdout.write(
+                f'{label:<12} serializer {drf:>10,.0f} rows/s   '
+                f'values reader {fast:>10,.0f} rows/s   ({fast / drf:.1f}x)'
+            )
+
+    def _best(self, repeat, func):
+        best = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(func())
+            best = max(best, rows / (time.perf_counter() - start))
+        return best
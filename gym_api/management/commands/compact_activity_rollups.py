@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gym_api.rollups import compact
+
+
+class Command(BaseCommand):
+    help = 'Fold hourly activity rollups older than ACTIVITY_ROLLUP_HOURLY_DAYS into daily ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override how many days of hourly rollups are kept')
+
+    def handle(self, *args, **options):
+        before = None
+        if options['days'] is not None:
+            before = timezone.now() - timedelta(days=options['days'])
+        folded = compact(before)
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} hourly rollups into daily ones'))
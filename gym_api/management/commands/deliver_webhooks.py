@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from gym_api.webhooks import deliver, purge
+
+
+class Command(BaseCommand):
+    help = 'Deliver due webhook events, batched per endpoint, and purge old finished deliveries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Events per request (default WEBHOOK_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        totals = deliver(batch_size=options['batch_size'])
+        purged = purge()
+        self.stdout.write(self.style.SUCCESS(
+            f"Webhooks: {totals['delivered']} delivered, {totals['undelivered']} undelivered "
+            f"in {totals['batches']} requests, {purged} old deliveries purged"
+        ))
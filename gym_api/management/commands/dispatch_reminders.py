@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from gym_api.reminders import dispatch
+
+
+class Command(BaseCommand):
+    help = 'Send due reminders from the outbox until it is drained (safe to run several at once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Reminders claimed per transaction')
+        parser.add_argument('--rate', type=float, help='Override REMINDER_MAX_PER_SECOND')
+
+    def handle(self, *args, **options):
+        totals = dispatch(batch_size=options['batch_size'], max_per_second=options['rate'])
+        summary = ', '.join(f'{count} {outcome}' for outcome, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f'Reminders: {summary}'))
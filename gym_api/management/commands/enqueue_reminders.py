@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gym_api.reminders import enqueue, purge
+
+
+class Command(BaseCommand):
+    help = 'Queue reminders for open tasks due within REMINDER_LEAD_HOURS and purge old finished ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Tasks scanned per query')
+
+    def handle(self, *args, **options):
+        scanned = enqueue(batch_size=options['batch_size'])
+        purged = purge(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Scanned {scanned} upcoming tasks, purged {purged} old reminders'))
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gym_api.leaderboard import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recount the leaderboard counters from the completed tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only recount the periods from this date (YYYY-MM-DD) on')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+        counters = rebuild(since)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {counters} leaderboard counters'))
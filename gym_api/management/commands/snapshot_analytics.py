@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gym_api.analytics import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write a columnar snapshot of users, workout plans and workout tasks for analytics reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write the snapshot below (default ANALYTICS_SNAPSHOT_DIR)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        path = write_snapshot(options['output'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Snapshot written to {path}'))
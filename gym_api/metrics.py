@@ -0,0 +1,213 @@
+"""
+Request metrics in Prometheus text format.
+
+Every worker process accumulates samples in memory and dumps them to its own
+file in ``METRICS_DIR`` at most once per ``METRICS_FLUSH_INTERVAL`` seconds.
+The ``/metrics`` view merges the files of all workers, so the numbers are
+correct when gunicorn runs several processes.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'gym_http_requests_total': (
+        'counter', 'Total HTTP requests by action, role and status code.', None
+    ),
+    'gym_http_request_duration_seconds': (
+        'histogram', 'Request latency in seconds.', LATENCY_BUCKETS
+    ),
+    'gym_http_response_size_bytes': (
+        'histogram', 'Response body size in bytes.', SIZE_BUCKETS
+    ),
+    'gym_db_queries_per_request': (
+        'histogram', 'Number of SQL queries executed per request.', QUERY_COUNT_BUCKETS
+    ),
+    'gym_db_query_seconds_total': (
+        'counter', 'Total time spent executing SQL queries.', None
+    ),
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def get_metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+class Registry:
+    """In-process metric store, flushed periodically to a per-process file"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._pid = None
+        self._last_flush = 0.0
+
+    def _check_fork(self):
+        # gunicorn forks after import: drop samples inherited from the master
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._samples = {}
+            self._last_flush = 0.0
+
+    def inc(self, name, labels, amount=1.0):
+        key = (name, labels)
+        with self._lock:
+            self._check_fork()
+            self._samples[key] = self._samples.get(key, 0.0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, labels)
+        with self._lock:
+            self._check_fork()
+            sample = self._samples.get(key)
+            if sample is None:
+                # one slot per bucket, one for +Inf, then sum and count
+                sample = self._samples[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            sample[bisect.bisect_left(buckets, value)] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                key: list(value) if isinstance(value, list) else value
+                for key, value in self._samples.items()
+            }
+
+    def maybe_flush(self, force=False):
+        metrics_dir = get_metrics_dir()
+        if not metrics_dir:
+            return
+        now = time.monotonic()
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+        if not force and now - self._last_flush < interval:
+            return
+        self._last_flush = now
+
+        rows = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(metrics_dir, f'metrics_{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(rows, fh)
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._samples = {}
+            self._last_flush = 0.0
+
+
+registry = Registry()
+
+
+def record_request(action, role, status, duration, size, query_count, query_time):
+    """Record the metrics of a single finished request"""
+    labels = (('action', action), ('role', role))
+    registry.inc('gym_http_requests_total', labels + (('status', str(status)),))
+    registry.observe('gym_http_request_duration_seconds', labels, duration)
+    if size is not None:
+        registry.observe('gym_http_response_size_bytes', labels, size)
+    registry.observe('gym_db_queries_per_request', labels, query_count)
+    registry.inc('gym_db_query_seconds_total', labels, query_time)
+    registry.maybe_flush()
+
+
+def _merge(target, name, labels, value):
+    key = (name, labels)
+    current = target.get(key)
+    if current is None:
+        target[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(current, list):
+        target[key] = [a + b for a, b in zip(current, value)]
+    else:
+        target[key] = current + value
+
+
+def collect():
+    """Merge samples from all worker files (and this process) into one dict"""
+    merged = {}
+    metrics_dir = get_metrics_dir()
+    if not metrics_dir:
+        for (name, labels), value in registry.snapshot().items():
+            _merge(merged, name, labels, value)
+        return merged
+
+    registry.maybe_flush(force=True)
+    for filename in os.listdir(metrics_dir):
+        if not (filename.startswith('metrics_') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, filename)) as fh:
+                rows = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in rows:
+            if name in METRICS:
+                _merge(merged, name, tuple(tuple(pair) for pair in labels), value)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(samples):
+    """Render merged samples in the Prometheus text exposition format"""
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        series = sorted((labels, value) for (n, labels), value in samples.items() if n == name)
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in series:
+            if metric_type == 'histogram':
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value[:-2]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(float(bound))
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(float(value[-2]))}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(float(value))}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, hidden until ``METRICS_AUTH_TOKEN`` is set"""
+    token = getattr(settings, 'METRICS_AUTH_TOKEN', '')
+    if not token:
+        return HttpResponse('Not Found\n', status=404, content_type='text/plain')
+    if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,115 @@
+import time
+
+from django.db import connection
+
+from django.conf import settings
+
+from . import compression, metrics, profiling, timing
+from .instrumentation import QueryTimer, view_label, user_role
+from .slow_queries import SlowQueryRecorder
+
+
+class MetricsMiddleware:
+    """Record latency, SQL and response size metrics for every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = request._query_timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        size = None if response.streaming else len(response.content)
+        metrics.record_request(
+            action=getattr(request, '_view_label', None) or view_label(request),
+            role=user_role(request),
+            status=response.status_code,
+            duration=duration,
+            size=size,
+            query_count=timer.count,
+            query_time=timer.duration,
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_label = view_label(request, view_func)
+
+
+class SlowQueryMiddleware:
+    """Sample slow SQL statements and record them with their EXPLAIN plan"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        recorder.flush(view=getattr(request, '_view_label', None) or view_label(request))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, '_view_label'):
+            request._view_label = view_label(request, view_func)
+
+
+class ProfilingMiddleware:
+    """Profile single requests on demand (super admins only, see profiling.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.is_requested(request):
+            return self.get_response(request)
+        user = profiling.get_super_admin(request)
+        if user is None:
+            return self.get_response(request)
+        return profiling.profile_request(self.get_response, request, user)
+
+
+class ServerTimingMiddleware:
+    """Emit a Server-Timing header with auth, permission, DB, serializer and render phases"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SERVER_TIMING_ENABLED', True):
+            return self.get_response(request)
+
+        # reuse the query timer of MetricsMiddleware when it runs first
+        shared_timer = getattr(request, '_query_timer', None)
+        timer = QueryTimer()
+        timings, token = timing.begin()
+        start = time.perf_counter()
+        try:
+            if shared_timer is None:
+                with connection.execute_wrapper(timer):
+                    response = self.get_response(request)
+            else:
+                count, duration = shared_timer.count, shared_timer.duration
+                response = self.get_response(request)
+                timer.count = shared_timer.count - count
+                timer.duration = shared_timer.duration - duration
+        finally:
+            timing.end(token)
+
+        timings.query_count = timer.count
+        timings.add('db', timer.duration)
+        timings.add('total', time.perf_counter() - start)
+        response['Server-Timing'] = timings.header()
+        return response
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts (see compression.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return compression.compress_response(request, self.get_response(request))
@@ -0,0 +1,66 @@
+"""Migration operations and data backfill helpers for live tables"""
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+class AddIndexOnline(migrations.AddIndex):
+    """
+    ``AddIndex`` that uses ``CREATE INDEX CONCURRENTLY`` on PostgreSQL, so
+    writes are not blocked while the index builds. The migration must set
+    ``atomic = False``.
+    """
+
+    def _concurrently(self, schema_editor):
+        return {'concurrently': True} if schema_editor.connection.vendor == 'postgresql' else {}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, **self._concurrently(schema_editor))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, **self._concurrently(schema_editor))
+
+
+class SetNotNullOnline(migrations.AlterField):
+    """
+    ``AlterField`` to a non-null ``field``. On PostgreSQL the column is first
+    checked by a ``NOT VALID`` constraint validated without blocking writes,
+    so ``SET NOT NULL`` (PostgreSQL 12+) skips its own scan under the
+    exclusive lock. The migration must set ``atomic = False``.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        quote = schema_editor.quote_name
+        table = quote(model._meta.db_table)
+        column = quote(model._meta.get_field(self.name).column)
+        check = quote(f'{model._meta.db_table[:20]}_{self.name[:5]}_nn')
+        schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID')
+        schema_editor.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {check}')
+        schema_editor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL')
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {check}')
+
+
+def backfill_in_batches(queryset, apply, batch_size=BATCH_SIZE):
+    """
+    Call ``apply(ids)`` for the ids of ``queryset``, ``batch_size`` at a time
+    in id order, each batch in its own transaction. In a migration with
+    ``atomic = False`` the backfill then holds row locks for one batch only,
+    instead of locking the whole table against the running app until it ends.
+    """
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            apply(ids)
+        last_id = ids[-1]
@@ -0,0 +1,54 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0002_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('branch_id', models.BigIntegerField(blank=True, null=True)),
+                ('owner_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Tombstone',
+                'verbose_name_plural': 'Tombstones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model_name', 'branch_id', 'deleted_at'], name='gym_api_tom_branch_del_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model_name', 'owner_id', 'deleted_at'], name='gym_api_tom_owner_del_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at'], name='gym_api_tom_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['gym_branch', 'updated_at'], name='gym_api_use_branch_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutplan',
+            index=models.Index(fields=['gym_branch', 'updated_at'], name='gym_api_wor_branch_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workouttask',
+            index=models.Index(fields=['member', 'updated_at'], name='gym_api_wor_member_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workouttask',
+            index=models.Index(fields=['updated_at'], name='gym_api_wor_updated_idx'),
+        ),
+    ]
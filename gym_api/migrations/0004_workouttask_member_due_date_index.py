@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0003_tombstone_sync_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workouttask',
+            index=models.Index(fields=['member', 'due_date'], name='gym_api_wor_member_due_idx'),
+        ),
+    ]
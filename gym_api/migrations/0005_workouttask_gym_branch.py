@@ -0,0 +1,17 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0004_workouttask_member_due_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workouttask',
+            name='gym_branch',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='workout_tasks', to='gym_api.gymbranch'),
+        ),
+    ]
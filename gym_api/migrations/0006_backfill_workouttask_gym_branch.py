@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+from gym_api.migration_operations import backfill_in_batches
+
+
+def backfill_gym_branch(apps, schema_editor):
+    """Copy the plan's branch onto existing tasks in short, separately committed batches"""
+    WorkoutTask = apps.get_model('gym_api', 'WorkoutTask')
+    WorkoutPlan = apps.get_model('gym_api', 'WorkoutPlan')
+    plan_branch = WorkoutPlan.objects.filter(pk=OuterRef('workout_plan_id')).values('gym_branch_id')[:1]
+
+    backfill_in_batches(
+        WorkoutTask.objects.filter(gym_branch__isnull=True),
+        lambda ids: WorkoutTask.objects.filter(id__in=ids).update(gym_branch_id=Subquery(plan_branch)),
+    )
+
+
+class Migration(migrations.Migration):
+    # tasks keep being written while their branch is copied
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0005_workouttask_gym_branch'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_gym_branch, migrations.RunPython.noop),
+    ]
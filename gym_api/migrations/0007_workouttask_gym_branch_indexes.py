@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+from gym_api.migration_operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0006_backfill_workouttask_gym_branch'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='workouttask',
+            index=models.Index(fields=['gym_branch', 'created_at'], name='gym_api_wor_branch_cre_idx'),
+        ),
+        AddIndexOnline(
+            model_name='workouttask',
+            index=models.Index(fields=['gym_branch', 'due_date'], name='gym_api_wor_branch_due_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from datetime import timezone
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_rollups(apps, schema_editor):
+    """Count the existing activity log into hourly rollups"""
+    ActivityLog = apps.get_model('gym_api', 'ActivityLog')
+    ActivityRollup = apps.get_model('gym_api', 'ActivityRollup')
+    totals = (
+        ActivityLog.objects.annotate(hour=TruncHour('created_at', tzinfo=timezone.utc))
+        .values('hour', 'user__gym_branch_id', 'action', 'model_name')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    ActivityRollup.objects.bulk_create(
+        (
+            ActivityRollup(
+                granularity='hour',
+                bucket=total['hour'],
+                branch_id=total['user__gym_branch_id'] or 0,
+                action=total['action'],
+                model_name=total['model_name'],
+                count=total['total'],
+            )
+            for total in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0007_workouttask_gym_branch_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('branch_id', models.BigIntegerField(default=0)),
+                ('action', models.CharField(max_length=20)),
+                ('model_name', models.CharField(max_length=100)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Activity Rollup',
+                'verbose_name_plural': 'Activity Rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activityrollup',
+            constraint=models.UniqueConstraint(
+                fields=('granularity', 'bucket', 'branch_id', 'action', 'model_name'),
+                name='gym_api_activity_rollup_key',
+            ),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0008_activityrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', models.PositiveSmallIntegerField()),
+                ('time_of_day', models.TimeField()),
+                ('timezone', models.CharField(max_length=64)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(limit_choices_to={'role': 'trainer'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_recurring_tasks', to=settings.AUTH_USER_MODEL)),
+                ('gym_branch', models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_tasks', to='gym_api.gymbranch')),
+                ('member', models.ForeignKey(limit_choices_to={'role': 'member'}, on_delete=django.db.models.deletion.CASCADE, related_name='recurring_tasks', to=settings.AUTH_USER_MODEL)),
+                ('workout_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_tasks', to='gym_api.workoutplan')),
+            ],
+            options={
+                'verbose_name': 'Recurring Task',
+                'verbose_name_plural': 'Recurring Tasks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recurringtask',
+            index=models.Index(fields=['gym_branch', 'end_date'], name='gym_api_rec_branch_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringtask',
+            index=models.Index(fields=['member', 'end_date'], name='gym_api_rec_member_end_idx'),
+        ),
+        migrations.AddField(
+            model_name='workouttask',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='gym_api.recurringtask'),
+        ),
+        migrations.AddField(
+            model_name='workouttask',
+            name='occurrence_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='workouttask',
+            constraint=models.UniqueConstraint(fields=('recurrence', 'occurrence_date'), name='gym_api_task_occurrence_key'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from gym_api.migration_operations import backfill_in_batches
+from gym_api.search import search_keys
+
+
+def backfill_search_keys(apps, schema_editor):
+    """Fill the normalized search columns in short, separately committed batches"""
+    User = apps.get_model('gym_api', 'User')
+
+    def fill(ids):
+        users = list(User.objects.filter(id__in=ids).only('id', 'email', 'first_name', 'last_name'))
+        for user in users:
+            for field, value in search_keys(user.email, user.first_name, user.last_name).items():
+                setattr(user, field, value)
+        User.objects.bulk_update(users, ['search_email', 'search_name', 'search_last'])
+
+    backfill_in_batches(User.objects.all(), fill)
+
+
+class Migration(migrations.Migration):
+    # logins update users (last_login) throughout the backfill
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0010_user_search_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_keys, migrations.RunPython.noop),
+    ]
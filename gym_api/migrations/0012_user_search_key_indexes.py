@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+from gym_api.migration_operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0011_backfill_user_search_keys'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='user',
+            index=models.Index(
+                fields=['gym_branch', 'search_email'], name='gym_api_use_branch_email_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+        ),
+        AddIndexOnline(
+            model_name='user',
+            index=models.Index(
+                fields=['gym_branch', 'search_name'], name='gym_api_use_branch_name_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+        ),
+        AddIndexOnline(
+            model_name='user',
+            index=models.Index(
+                fields=['gym_branch', 'search_last'], name='gym_api_use_branch_last_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import F
+from django.utils import timezone
+
+from gym_api.migration_operations import BATCH_SIZE, backfill_in_batches
+
+
+def backfill_leaderboard(apps, schema_editor):
+    """
+    Use ``updated_at`` as the completion time of already completed tasks, in
+    short batches, then count them into the leaderboard.
+    """
+    WorkoutTask = apps.get_model('gym_api', 'WorkoutTask')
+    LeaderboardEntry = apps.get_model('gym_api', 'LeaderboardEntry')
+
+    backfill_in_batches(
+        WorkoutTask.objects.filter(status='completed', completed_at__isnull=True),
+        lambda ids: WorkoutTask.objects.filter(id__in=ids).update(completed_at=F('updated_at')),
+    )
+
+    counts = {}
+    rows = (
+        WorkoutTask.objects.filter(completed_at__isnull=False, gym_branch__isnull=False)
+        .values_list('gym_branch_id', 'member_id', 'completed_at').iterator()
+    )
+    for branch_id, member_id, completed_at in rows:
+        day = timezone.localtime(completed_at).date()
+        for key in (
+            (branch_id, member_id, 'week', day - timedelta(days=day.weekday())),
+            (branch_id, member_id, 'month', day.replace(day=1)),
+        ):
+            counts[key] = counts.get(key, 0) + 1
+    LeaderboardEntry.objects.bulk_create(
+        (
+            LeaderboardEntry(gym_branch_id=branch, member_id=member, period=period, period_start=start, completed=count)
+            for (branch, member, period, start), count in counts.items()
+        ),
+        batch_size=BATCH_SIZE,
+        # completions recorded by the running app meanwhile created some of
+        # these rows already; the full count from the tasks replaces theirs
+        update_conflicts=True,
+        unique_fields=['gym_branch', 'period', 'period_start', 'member'],
+        update_fields=['completed'],
+    )
+
+
+class Migration(migrations.Migration):
+    # tasks are completed while completed_at is filled in
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0013_leaderboard'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0014_backfill_leaderboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedWorkoutTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed')], max_length=20)),
+                ('due_date', models.DateTimeField()),
+                ('recurrence_id', models.BigIntegerField(blank=True, null=True)),
+                ('occurrence_date', models.DateField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_workout_tasks', to=settings.AUTH_USER_MODEL)),
+                ('gym_branch', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='gym_api.gymbranch')),
+                ('member', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to=settings.AUTH_USER_MODEL)),
+                ('workout_plan', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to='gym_api.workoutplan')),
+            ],
+            options={
+                'verbose_name': 'Archived Workout Task',
+                'verbose_name_plural': 'Archived Workout Tasks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedworkouttask',
+            index=models.Index(fields=['member', 'completed_at'], name='gym_api_arc_member_com_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedworkouttask',
+            index=models.Index(fields=['gym_branch', 'completed_at'], name='gym_api_arc_branch_com_idx'),
+        ),
+    ]
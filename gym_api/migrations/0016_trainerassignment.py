@@ -0,0 +1,32 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0015_archivedworkouttask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainerAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('gym_branch', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='trainer_assignments', to='gym_api.gymbranch')),
+                ('member', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trainer_assignment', to=settings.AUTH_USER_MODEL)),
+                ('trainer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assigned_members', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trainer Assignment',
+                'verbose_name_plural': 'Trainer Assignments',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trainerassignment',
+            index=models.Index(fields=['gym_branch', 'trainer'], name='gym_api_tra_branch_tra_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0018_webhooks'),
+    ]
+
+    operations = [
+        # constant defaults: no table rewrite on PostgreSQL 11+
+        migrations.AddField(
+            model_name='workoutplan',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workouttask',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
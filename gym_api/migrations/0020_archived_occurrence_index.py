@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gym_api', '0019_versions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedworkouttask',
+            index=models.Index(
+                condition=models.Q(recurrence_id__isnull=False),
+                fields=['recurrence_id', 'occurrence_date'],
+                name='gym_api_arc_occurrence_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from gym_api.migration_operations import SetNotNullOnline
+
+# rows written without save() since 0006 (bulk_create, queryset updates)
+backfill_gym_branch = import_module('gym_api.migrations.0006_backfill_workouttask_gym_branch').backfill_gym_branch
+
+
+class Migration(migrations.Migration):
+    # batches commit on their own, and the check is validated outside the lock
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0020_archived_occurrence_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_gym_branch, migrations.RunPython.noop),
+        SetNotNullOnline(
+            model_name='workouttask',
+            name='gym_branch',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='workout_tasks', to='gym_api.gymbranch'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+from gym_api.migration_operations import AddIndexOnline
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('gym_api', '0021_workouttask_gym_branch_not_null'),
+    ]
+
+    operations = [
+        AddIndexOnline(
+            model_name='workouttask',
+            index=models.Index(fields=['gym_branch', 'updated_at'], name='gym_api_task_branch_upd_idx'),
+        ),
+    ]
@@ -0,0 +1,283 @@
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .fast_serializers import compile_reader
+from .models import VersionConflict
+from .serializers import parse_field_list
+from .sync import ExpiredCursor, InvalidCursor, SyncCursor, read_changes
+from .timing import phase
+
+
+def get_read_serializer(view):
+    """Serializer without data for the current request, built once per request"""
+    serializer = getattr(view, '_read_serializer', None)
+    if serializer is None:
+        serializer = view._read_serializer = view.get_serializer()
+    return serializer
+
+
+class ServerTimingMixin:
+    """
+    Time permission checks, queryset evaluation and serialization of a viewset.
+
+    ``list`` and ``retrieve`` go through ``serialize()`` so the serializer
+    ``.data`` phase can be measured (and specialised by other mixins).
+    """
+
+    def check_permissions(self, request):
+        with phase('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with phase('perm'):
+            super().check_object_permissions(request, obj)
+
+    def paginate_queryset(self, queryset):
+        with phase('qs'):
+            return super().paginate_queryset(queryset)
+
+    def get_object(self):
+        with phase('qs'):
+            return super().get_object()
+
+    def serialize(self, instance, many=False):
+        serializer = self.get_serializer(instance, many=many)
+        with phase('serialize'):
+            return serializer.data
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize(page, many=True))
+        with phase('qs'):
+            queryset = list(queryset)
+        return Response(self.serialize(queryset, many=True))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize(self.get_object()))
+
+
+def _concrete_field(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.concrete and not field.many_to_many else None
+
+
+def optimize_queryset(queryset, serializer, restrict_columns):
+    """
+    Join the relations of expanded nested fields and, if ``restrict_columns``,
+    load only the columns the serializer reads.
+    """
+    model = queryset.model
+    expandable = serializer.get_expandable_fields() if hasattr(serializer, 'get_expandable_fields') else {}
+    related = set()
+    columns = {model._meta.pk.name}
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in expandable:
+            relation, relation_columns = expandable[name]
+            related_model = model._meta.get_field(relation).related_model
+            if relation_columns is None:
+                relation_columns = [
+                    child.source for child in field.fields.values() if not child.write_only
+                ]
+            related.add(relation)
+            columns.add(relation)
+            for column in relation_columns:
+                if _concrete_field(related_model, column) is None:
+                    restrict_columns = False
+                columns.add(f'{relation}__{column}')
+        elif isinstance(field, serializers.SerializerMethodField):
+            # method fields of this app only need the primary key
+            continue
+        elif _concrete_field(model, field.source) is not None:
+            columns.add(field.source)
+        else:
+            restrict_columns = False
+
+    if related:
+        queryset = queryset.select_related(*sorted(related))
+    if restrict_columns:
+        queryset = queryset.only(*sorted(columns))
+    return queryset
+
+
+class SparseFieldsetMixin:
+    """
+    Shape read querysets after the serializer's (possibly sparse) field set.
+
+    Expanded nested objects are loaded with ``select_related()``; when the
+    client sends ``?fields=`` or ``?expand=`` unrequested joins are skipped and
+    only the needed columns are selected.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        sparse = (
+            parse_field_list(self.request, 'fields') is not None
+            or parse_field_list(self.request, 'expand') is not None
+        )
+        return optimize_queryset(queryset, get_read_serializer(self), restrict_columns=sparse)
+
+
+class ValuesListMixin:
+    """
+    Serve ``list`` from ``values_list()`` rows through a compiled reader.
+
+    The output is identical to the serializer's; serializers with fields the
+    reader cannot compile (and ``VALUES_READER_ENABLED = False``) fall back
+    to the regular ``list``.
+    """
+
+    def list(self, request, *args, **kwargs):
+        reader = None
+        if getattr(settings, 'VALUES_READER_ENABLED', True):
+            reader = compile_reader(get_read_serializer(self))
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = reader.prepare(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            with phase('qs'):
+                page = list(queryset)
+        with phase('serialize'):
+            data = reader.build_many(page)
+        if self.paginator is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+
+class DeltaSyncMixin:
+    """
+    ``GET <list>/sync/?updated_since=<cursor>`` for offline clients.
+
+    Returns the rows of ``get_queryset()`` changed since the cursor, the ids
+    deleted since then (from ``get_tombstone_queryset()``) and the cursor for
+    the next call. Without ``updated_since`` the whole data set is sent, one
+    page at a time while ``has_more`` is true.
+
+    Views must override ``get_tombstone_queryset()``: there is no default,
+    because the tombstones have to be scoped like ``get_queryset()`` (usually
+    ``tombstones_for(Model)`` filtered by the user's branch or ownership) or
+    the ids of other branches' deleted rows leak. A view class without it is
+    refused when it is defined.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.get_tombstone_queryset is DeltaSyncMixin.get_tombstone_queryset:
+            raise ImproperlyConfigured(f'{cls.__name__} must define get_tombstone_queryset()')
+
+    def get_tombstone_queryset(self):
+        """Tombstones of the deleted rows the request's user could see"""
+
+    def get_sync_page_size(self):
+        default = getattr(settings, 'SYNC_PAGE_SIZE', 200)
+        maximum = getattr(settings, 'SYNC_MAX_PAGE_SIZE', 1000)
+        try:
+            return max(1, min(int(self.request.query_params['page_size']), maximum))
+        except (KeyError, ValueError):
+            return default
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """Changes and deletions since the given cursor"""
+        value = request.query_params.get('updated_since')
+        try:
+            cursor = SyncCursor.decode(value) if value else None
+        except InvalidCursor:
+            return Response(
+                {'error': 'Invalid updated_since cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            with phase('qs'):
+                rows, deleted, next_cursor, has_more = read_changes(
+                    queryset, self.get_tombstone_queryset(), cursor, self.get_sync_page_size()
+                )
+        except ExpiredCursor:
+            return Response(
+                {'error': 'Sync cursor has expired, a full resync is required'},
+                status=status.HTTP_410_GONE
+            )
+
+        return Response({
+            'results': self.serialize(rows, many=True),
+            'deleted': deleted,
+            'cursor': next_cursor.encode(),
+            'has_more': has_more,
+        })
+
+
+class OptimisticConcurrencyMixin:
+    """
+    Conditional updates for versioned models.
+
+    Responses for one object carry ``ETag: "<version>"``. An update may send
+    that tag back as ``If-Match`` (or ``version`` in the body); if the object
+    has a different version by now, or changes between the read and the
+    write, the update is refused with 412 instead of overwriting the other
+    change. Updates without a precondition keep working as before.
+    """
+
+    def expected_versions(self, request):
+        """Versions the client may update from, or None without a precondition"""
+        header = request.headers.get('If-Match', '').strip()
+        if header and header != '*':
+            versions = set()
+            for tag in header.split(','):
+                # compression weakens the tags it passes through
+                tag = tag.strip().removeprefix('W/').strip('"')
+                if tag.isdigit():
+                    versions.add(int(tag))
+            return versions
+        version = request.data.get('version') if hasattr(request.data, 'get') else None
+        if version is None:
+            return None
+        if isinstance(version, bool) or not str(version).isdigit():
+            raise serializers.ValidationError({'version': ['A valid integer is required.']})
+        return {int(version)}
+
+    def check_version(self, instance):
+        expected = self.expected_versions(self.request)
+        if expected is None:
+            return
+        if instance.version not in expected:
+            raise VersionConflict(f'This {instance._meta.verbose_name.lower()} was changed by someone else')
+        # and refuse a change that lands between this read and the write
+        instance.expect_version(instance.version)
+
+    def perform_update(self, serializer):
+        self.check_version(serializer.instance)
+        super().perform_update(serializer)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, VersionConflict):
+            return Response({'error': str(exc)}, status=status.HTTP_412_PRECONDITION_FAILED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        data = getattr(response, 'data', None)
+        if (
+            self.action in ('create', 'retrieve', 'update', 'partial_update')
+            and response.status_code in (status.HTTP_200_OK, status.HTTP_201_CREATED)
+            and isinstance(data, dict)
+            and 'version' in data
+        ):
+            response['ETag'] = f'"{data["version"]}"'
+        return response
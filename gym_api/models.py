@@ -1,8 +1,57 @@
-from django.db import models
+import secrets
+from itertools import chain
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .search import search_keys
+
+class VersionConflict(Exception):
+    """The row was changed by someone else since it was read"""
+
+
+class VersionedModelMixin:
+    """
+    Optimistic concurrency: ``version`` goes up by one on every save. Saves
+    are last-write-wins unless ``expect_version()`` was called first; then
+    the UPDATE only matches that version, and a concurrent change raises
+    ``VersionConflict`` instead of being overwritten.
+    Models call ``_bump_version(kwargs)`` from ``save()``.
+    """
+    
+    def expect_version(self, version):
+        """Make the next save conditional on the stored row still having ``version``"""
+        self._required_version = version
+    
+    def _bump_version(self, kwargs):
+        if self._state.adding:
+            return
+        self._version_read = self.version
+        # incremented in the UPDATE itself, so concurrent saves never share a version
+        self.version = models.F('version') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        read = self.__dict__.pop('_version_read', None)
+        required = self.__dict__.pop('_required_version', None)
+        if read is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        queryset = base_qs if required is None else base_qs.filter(version=required)
+        if super()._do_update(queryset, using, pk_val, values, update_fields, forced_update):
+            self.version = base_qs.filter(pk=pk_val).values_list('version', flat=True).get()
+            return True
+        self.version = read
+        if required is not None and base_qs.filter(pk=pk_val).exists():
+            raise VersionConflict(f'This {self._meta.verbose_name.lower()} was changed by someone else')
+        # gone meanwhile: save() inserts it again, as without versioning
+        return False
+
+
 class User(AbstractUser):
     """Custom User model with role-based access"""
     ROLE_CHOICES = (
@@ -24,6 +73,10 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # normalized prefix-search keys for /users/autocomplete/, maintained in save()
+    search_email = models.CharField(max_length=254, blank=True, default='', editable=False)
+    search_name = models.CharField(max_length=301, blank=True, default='', editable=False)
+    search_last = models.CharField(max_length=150, blank=True, default='', editable=False)
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -31,6 +84,24 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.email} ({self.get_role_display()})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_gym_branch_id = instance.__dict__.get('gym_branch_id')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # post_save receivers invalidate the branch the user left as well
+        self._previous_gym_branch_id = getattr(self, '_loaded_gym_branch_id', None)
+        keys = search_keys(self.email, self.first_name, self.last_name)
+        for field, value in keys.items():
+            setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'email', 'first_name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, *keys}
+        super().save(*args, **kwargs)
+        self._loaded_gym_branch_id = self.gym_branch_id
+    
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
@@ -38,6 +109,20 @@ class User(AbstractUser):
             models.Index(fields=['email']),
             models.Index(fields=['role']),
             models.Index(fields=['gym_branch']),
+            models.Index(fields=['gym_branch', 'updated_at'], name='gym_api_use_branch_upd_idx'),
+            # pattern_ops so LIKE 'prefix%' is an index range scan under any collation (PostgreSQL)
+            models.Index(
+                fields=['gym_branch', 'search_email'], name='gym_api_use_branch_email_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+            models.Index(
+                fields=['gym_branch', 'search_name'], name='gym_api_use_branch_name_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
+            models.Index(
+                fields=['gym_branch', 'search_last'], name='gym_api_use_branch_last_idx',
+                opclasses=['int8_ops', 'varchar_pattern_ops']
+            ),
         ]
 
 
@@ -61,7 +146,7 @@ class GymBranch(models.Model):
         ]
 
 
-class WorkoutPlan(models.Model):
+class WorkoutPlan(VersionedModelMixin, models.Model):
     """Workout plan created by trainers"""
     title = models.CharField(max_length=255)
     description = models.TextField()
@@ -78,10 +163,48 @@ class WorkoutPlan(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # optimistic concurrency, see VersionedModelMixin
+    version = models.PositiveIntegerField(default=1, editable=False)
     
     def __str__(self):
         return f"{self.title} - {self.created_by.email}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_gym_branch_id = instance.__dict__.get('gym_branch_id')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        branch_changed = (
+            self.pk is not None
+            and hasattr(self, '_loaded_gym_branch_id')
+            and self.gym_branch_id != self._loaded_gym_branch_id
+            and (update_fields is None or 'gym_branch' in update_fields)
+        )
+        self._bump_version(kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if branch_changed:
+                from .leaderboard import move_branch  # leaderboard imports the models
+                
+                # the bulk updates below skip save(), so move the completions first
+                move_branch(
+                    chain.from_iterable(
+                        tasks.filter(completed_at__isnull=False).values_list('gym_branch_id', 'member_id', 'completed_at')
+                        for tasks in (self.tasks, self.archived_tasks)
+                    ),
+                    self.gym_branch_id,
+                )
+                # keep the tasks' denormalized branch in step (and visible to delta sync)
+                self.tasks.update(
+                    gym_branch_id=self.gym_branch_id, updated_at=timezone.now(), version=models.F('version') + 1
+                )
+                self.recurring_tasks.update(gym_branch_id=self.gym_branch_id, updated_at=timezone.now())
+                self.archived_tasks.update(gym_branch_id=self.gym_branch_id)
+        self._loaded_gym_branch_id = self.gym_branch_id
+    
     def clean(self):
         if self.created_by.role != 'trainer':
             raise ValidationError("Workout plan can only be created by trainers")
@@ -94,10 +217,71 @@ class WorkoutPlan(models.Model):
         indexes = [
             models.Index(fields=['gym_branch', 'created_by']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['gym_branch', 'updated_at'], name='gym_api_wor_branch_upd_idx'),
+        ]
+
+
+class RecurringTask(models.Model):
+    """Weekly repeating task assignment; occurrences are expanded when read"""
+    WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+    
+    workout_plan = models.ForeignKey(
+        WorkoutPlan,
+        on_delete=models.CASCADE,
+        related_name='recurring_tasks'
+    )
+    member = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recurring_tasks',
+        limit_choices_to={'role': 'member'}
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='created_recurring_tasks',
+        limit_choices_to={'role': 'trainer'}
+    )
+    # copy of workout_plan.gym_branch, as on WorkoutTask
+    gym_branch = models.ForeignKey(
+        GymBranch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,
+        related_name='recurring_tasks'
+    )
+    # bit n is set when the task repeats on date.weekday() == n (Monday is 0)
+    weekdays = models.PositiveSmallIntegerField()
+    time_of_day = models.TimeField()
+    timezone = models.CharField(max_length=64)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.workout_plan.title} - {self.member.email} ({self.start_date} to {self.end_date})"
+    
+    def save(self, *args, **kwargs):
+        self.gym_branch_id = self.workout_plan.gym_branch_id
+        super().save(*args, **kwargs)
+    
+    def repeats_on(self, day):
+        return bool(self.weekdays & (1 << day.weekday()))
+    
+    class Meta:
+        verbose_name = 'Recurring Task'
+        verbose_name_plural = 'Recurring Tasks'
+        indexes = [
+            models.Index(fields=['gym_branch', 'end_date'], name='gym_api_rec_branch_end_idx'),
+            models.Index(fields=['member', 'end_date'], name='gym_api_rec_member_end_idx'),
         ]
 
 
-class WorkoutTask(models.Model):
+class WorkoutTask(VersionedModelMixin, models.Model):
     """Task assigned to members from workout plans"""
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -129,12 +313,95 @@ class WorkoutTask(models.Model):
         related_name='assigned_workout_tasks',
         limit_choices_to={'role': 'trainer'}
     )
+    # copy of workout_plan.gym_branch, so branch scoping needs no join;
+    # indexed by the composite (gym_branch, ...) indexes below
+    gym_branch = models.ForeignKey(
+        GymBranch,
+        on_delete=models.CASCADE,
+        editable=False,
+        db_index=False,
+        related_name='workout_tasks'
+    )
+    # set on occurrences of a recurring task, which are only stored once their status changes
+    recurrence = models.ForeignKey(
+        RecurringTask,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name='occurrences'
+    )
+    occurrence_date = models.DateField(null=True, blank=True)
+    # set while status is completed; drives the leaderboard counters
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # optimistic concurrency, see VersionedModelMixin
+    version = models.PositiveIntegerField(default=1, editable=False)
     
     def __str__(self):
         return f"{self.workout_plan.title} - {self.member.email} ({self.status})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_workout_plan_id = instance.__dict__.get('workout_plan_id')
+        if 'gym_branch_id' in instance.__dict__:
+            instance._loaded_gym_branch_id = instance.gym_branch_id
+        if 'completed_at' in instance.__dict__:
+            instance._loaded_completed_at = instance.completed_at
+        if 'status' in instance.__dict__:
+            instance._loaded_status = instance.status
+        return instance
+    
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            previous_branch_id = None
+        else:
+            previous_branch_id = (
+                self._loaded_gym_branch_id if hasattr(self, '_loaded_gym_branch_id') else self.gym_branch_id
+            )
+        # refresh the branch when the plan may have changed; free if the plan is cached
+        if (
+            self.gym_branch_id is None
+            or self._meta.get_field('workout_plan').is_cached(self)
+            or self.workout_plan_id != getattr(self, '_loaded_workout_plan_id', None)
+        ):
+            self.gym_branch_id = self.workout_plan.gym_branch_id
+        
+        if self.pk is None:
+            previous_completed_at = previous_status = None
+        else:
+            # deferred when loaded: reading them fetches the stored values
+            previous_completed_at = (
+                self._loaded_completed_at if hasattr(self, '_loaded_completed_at') else self.completed_at
+            )
+            previous_status = self._loaded_status if hasattr(self, '_loaded_status') else self.status
+        if self.status == 'completed' and self.completed_at is None:
+            self.completed_at = timezone.now()
+        elif self.status != 'completed':
+            self.completed_at = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'completed_at'}
+        if update_fields is not None and 'workout_plan' in update_fields:
+            kwargs['update_fields'] = update_fields = {*update_fields, 'gym_branch'}
+        if update_fields is not None and 'gym_branch' not in update_fields:
+            # the stored branch stays as it is
+            previous_branch_id = self.gym_branch_id
+        
+        # post_save receivers (leaderboard counters, webhook outbox) run in the same transaction
+        self._previous_completed_at = previous_completed_at
+        self._previous_status = previous_status
+        self._previous_gym_branch_id = previous_branch_id
+        self._bump_version(kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_workout_plan_id = self.workout_plan_id
+        self._loaded_gym_branch_id = self.gym_branch_id
+        self._loaded_completed_at = self.completed_at
+        self._loaded_status = self.status
+    
     def clean(self):
         if self.member.role != 'member':
             raise ValidationError("Task can only be assigned to members")
@@ -153,6 +420,247 @@ class WorkoutTask(models.Model):
             models.Index(fields=['workout_plan', 'member']),
             models.Index(fields=['created_at']),
             models.Index(fields=['due_date']),
+            models.Index(fields=['member', 'due_date'], name='gym_api_wor_member_due_idx'),
+            models.Index(fields=['gym_branch', 'created_at'], name='gym_api_wor_branch_cre_idx'),
+            models.Index(fields=['gym_branch', 'due_date'], name='gym_api_wor_branch_due_idx'),
+            # branch sync (managers, trainers) pages through updated_at
+            models.Index(fields=['gym_branch', 'updated_at'], name='gym_api_task_branch_upd_idx'),
+            models.Index(fields=['member', 'updated_at'], name='gym_api_wor_member_upd_idx'),
+            models.Index(fields=['updated_at'], name='gym_api_wor_updated_idx'),
+        ]
+        constraints = [
+            # also the index for recurrence lookups
+            models.UniqueConstraint(fields=['recurrence', 'occurrence_date'], name='gym_api_task_occurrence_key'),
+        ]
+
+
+class ArchivedWorkoutTask(models.Model):
+    """Completed workout task moved out of the live table by the archiver"""
+    # the id the task had in the live table
+    id = models.BigIntegerField(primary_key=True)
+    workout_plan = models.ForeignKey(
+        WorkoutPlan,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='archived_tasks'
+    )
+    member = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_index=False,
+        related_name='archived_tasks'
+    )
+    status = models.CharField(max_length=20, choices=WorkoutTask.STATUS_CHOICES)
+    due_date = models.DateTimeField()
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        db_index=False,
+        related_name='archived_workout_tasks'
+    )
+    gym_branch = models.ForeignKey(
+        GymBranch,
+        on_delete=models.CASCADE,
+        null=True,
+        db_index=False,
+        related_name='archived_tasks'
+    )
+    # plain id: the recurring task may be deleted later
+    recurrence_id = models.BigIntegerField(null=True, blank=True)
+    occurrence_date = models.DateField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archived task #{self.id} ({self.status})"
+    
+    class Meta:
+        verbose_name = 'Archived Workout Task'
+        verbose_name_plural = 'Archived Workout Tasks'
+        indexes = [
+            models.Index(fields=['member', 'completed_at'], name='gym_api_arc_member_com_idx'),
+            models.Index(fields=['gym_branch', 'completed_at'], name='gym_api_arc_branch_com_idx'),
+            # archived occurrences must not come back as virtual tasks
+            models.Index(
+                fields=['recurrence_id', 'occurrence_date'],
+                name='gym_api_arc_occurrence_idx',
+                condition=models.Q(recurrence_id__isnull=False),
+            ),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    """Completed task count of one member in one week or month of a branch"""
+    PERIOD_CHOICES = (
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+    
+    gym_branch = models.ForeignKey(GymBranch, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    member = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # first local day of the week (Monday) or month
+    period_start = models.DateField()
+    completed = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.member.email} {self.period} of {self.period_start}: {self.completed}"
+    
+    class Meta:
+        verbose_name = 'Leaderboard Entry'
+        verbose_name_plural = 'Leaderboard Entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['gym_branch', 'period', 'period_start', 'member'],
+                name='gym_api_leaderboard_key',
+            ),
+        ]
+        indexes = [
+            # top-K and rank queries are range scans in score order
+            models.Index(
+                fields=['gym_branch', 'period', 'period_start', '-completed', 'member'],
+                name='gym_api_lea_rank_idx',
+            ),
+        ]
+
+
+def generate_webhook_secret():
+    return secrets.token_hex(32)
+
+
+class WebhookSubscription(models.Model):
+    """Endpoint of a branch that receives task and plan events"""
+    EVENT_CHOICES = (
+        ('task.created', 'Task created'),
+        ('task.status_changed', 'Task status changed'),
+        ('plan.created', 'Plan created'),
+        ('plan.deleted', 'Plan deleted'),
+    )
+    
+    gym_branch = models.ForeignKey(
+        GymBranch, on_delete=models.CASCADE, db_index=False, related_name='webhook_subscriptions'
+    )
+    url = models.URLField(max_length=500)
+    # list of EVENT_CHOICES codes
+    events = models.JSONField(default=list)
+    # HMAC-SHA256 key of the X-Webhook-Signature header
+    secret = models.CharField(max_length=64, default=generate_webhook_secret)
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhook_subscriptions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.url} ({', '.join(self.events)})"
+    
+    class Meta:
+        verbose_name = 'Webhook Subscription'
+        verbose_name_plural = 'Webhook Subscriptions'
+        indexes = [
+            models.Index(fields=['gym_branch', 'is_active'], name='gym_api_web_branch_act_idx'),
+        ]
+
+
+class WebhookDelivery(models.Model):
+    """Outbox row: one event for one subscription, written with the change that caused it"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+    )
+    
+    subscription = models.ForeignKey(
+        WebhookSubscription, on_delete=models.CASCADE, db_index=False, related_name='deliveries'
+    )
+    event = models.CharField(max_length=30, choices=WebhookSubscription.EVENT_CHOICES)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True, default='')
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.event} to subscription #{self.subscription_id} ({self.status})"
+    
+    class Meta:
+        verbose_name = 'Webhook Delivery'
+        verbose_name_plural = 'Webhook Deliveries'
+        indexes = [
+            # the worker finds endpoints with due events, then claims their batches oldest first
+            models.Index(
+                fields=['next_attempt_at'], name='gym_api_whd_pending_idx', condition=models.Q(status='pending')
+            ),
+            models.Index(
+                fields=['subscription', 'next_attempt_at'], name='gym_api_whd_sub_pending_idx',
+                condition=models.Q(status='pending')
+            ),
+            models.Index(fields=['subscription', 'created_at'], name='gym_api_whd_sub_created_idx'),
+            models.Index(fields=['created_at'], name='gym_api_whd_created_idx'),
+        ]
+
+
+class TaskReminder(models.Model):
+    """Outbox row: the reminder for one due date of a workout task"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('cancelled', 'Cancelled'),
+        ('failed', 'Failed'),
+    )
+    
+    # the unique key below leads with the task
+    task = models.ForeignKey(WorkoutTask, on_delete=models.CASCADE, db_index=False, related_name='reminders')
+    due_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Reminder for task #{self.task_id} due {self.due_date} ({self.status})"
+    
+    class Meta:
+        verbose_name = 'Task Reminder'
+        verbose_name_plural = 'Task Reminders'
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'due_date'], name='gym_api_reminder_key'),
+        ]
+        indexes = [
+            # the dispatcher only scans what is still to be sent
+            models.Index(
+                fields=['next_attempt_at'], name='gym_api_rem_pending_idx', condition=models.Q(status='pending')
+            ),
+            models.Index(fields=['created_at'], name='gym_api_rem_created_idx'),
+        ]
+
+
+class TrainerAssignment(models.Model):
+    """Trainer responsible for one member, kept balanced by ``assignments.assign_members``"""
+    member = models.OneToOneField(User, on_delete=models.CASCADE, related_name='trainer_assignment')
+    trainer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='assigned_members')
+    gym_branch = models.ForeignKey(
+        GymBranch, on_delete=models.CASCADE, db_index=False, related_name='trainer_assignments'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.member.email} -> {self.trainer.email}"
+    
+    class Meta:
+        verbose_name = 'Trainer Assignment'
+        verbose_name_plural = 'Trainer Assignments'
+        indexes = [
+            models.Index(fields=['gym_branch', 'trainer'], name='gym_api_tra_branch_tra_idx'),
         ]
 
 
@@ -175,6 +683,11 @@ class ActivityLog(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.action} - {self.model_name}"
     
+    def save(self, *args, **kwargs):
+        # the post_save receiver counts the entry in its rollup; both commit or neither
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
     class Meta:
         verbose_name = 'Activity Log'
         verbose_name_plural = 'Activity Logs'
@@ -182,3 +695,80 @@ class ActivityLog(models.Model):
             models.Index(fields=['user', 'created_at']),
             models.Index(fields=['created_at']),
         ]
+
+
+class SlowQuery(models.Model):
+    """Slow SQL statements sampled at runtime, aggregated by fingerprint"""
+    fingerprint = models.CharField(max_length=40, unique=True)
+    normalized_sql = models.TextField()
+    sample_sql = models.TextField()
+    view = models.CharField(max_length=200, blank=True)
+    frame = models.CharField(max_length=255, blank=True)
+    explain = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.fingerprint[:12]} ({self.count}x, max {self.max_ms:.0f} ms)"
+    
+    class Meta:
+        verbose_name = 'Slow Query'
+        verbose_name_plural = 'Slow Queries'
+        indexes = [
+            models.Index(fields=['last_seen'], name='gym_api_slo_last_se_idx'),
+        ]
+
+
+class ActivityRollup(models.Model):
+    """Activity log counter per time bucket, branch, action and model"""
+    GRANULARITY_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    # start of the bucket in UTC
+    bucket = models.DateTimeField()
+    # plain id, 0 for users without a branch (super admins)
+    branch_id = models.BigIntegerField(default=0)
+    action = models.CharField(max_length=20)
+    model_name = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.granularity} {self.bucket} {self.action} {self.model_name}: {self.count}"
+    
+    class Meta:
+        verbose_name = 'Activity Rollup'
+        verbose_name_plural = 'Activity Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'branch_id', 'action', 'model_name'],
+                name='gym_api_activity_rollup_key',
+            ),
+        ]
+
+
+class Tombstone(models.Model):
+    """Deleted row, kept so delta-sync clients learn about deletions"""
+    model_name = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    # plain ids: the branch or owner may be deleted in the same cascade
+    branch_id = models.BigIntegerField(null=True, blank=True)
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.model_name} #{self.object_id} deleted at {self.deleted_at}"
+    
+    class Meta:
+        verbose_name = 'Tombstone'
+        verbose_name_plural = 'Tombstones'
+        indexes = [
+            models.Index(fields=['model_name', 'branch_id', 'deleted_at'], name='gym_api_tom_branch_del_idx'),
+            models.Index(fields=['model_name', 'owner_id', 'deleted_at'], name='gym_api_tom_owner_del_idx'),
+            models.Index(fields=['deleted_at'], name='gym_api_tom_deleted_idx'),
+        ]
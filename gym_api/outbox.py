@@ -0,0 +1,67 @@
+"""
+Shared mechanics of the outbox tables (``TaskReminder``, ``WebhookDelivery``).
+
+Rows are ``pending`` until a worker finishes them. ``claim`` leases due rows
+with ``FOR UPDATE SKIP LOCKED`` in a short transaction (bumping ``attempts``
+and pushing ``next_attempt_at`` past the lease), so concurrent workers never
+share a row and a crashed worker's rows come back once the lease ends.
+``retry`` schedules failed rows with exponential backoff or gives up after
+the last attempt, and ``purge`` deletes finished rows in chunks.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def claim(queryset, batch_size, lease_seconds, now=None):
+    """Lease up to ``batch_size`` due pending rows of ``queryset``; return their ids"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(
+            queryset.filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            queryset.model.objects.filter(id__in=ids).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=lease_seconds),
+            )
+    return ids
+
+
+def backoff(attempts, base, maximum):
+    """Seconds to wait after the ``attempts``-th failed attempt"""
+    return min(base * 2 ** (attempts - 1), maximum)
+
+
+def retry(model, ids, attempts, error, max_attempts, base, maximum, now=None):
+    """
+    Record a failed attempt of rows ``ids`` that have had ``attempts``
+    attempts; return True if they will be tried again, False if they failed
+    """
+    now = now or timezone.now()
+    if attempts >= max_attempts:
+        changes = {'status': 'failed'}
+    else:
+        changes = {'next_attempt_at': now + timedelta(seconds=backoff(attempts, base, maximum))}
+    model.objects.filter(id__in=ids).update(last_error=error[:1000], **changes)
+    return attempts < max_attempts
+
+
+def purge(queryset, batch_size):
+    """Delete the rows of ``queryset`` one chunk at a time; return how many"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
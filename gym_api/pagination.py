@@ -0,0 +1,141 @@
+"""
+Pagination classes.
+
+``EstimatedCountPagination`` avoids an exact ``COUNT(*)`` per page on large
+tables: ``has_next`` comes from fetching one row more than the page size, the
+last page's count is derived from its offset, and otherwise the count is the
+PostgreSQL planner estimate or a cached exact count once the total exceeds
+``COUNT_ESTIMATE_THRESHOLD``. ``?count=exact`` always counts.
+"""
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import caching
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    digest = hashlib.sha1(f'{sql}|{params!r}'.encode()).hexdigest()
+    return f'gym_api:count:{queryset.model._meta.label_lower}:{digest}'
+
+
+def planner_estimate(queryset):
+    """Row estimate of the PostgreSQL planner, or None on other databases"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Django paginator (for admin changelists) using the planner estimate on large tables"""
+
+    @cached_property
+    def count(self):
+        if hasattr(self.object_list, 'query'):
+            estimate = planner_estimate(self.object_list)
+            if estimate is not None and estimate >= getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', 10000):
+                return estimate
+        return super().count
+
+
+class EstimatedCountPagination(StandardResultsSetPagination):
+    """Page number pagination with over-fetch ``has_next`` and estimated counts"""
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except (TypeError, ValueError):
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        if not rows and self.page_number > 1:
+            raise NotFound(self.invalid_page_message)
+
+        self.count, self.count_is_estimate = self.get_count(queryset, offset, rows)
+        return rows
+
+    def get_count(self, queryset, offset, rows):
+        """``(count, is_estimate)`` for the filtered queryset"""
+        if not self.has_next:
+            # last page: the total follows from the offset
+            return offset + len(rows), False
+        if self.request.query_params.get(self.count_query_param) == 'exact':
+            return queryset.count(), False
+
+        minimum = offset + len(rows) + 1
+        threshold = getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', 10000)
+        key = count_cache_key(queryset)
+        # an unreachable cache counts as a miss
+        cached = caching.call('default', 'get', key)
+        if cached is not None:
+            return max(cached, minimum), True
+
+        estimate = planner_estimate(queryset)
+        if estimate is not None and estimate >= threshold:
+            return max(estimate, minimum), True
+
+        count = queryset.count()
+        if count >= threshold:
+            caching.call('default', 'set', key, count, getattr(settings, 'COUNT_CACHE_TTL', 60))
+        return count, False
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_is_estimate', self.count_is_estimate),
+            ('has_next', self.has_next),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_estimate'] = {'type': 'boolean'}
+        response_schema['properties']['has_next'] = {'type': 'boolean'}
+        return response_schema
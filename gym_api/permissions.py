@@ -49,11 +49,11 @@ class IsSameBranch(BasePermission):
             return True
         
         # Get the gym_branch from the object
-        if hasattr(obj, 'gym_branch'):
-            return obj.gym_branch == request.user.gym_branch
+        if hasattr(obj, 'gym_branch_id'):
+            return obj.gym_branch_id == request.user.gym_branch_id
         
         if hasattr(obj, 'user'):
-            return obj.user.gym_branch == request.user.gym_branch
+            return obj.user.gym_branch_id == request.user.gym_branch_id
         
         if isinstance(obj, type) and hasattr(obj, 'gym_branch'):
             return obj.gym_branch == request.user.gym_branch
@@ -89,7 +89,7 @@ class IsOwnerOrGymManager(BasePermission):
         
         if request.user.role == 'gym_manager':
             # Manager can access users from their branch
-            return obj.gym_branch == request.user.gym_branch
+            return obj.gym_branch_id == request.user.gym_branch_id
         
         # Other roles can only access their own data
         return obj == request.user
@@ -103,10 +103,10 @@ class CanEditOwnTask(BasePermission):
         
         if request.user.role == 'trainer':
             # Trainer can update tasks in their branch
-            return obj.workout_plan.gym_branch == request.user.gym_branch
+            return obj.gym_branch_id == request.user.gym_branch_id
         
         if request.user.role == 'member':
             # Member can only update their own tasks
-            return obj.member == request.user
+            return obj.member_id == request.user.id
         
         return False
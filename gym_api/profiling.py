@@ -0,0 +1,186 @@
+"""
+On-demand sampling CPU profiler for single requests.
+
+A super admin adds ``X-Profile: 1`` (or ``?_profile=1``) to any request. A
+background thread then samples the request thread's stack every
+``PROFILE_SAMPLE_INTERVAL`` seconds and the result is saved to ``PROFILE_DIR``
+in collapsed-stack format (one ``frame;frame;frame count`` line per stack),
+ready for flamegraph.pl or speedscope. Requests without the flag only pay for
+a header lookup.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+_PATH_MARKERS = ('site-packages' + os.sep, 'dist-packages' + os.sep)
+
+
+def get_profile_dir():
+    return getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def is_requested(request):
+    """Cheap check for the profiling flag, done on every request"""
+    if 'HTTP_X_PROFILE' in request.META:
+        return request.META['HTTP_X_PROFILE'] not in ('', '0', 'false')
+    query_string = request.META.get('QUERY_STRING', '')
+    return '_profile=' in query_string and request.GET.get('_profile') not in ('', '0', 'false')
+
+
+def get_super_admin(request):
+    """Return the requesting user if they are a super admin (session or JWT)"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        from rest_framework.exceptions import APIException
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except APIException:
+            return None
+        user = result[0] if result else None
+    if user is not None and getattr(user, 'role', None) == 'super_admin':
+        return user
+    return None
+
+
+def _short_path(filename):
+    for marker in _PATH_MARKERS:
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        return os.path.relpath(filename, base_dir)
+    return os.path.basename(filename)
+
+
+class SamplingProfiler:
+    """Periodically samples the stack of one thread from a helper thread"""
+
+    def __init__(self, thread_id, interval=None):
+        self.thread_id = thread_id
+        self.interval = interval or getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001)
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+            label = self._labels[code] = label.replace(';', ':')
+        return label
+
+    def _run(self):
+        current_frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def save_profile(profiler, request, response, duration, user):
+    """Write the collapsed stacks and a metadata sidecar, return the metadata"""
+    profile_dir = get_profile_dir()
+    os.makedirs(profile_dir, exist_ok=True)
+
+    now = timezone.now()
+    profile_id = f'{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+    meta = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+        'samples': profiler.sample_count,
+        'interval_ms': profiler.interval * 1000,
+        'user': user.email,
+        'created_at': now.isoformat(),
+    }
+    with open(os.path.join(profile_dir, f'{profile_id}.collapsed'), 'w') as fh:
+        fh.write(profiler.collapsed())
+    with open(os.path.join(profile_dir, f'{profile_id}.json'), 'w') as fh:
+        json.dump(meta, fh)
+
+    _prune(profile_dir)
+    return meta
+
+
+def _prune(profile_dir):
+    keep = getattr(settings, 'PROFILE_MAX_FILES', 200)
+    metas = sorted(name for name in os.listdir(profile_dir) if name.endswith('.json'))
+    for name in metas[:-keep] if len(metas) > keep else []:
+        profile_id = name[:-len('.json')]
+        for suffix in ('.json', '.collapsed'):
+            try:
+                os.remove(os.path.join(profile_dir, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    profile_dir = get_profile_dir()
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(profile_dir), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(profile_dir, name)) as fh:
+                profiles.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_path(profile_id):
+    """Path of a stored collapsed-stack file, or None for unknown/invalid ids"""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = os.path.join(get_profile_dir(), f'{profile_id}.collapsed')
+    return path if os.path.exists(path) else None
+
+
+def profile_request(get_response, request, user):
+    """Run the request under the sampling profiler and save the result"""
+    profiler = SamplingProfiler(threading.get_ident())
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        response = get_response(request)
+    finally:
+        profiler.stop()
+    duration = time.perf_counter() - start
+
+    meta = save_profile(profiler, request, response, duration, user)
+    response['X-Profile-Id'] = meta['id']
+    return response
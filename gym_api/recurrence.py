@@ -0,0 +1,121 @@
+"""
+Recurring task expansion.
+
+A ``RecurringTask`` stores one weekly rule instead of a ``WorkoutTask`` row
+per occurrence. Reads expand the rule over the requested range into unsaved
+("virtual") tasks with ``id`` null and ``recurrence``/``occurrence_date``
+set. An occurrence is only stored as a ``WorkoutTask`` once its status is
+changed; from then on the stored row replaces the virtual one. Stored
+occurrences moved to ``ArchivedWorkoutTask`` stay stored: they are neither
+expanded nor stored again.
+"""
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from .models import ArchivedWorkoutTask, RecurringTask, WorkoutTask
+
+
+def recurring_tasks_for(user):
+    """Recurring tasks visible to ``user``, scoped like its workout tasks"""
+    queryset = RecurringTask.objects.select_related('workout_plan', 'member', 'created_by')
+    if user.role == 'super_admin':
+        return queryset
+    if user.role in ('gym_manager', 'trainer'):
+        return queryset.filter(gym_branch_id=user.gym_branch_id)
+    if user.role == 'member':
+        return queryset.filter(member=user)
+    return queryset.none()
+
+
+FULL_WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def parse_weekdays(names):
+    """``['mon', 'friday']`` -> bitmask; raises ValueError on unknown names"""
+    mask = 0
+    for name in names:
+        name = str(name).lower()
+        index = FULL_WEEKDAYS.index(name) if name in FULL_WEEKDAYS else RecurringTask.WEEKDAYS.index(name)
+        mask |= 1 << index
+    return mask
+
+
+def weekday_names(mask):
+    return [name for index, name in enumerate(RecurringTask.WEEKDAYS) if mask & (1 << index)]
+
+
+def due_at(rule, day):
+    return datetime.combine(day, rule.time_of_day, tzinfo=ZoneInfo(rule.timezone))
+
+
+def occurrence_dates(rule, lower, upper):
+    """Dates of the rule's occurrences due in ``[lower, upper)``"""
+    # a day of slack on both sides, the rule's time zone may differ from the range's
+    day = max(rule.start_date, lower.date() - timedelta(days=1))
+    last = min(rule.end_date, upper.date() + timedelta(days=1))
+    while day <= last:
+        if rule.repeats_on(day) and lower <= due_at(rule, day) < upper:
+            yield day
+        day += timedelta(days=1)
+
+
+def rules_between(queryset, lower, upper):
+    """Rules of ``queryset`` that may have occurrences in ``[lower, upper)``"""
+    return queryset.filter(
+        start_date__lte=upper.date() + timedelta(days=1),
+        end_date__gte=lower.date() - timedelta(days=1),
+    )
+
+
+def virtual_task(rule, day):
+    task = WorkoutTask(
+        workout_plan=rule.workout_plan,
+        member=rule.member,
+        created_by=rule.created_by,
+        status='pending',
+        due_date=due_at(rule, day),
+        recurrence=rule,
+        occurrence_date=day,
+    )
+    task.gym_branch_id = rule.gym_branch_id
+    return task
+
+
+def expand(rules, lower, upper):
+    """Virtual tasks of ``rules`` due in ``[lower, upper)`` that are not stored yet"""
+    rules = list(rules)
+    if not rules:
+        return []
+    stored = set()
+    for model in (WorkoutTask, ArchivedWorkoutTask):
+        stored.update(
+            model.objects.filter(recurrence_id__in=[rule.id for rule in rules], occurrence_date__isnull=False)
+            .filter(occurrence_date__gte=lower.date() - timedelta(days=1), occurrence_date__lte=upper.date() + timedelta(days=1))
+            .values_list('recurrence_id', 'occurrence_date')
+        )
+    return [
+        virtual_task(rule, day)
+        for rule in rules
+        for day in occurrence_dates(rule, lower, upper)
+        if (rule.id, day) not in stored
+    ]
+
+
+def materialize(rule, day):
+    """Stored task of one occurrence, created on first use; ``(task, created)``"""
+    if not rule.repeats_on(day) or not rule.start_date <= day <= rule.end_date:
+        raise ValueError(f'{day} is not an occurrence of this recurring task')
+    if ArchivedWorkoutTask.objects.filter(recurrence_id=rule.id, occurrence_date=day).exists():
+        raise ValueError(f'The occurrence on {day} is archived')
+    # get_or_create retries the lookup if a concurrent request stored it first
+    return WorkoutTask.objects.get_or_create(
+        recurrence=rule,
+        occurrence_date=day,
+        defaults={
+            'workout_plan_id': rule.workout_plan_id,
+            'member_id': rule.member_id,
+            'created_by_id': rule.created_by_id,
+            'gym_branch_id': rule.gym_branch_id,
+            'due_date': due_at(rule, day),
+        },
+    )
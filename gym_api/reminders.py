@@ -0,0 +1,199 @@
+"""
+Due-date reminders through an outbox table.
+
+``enqueue`` walks the ``due_date`` index over the next
+``REMINDER_LEAD_HOURS`` and inserts one ``TaskReminder`` per open task and
+due date (inserts of an existing key are ignored, so it can run as often as
+wanted). ``dispatch`` drains the outbox in batches: a short transaction
+claims a batch with ``FOR UPDATE SKIP LOCKED`` and leases it for
+``REMINDER_LEASE_SECONDS``, so several workers never send the same reminder
+and a crashed worker's batch is picked up again once the lease ends. Sending
+happens outside any transaction through the configured transport. Failures
+are retried with exponential backoff up to ``REMINDER_MAX_ATTEMPTS`` times,
+and ``REMINDER_MAX_PER_SECOND`` caps throughput so a large branch is spread
+over time instead of hammering the database and the mail server at once.
+
+Reminders whose task was completed, rescheduled or whose member was
+deactivated in the meantime are cancelled instead of sent. Occurrences of
+recurring tasks only get reminders once they are stored.
+"""
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import outbox
+from .models import TaskReminder, WorkoutTask
+from .outbox import setting as _setting
+
+ACTIVE_STATUSES = ('pending', 'in_progress')
+FINISHED_STATUSES = ('sent', 'cancelled', 'failed')
+
+
+def subject(reminder):
+    task = reminder.task
+    due = timezone.localtime(reminder.due_date)
+    return f'Reminder: {task.workout_plan.title} is due {due:%a %d %b %H:%M}'
+
+
+def body(reminder):
+    task = reminder.task
+    member = task.member
+    return (
+        f'Hi {member.first_name or member.email},\n\n'
+        f'your workout "{task.workout_plan.title}" is due '
+        f'{timezone.localtime(reminder.due_date):%A %d %B at %H:%M}.\n'
+    )
+
+
+class EmailTransport:
+    """Sends through Django's email backend (SMTP by default), one connection per batch"""
+
+    def send(self, reminders):
+        """Send ``reminders``; return ``{reminder_id: error}`` of the failed ones"""
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as exc:
+            return {reminder.id: str(exc) for reminder in reminders}
+        errors = {}
+        try:
+            for reminder in reminders:
+                message = EmailMessage(
+                    subject(reminder), body(reminder), settings.DEFAULT_FROM_EMAIL, [reminder.task.member.email],
+                    connection=connection,
+                )
+                try:
+                    message.send()
+                except Exception as exc:
+                    errors[reminder.id] = str(exc)
+        finally:
+            connection.close()
+        return errors
+
+
+class FileTransport:
+    """Development stand-in: appends one JSON line per reminder to ``REMINDER_FILE_PATH``"""
+
+    def send(self, reminders):
+        with open(_setting('REMINDER_FILE_PATH', 'reminders.log'), 'a') as f:
+            for reminder in reminders:
+                f.write(json.dumps({
+                    'to': reminder.task.member.email,
+                    'subject': subject(reminder),
+                    'task': reminder.task_id,
+                    'due_date': reminder.due_date.isoformat(),
+                }) + '\n')
+        return {}
+
+
+def get_transport():
+    return import_string(_setting('REMINDER_TRANSPORT', 'gym_api.reminders.EmailTransport'))()
+
+
+def enqueue(now=None, batch_size=None):
+    """Add reminders for open tasks due within the lead time; return how many tasks were scanned"""
+    now = now or timezone.now()
+    batch_size = batch_size or _setting('REMINDER_BATCH_SIZE', 500)
+    upcoming = WorkoutTask.objects.filter(
+        status__in=ACTIVE_STATUSES,
+        due_date__gte=now,
+        due_date__lt=now + timedelta(hours=_setting('REMINDER_LEAD_HOURS', 24)),
+        member__is_active=True,
+    )
+    written = 0
+    last = None
+    while True:
+        page = upcoming
+        if last is not None:
+            # keyset pagination along the due_date index
+            page = page.filter(due_date__gte=last[0]).exclude(due_date=last[0], id__lte=last[1])
+        rows = list(page.order_by('due_date', 'id').values_list('due_date', 'id')[:batch_size])
+        if not rows:
+            return written
+        TaskReminder.objects.bulk_create(
+            [TaskReminder(task_id=task_id, due_date=due_date, next_attempt_at=now) for due_date, task_id in rows],
+            ignore_conflicts=True,
+        )
+        written += len(rows)
+        last = rows[-1]
+
+
+def claim(batch_size, now=None):
+    """Lease up to ``batch_size`` due reminders no other worker holds"""
+    ids = outbox.claim(TaskReminder.objects.all(), batch_size, _setting('REMINDER_LEASE_SECONDS', 300), now)
+    return list(
+        TaskReminder.objects.filter(id__in=ids).select_related('task__member', 'task__workout_plan').order_by('id')
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait after the ``attempts``-th failed attempt"""
+    return outbox.backoff(
+        attempts, _setting('REMINDER_RETRY_BASE_SECONDS', 60), _setting('REMINDER_RETRY_MAX_SECONDS', 3600)
+    )
+
+
+def _is_current(reminder):
+    task = reminder.task
+    return task.status in ACTIVE_STATUSES and task.due_date == reminder.due_date and task.member.is_active
+
+
+def deliver(reminders, transport, now=None):
+    """Send claimed reminders and record the outcome; return counts per outcome"""
+    now = now or timezone.now()
+    current = [reminder for reminder in reminders if _is_current(reminder)]
+    stale = [reminder.id for reminder in reminders if not _is_current(reminder)]
+    errors = transport.send(current) if current else {}
+
+    TaskReminder.objects.filter(id__in=stale).update(status='cancelled')
+    sent = [reminder.id for reminder in current if reminder.id not in errors]
+    TaskReminder.objects.filter(id__in=sent).update(status='sent', sent_at=now, last_error='')
+    failed = retried = 0
+    for reminder in current:
+        if reminder.id not in errors:
+            continue
+        if outbox.retry(
+            TaskReminder, [reminder.id], reminder.attempts, errors[reminder.id],
+            _setting('REMINDER_MAX_ATTEMPTS', 5),
+            _setting('REMINDER_RETRY_BASE_SECONDS', 60), _setting('REMINDER_RETRY_MAX_SECONDS', 3600), now,
+        ):
+            retried += 1
+        else:
+            failed += 1
+    return {'sent': len(sent), 'retried': retried, 'failed': failed, 'cancelled': len(stale)}
+
+
+def dispatch(batch_size=None, max_per_second=None, transport=None, sleep=time.sleep, clock=time.monotonic):
+    """Send due reminders until none are left; return counts per outcome"""
+    batch_size = batch_size or _setting('REMINDER_BATCH_SIZE', 500)
+    max_per_second = max_per_second or _setting('REMINDER_MAX_PER_SECOND', 50)
+    transport = transport or get_transport()
+    totals = {'sent': 0, 'retried': 0, 'failed': 0, 'cancelled': 0}
+    size = max(1, min(batch_size, int(max_per_second)))
+    started = clock()
+    processed = 0
+    while True:
+        reminders = claim(size)
+        if not reminders:
+            return totals
+        for outcome, count in deliver(reminders, transport).items():
+            totals[outcome] += count
+        processed += len(reminders)
+        # stay at or below max_per_second on average
+        ahead = processed / max_per_second - (clock() - started)
+        if ahead > 0:
+            sleep(ahead)
+
+
+def purge(older_than=None, batch_size=None):
+    """Delete finished reminders created before ``older_than``, one chunk at a time"""
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=_setting('REMINDER_RETENTION_DAYS', 30))
+    batch_size = batch_size or _setting('REMINDER_BATCH_SIZE', 500)
+    finished = TaskReminder.objects.filter(status__in=FINISHED_STATUSES, created_at__lt=older_than)
+    return outbox.purge(finished, batch_size)
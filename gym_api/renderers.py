@@ -0,0 +1,10 @@
+from rest_framework.renderers import JSONRenderer
+
+from .timing import phase
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSON renderer that reports its duration in Server-Timing"""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with phase('render'):
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,147 @@
+"""
+Time-bucketed activity counters.
+
+Every ``ActivityLog`` row increments an hourly ``ActivityRollup`` counter
+keyed by (hour, branch, action, model name) in the same transaction
+(``ActivityLog.save()`` wraps the insert and its post_save receivers), so
+activity histograms are read from a few counter rows instead of a
+``GROUP BY`` over the log. ``compact()`` folds hourly counters older than
+``ACTIVITY_ROLLUP_HOURLY_DAYS`` into daily ones; hourly histograms are
+therefore only available for that recent window. Buckets are UTC.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import ActivityRollup
+
+HOUR = 'hour'
+DAY = 'day'
+NO_BRANCH = 0
+
+
+class StatsRangeError(ValueError):
+    pass
+
+
+def bucket_start(moment, granularity):
+    moment = moment.astimezone(dt_timezone.utc)
+    if granularity == DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def increment(granularity, bucket, branch_id, action, model_name, amount=1):
+    """Add ``amount`` to one counter, creating it on first use"""
+    key = {
+        'granularity': granularity,
+        'bucket': bucket,
+        'branch_id': branch_id or NO_BRANCH,
+        'action': action,
+        'model_name': model_name,
+    }
+    if ActivityRollup.objects.filter(**key).update(count=F('count') + amount):
+        return
+    try:
+        with transaction.atomic():
+            ActivityRollup.objects.create(count=amount, **key)
+    except IntegrityError:
+        # another request created the counter first
+        ActivityRollup.objects.filter(**key).update(count=F('count') + amount)
+
+
+def record(log):
+    """Count one activity log entry in its hourly bucket"""
+    increment(HOUR, bucket_start(log.created_at, HOUR), log.user.gym_branch_id, log.action, log.model_name)
+
+
+def compact(before=None):
+    """Fold hourly counters before ``before`` into daily ones, one day per transaction"""
+    if before is None:
+        days = getattr(settings, 'ACTIVITY_ROLLUP_HOURLY_DAYS', 14)
+        before = timezone.now() - timedelta(days=days)
+    before = bucket_start(before, DAY)
+
+    hourly = ActivityRollup.objects.filter(granularity=HOUR)
+    first = hourly.filter(bucket__lt=before).aggregate(first=Min('bucket'))['first']
+    if first is None:
+        return 0
+
+    folded = 0
+    day = bucket_start(first, DAY)
+    while day < before:
+        next_day = day + timedelta(days=1)
+        with transaction.atomic():
+            rows = hourly.filter(bucket__gte=day, bucket__lt=next_day)
+            # lock the day's rows so concurrent runs cannot fold them twice
+            list(rows.select_for_update().values_list('pk', flat=True))
+            totals = rows.values('branch_id', 'action', 'model_name').annotate(total=Sum('count')).order_by()
+            for total in totals:
+                increment(DAY, day, total['branch_id'], total['action'], total['model_name'], total['total'])
+            deleted, _ = rows.delete()
+        folded += deleted
+        day = next_day
+    return folded
+
+
+def parse_stats_params(params):
+    """``(lower, upper, interval)`` from ``start``/``end`` (inclusive UTC dates) and ``interval``"""
+    interval = params.get('interval', DAY)
+    if interval not in (HOUR, DAY):
+        raise StatsRangeError('interval must be hour or day')
+    try:
+        start = date.fromisoformat(params.get('start', ''))
+        end = date.fromisoformat(params.get('end', ''))
+    except ValueError:
+        raise StatsRangeError('start and end are required as YYYY-MM-DD dates')
+    if end < start:
+        raise StatsRangeError('end must not be before start')
+    if interval == HOUR:
+        max_days = getattr(settings, 'ACTIVITY_ROLLUP_HOURLY_DAYS', 14)
+    else:
+        max_days = getattr(settings, 'ACTIVITY_STATS_MAX_DAYS', 366)
+    if (end - start).days + 1 > max_days:
+        raise StatsRangeError(f'A {interval}ly histogram cannot cover more than {max_days} days')
+
+    lower = datetime.combine(start, time.min, tzinfo=dt_timezone.utc)
+    upper = datetime.combine(end + timedelta(days=1), time.min, tzinfo=dt_timezone.utc)
+    return lower, upper, interval
+
+
+def histogram(lower, upper, interval, branch_id=None, action=None, model_name=None):
+    """Summed counters per bucket, branch, action and model name"""
+    rows = ActivityRollup.objects.filter(bucket__gte=lower, bucket__lt=upper)
+    if interval == HOUR:
+        rows = rows.filter(granularity=HOUR)
+        period = TruncHour('bucket', tzinfo=dt_timezone.utc)
+    else:
+        # daily rows plus the hourly rows not compacted yet
+        rows = rows.filter(granularity__in=[HOUR, DAY])
+        period = TruncDay('bucket', tzinfo=dt_timezone.utc)
+    if branch_id is not None:
+        rows = rows.filter(branch_id=branch_id or NO_BRANCH)
+    if action:
+        rows = rows.filter(action=action)
+    if model_name:
+        rows = rows.filter(model_name=model_name)
+
+    totals = (
+        rows.annotate(period=period)
+        .values('period', 'branch_id', 'action', 'model_name')
+        .annotate(total=Sum('count'))
+        .order_by('period', 'branch_id', 'action', 'model_name')
+    )
+    return [
+        {
+            'bucket': total['period'].isoformat(),
+            'branch': total['branch_id'] or None,
+            'action': total['action'],
+            'model_name': total['model_name'],
+            'count': total['total'],
+        }
+        for total in totals
+    ]
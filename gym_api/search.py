@@ -0,0 +1,89 @@
+"""
+User typeahead search.
+
+Users carry normalized copies of their email, full name and last name
+(``search_email``, ``search_name``, ``search_last``: case-folded, accents
+stripped, whitespace collapsed), maintained in ``User.save()`` and indexed
+together with the branch for ``LIKE 'prefix%'`` range scans. A lookup runs
+one short, limited index scan per key. Results are cached per branch for
+``AUTOCOMPLETE_CACHE_TTL`` seconds; every user change in a branch (the old
+and the new one when a user moves) replaces that branch's cache version, so
+stale entries are never read. An unreachable cache only costs the caching.
+"""
+import hashlib
+import secrets
+import unicodedata
+
+from django.conf import settings
+
+from . import caching
+
+SEARCH_KEYS = ('search_email', 'search_name', 'search_last')
+ALL_BRANCHES = 'all'
+
+
+def normalize(text):
+    """``'  José  Núñez '`` -> ``'jose nunez'``"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def search_keys(email, first_name, last_name):
+    """Values of the normalized search columns"""
+    return {
+        'search_email': normalize(email)[:254],
+        'search_name': normalize(f'{first_name} {last_name}')[:301],
+        'search_last': normalize(last_name)[:150],
+    }
+
+
+def _version_key(branch_id):
+    return f'gym_api:autocomplete:version:{branch_id}'
+
+
+def cache_version(branch_id):
+    return caching.call('default', 'get_or_set', _version_key(branch_id), 1, timeout=None)
+
+
+def invalidate(*branch_ids):
+    """Drop the cached results of the branches (and the cross-branch ones)"""
+    version = secrets.token_hex(8)
+    keys = {_version_key(branch_id) for branch_id in {*branch_ids, ALL_BRANCHES}}
+    caching.call('default', 'set_many', dict.fromkeys(keys, version), timeout=None)
+
+
+def _cache_key(branch_id, role, limit, term):
+    digest = hashlib.sha1(term.encode()).hexdigest()
+    return f'gym_api:autocomplete:{branch_id}:{cache_version(branch_id)}:{role}:{limit}:{digest}'
+
+
+def autocomplete(queryset, term, limit, branch_id=ALL_BRANCHES, role=''):
+    """
+    Up to ``limit`` users of ``queryset`` whose email, full name or last name
+    starts with ``term``; email matches first, then name matches.
+    """
+    term = normalize(term)
+    if not term:
+        return []
+    key = _cache_key(branch_id, role, limit, term)
+    results = caching.call('default', 'get', key)
+    if results is not None:
+        return results
+
+    results = []
+    seen = set()
+    for field in SEARCH_KEYS:
+        rows = (
+            queryset.filter(**{f'{field}__startswith': term})
+            .exclude(id__in=seen)
+            .order_by(field, 'id')
+            .values('id', 'email', 'first_name', 'last_name', 'role', 'gym_branch')[:limit - len(results)]
+        )
+        for row in rows:
+            seen.add(row['id'])
+            results.append(row)
+        if len(results) >= limit:
+            break
+    caching.call('default', 'set', key, results, getattr(settings, 'AUTOCOMPLETE_CACHE_TTL', 30))
+    return results
@@ -1,11 +1,84 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import User, GymBranch, WorkoutPlan, WorkoutTask, ActivityLog
+from .models import (
+    User, GymBranch, WorkoutPlan, WorkoutTask, RecurringTask, ArchivedWorkoutTask, TrainerAssignment, ActivityLog,
+    SlowQuery, WebhookSubscription,
+)
+from .recurrence import parse_weekdays, weekday_names
+from .throttling import is_known_failure, remember_failure
+from . import webhooks
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from datetime import timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 
-class UserSerializer(serializers.ModelSerializer):
+def parse_field_list(request, param):
+    """Comma separated query parameter as a list, or None when absent"""
+    if request is None or param not in request.query_params:
+        return None
+    return [name.strip() for name in request.query_params[param].split(',') if name.strip()]
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets (``?fields=id,status``) and opt-in nested objects (``?expand=member``).
+
+    Without either parameter the full representation is returned. With one of
+    them, only the listed fields are kept and the nested objects declared in
+    ``Meta.expandable_fields`` are only included when expanded (by field or
+    relation name) or listed in ``fields``. Write requests are never filtered.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        fields = parse_field_list(request, 'fields')
+        expand = parse_field_list(request, 'expand')
+        if fields is None and expand is None:
+            return
+
+        expandable = self.get_expandable_fields()
+        expand = set(expand or ())
+        expanded = {
+            name for name, (relation, _) in expandable.items()
+            if name in expand or relation in expand
+        }
+        if fields is None:
+            keep = {name for name in self.fields if name not in expandable}
+        else:
+            keep = set(fields)
+        keep |= expanded
+
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_expandable_fields(cls):
+        """
+        Map of expandable field name to ``(relation, columns)``.
+
+        A plain relation name marks a nested serializer. A ``(relation, columns)``
+        pair marks a method field that returns those columns of the related
+        object as a dict (or None), which lets querysets and the values reader
+        load exactly those columns.
+        """
+        declared = getattr(getattr(cls, 'Meta', None), 'expandable_fields', {})
+        expandable = {}
+        for name, spec in declared.items():
+            if isinstance(spec, str):
+                expandable[name] = (spec, None)
+            else:
+                expandable[name] = (spec[0], tuple(spec[1]))
+        return expandable
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Basic user serializer"""
     class Meta:
         model = User
@@ -13,14 +86,21 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'id']
 
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Detailed user serializer with gym branch info"""
     gym_branch_detail = serializers.SerializerMethodField()
+    trainer = serializers.SerializerMethodField()
     
     class Meta:
         model = User
-        fields = ['id', 'email', 'first_name', 'last_name', 'role', 'gym_branch', 'gym_branch_detail', 'is_active', 'created_at']
+        fields = [
+            'id', 'email', 'first_name', 'last_name', 'role', 'gym_branch', 'gym_branch_detail', 'trainer',
+            'is_active', 'created_at'
+        ]
         read_only_fields = ['created_at', 'id']
+        expandable_fields = {
+            'gym_branch_detail': ('gym_branch', ['id', 'name', 'location']),
+        }
     
     def get_gym_branch_detail(self, obj):
         if obj.gym_branch:
@@ -30,6 +110,12 @@ class UserDetailSerializer(serializers.ModelSerializer):
                 'location': obj.gym_branch.location
             }
         return None
+    
+    def get_trainer(self, obj):
+        """Id of the member's assigned trainer"""
+        if obj.role != 'member':
+            return None
+        return TrainerAssignment.objects.filter(member=obj).values_list('trainer_id', flat=True).first()
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -85,7 +171,7 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
-class GymBranchSerializer(serializers.ModelSerializer):
+class GymBranchSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Gym branch serializer"""
     trainer_count = serializers.SerializerMethodField()
     member_count = serializers.SerializerMethodField()
@@ -102,15 +188,19 @@ class GymBranchSerializer(serializers.ModelSerializer):
         return User.objects.filter(role='member', gym_branch=obj).count()
 
 
-class WorkoutPlanSerializer(serializers.ModelSerializer):
+class WorkoutPlanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Workout plan serializer"""
     created_by_detail = UserSerializer(source='created_by', read_only=True)
     task_count = serializers.SerializerMethodField()
     
     class Meta:
         model = WorkoutPlan
-        fields = ['id', 'title', 'description', 'created_by', 'created_by_detail', 'gym_branch', 'task_count', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at', 'id', 'created_by']
+        fields = ['id', 'title', 'description', 'created_by', 'created_by_detail', 'gym_branch', 'task_count', 'created_at', 'updated_at',
+                  'version']
+        read_only_fields = ['created_at', 'updated_at', 'id', 'created_by', 'version']
+        expandable_fields = {
+            'created_by_detail': 'created_by',
+        }
     
     def get_task_count(self, obj):
         return obj.tasks.count()
@@ -149,7 +239,7 @@ class WorkoutPlanSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class WorkoutTaskSerializer(serializers.ModelSerializer):
+class WorkoutTaskSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Workout task serializer"""
     member_detail = UserSerializer(source='member', read_only=True)
     created_by_detail = UserSerializer(source='created_by', read_only=True)
@@ -158,8 +248,15 @@ class WorkoutTaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = WorkoutTask
         fields = ['id', 'workout_plan', 'workout_plan_detail', 'member', 'member_detail', 
-                  'status', 'due_date', 'created_by', 'created_by_detail', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at', 'id', 'created_by']
+                  'status', 'due_date', 'completed_at', 'created_by', 'created_by_detail', 'recurrence',
+                  'occurrence_date', 'created_at', 'updated_at', 'version']
+        read_only_fields = ['created_at', 'updated_at', 'id', 'created_by', 'completed_at', 'recurrence',
+                            'occurrence_date', 'version']
+        expandable_fields = {
+            'member_detail': 'member',
+            'created_by_detail': 'created_by',
+            'workout_plan_detail': ('workout_plan', ['id', 'title', 'description']),
+        }
     
     def get_workout_plan_detail(self, obj):
         return {
@@ -178,20 +275,113 @@ class WorkoutTaskSerializer(serializers.ModelSerializer):
         workout_plan = data.get('workout_plan')
         
         if member and workout_plan:
-            if member.gym_branch != workout_plan.gym_branch:
+            if member.gym_branch_id != workout_plan.gym_branch_id:
                 raise serializers.ValidationError("Member must be from the same gym branch as the workout plan")
         
         return data
 
 
+class ArchivedWorkoutTaskSerializer(serializers.ModelSerializer):
+    """Archived workout task serializer, same ids and fields as the live task"""
+    recurrence = serializers.IntegerField(source='recurrence_id', read_only=True)
+    
+    class Meta:
+        model = ArchivedWorkoutTask
+        fields = ['id', 'workout_plan', 'member', 'status', 'due_date', 'completed_at', 'created_by',
+                  'recurrence', 'occurrence_date', 'created_at', 'updated_at', 'archived_at']
+        read_only_fields = fields
+
+
+class WeekdaysField(serializers.Field):
+    """Weekday bitmask exposed as a list of names (``["mon", "wed", "fri"]``)"""
+    
+    def to_representation(self, value):
+        return weekday_names(value)
+    
+    def to_internal_value(self, data):
+        if not isinstance(data, list) or not data:
+            raise serializers.ValidationError('Expected a non-empty list of weekdays, e.g. ["mon", "fri"]')
+        try:
+            return parse_weekdays(data)
+        except ValueError:
+            raise serializers.ValidationError(f'Weekdays must be among {", ".join(RecurringTask.WEEKDAYS)}')
+
+
+class WebhookSubscriptionSerializer(serializers.ModelSerializer):
+    """Webhook subscription; ``secret`` is generated and read-only"""
+    class Meta:
+        model = WebhookSubscription
+        fields = ['id', 'gym_branch', 'url', 'events', 'secret', 'is_active', 'created_by', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'secret', 'created_by', 'created_at', 'updated_at']
+        extra_kwargs = {'gym_branch': {'required': False}}
+    
+    def validate_url(self, value):
+        try:
+            webhooks.check_url(value)
+        except webhooks.UnsafeURL as e:
+            raise serializers.ValidationError(str(e))
+        return value
+    
+    def validate_events(self, value):
+        if not isinstance(value, list) or not value:
+            raise serializers.ValidationError('Subscribe to at least one event')
+        unknown = set(value) - set(dict(WebhookSubscription.EVENT_CHOICES))
+        if unknown:
+            raise serializers.ValidationError(f'Unknown events: {", ".join(sorted(map(str, unknown)))}')
+        return sorted(set(value))
+
+
+class RecurringTaskSerializer(serializers.ModelSerializer):
+    """Recurring task serializer; ``weeks`` can be given instead of ``end_date``"""
+    weekdays = WeekdaysField()
+    weeks = serializers.IntegerField(write_only=True, required=False, min_value=1)
+    
+    class Meta:
+        model = RecurringTask
+        fields = ['id', 'workout_plan', 'member', 'weekdays', 'time_of_day', 'timezone',
+                  'start_date', 'end_date', 'weeks', 'created_by', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
+        extra_kwargs = {'end_date': {'required': False}}
+    
+    def validate_timezone(self, value):
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError(f'Unknown time zone: {value}')
+        return value
+    
+    def validate(self, data):
+        weeks = data.pop('weeks', None)
+        if weeks is not None:
+            data['end_date'] = data['start_date'] + timedelta(weeks=weeks, days=-1)
+        if 'end_date' not in data:
+            raise serializers.ValidationError('Either end_date or weeks is required')
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError('end_date must not be before start_date')
+        max_weeks = getattr(settings, 'RECURRING_TASK_MAX_WEEKS', 52)
+        if data['end_date'] - data['start_date'] >= timedelta(weeks=max_weeks):
+            raise serializers.ValidationError(f'A recurring task cannot span more than {max_weeks} weeks')
+        
+        if data['member'].role != 'member':
+            raise serializers.ValidationError('Recurring tasks can only be assigned to members')
+        if data['member'].gym_branch_id != data['workout_plan'].gym_branch_id:
+            raise serializers.ValidationError("Member must be from the same gym branch as the workout plan")
+        return data
+    
+    def create(self, validated_data):
+        validated_data['created_by'] = self.context['request'].user
+        return super().create(validated_data)
+
+
 class WorkoutTaskUpdateSerializer(serializers.ModelSerializer):
     """Serializer for updating task status"""
     class Meta:
         model = WorkoutTask
-        fields = ['status']
+        fields = ['status', 'version']
+        read_only_fields = ['version']
 
 
-class ActivityLogSerializer(serializers.ModelSerializer):
+class ActivityLogSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Activity log serializer"""
     class Meta:
         model = ActivityLog
@@ -199,6 +389,15 @@ class ActivityLogSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class SlowQuerySerializer(serializers.ModelSerializer):
+    """Slow query summary serializer"""
+    class Meta:
+        model = SlowQuery
+        fields = ['id', 'fingerprint', 'normalized_sql', 'sample_sql', 'view', 'frame', 'explain',
+                  'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen']
+        read_only_fields = fields
+
+
 class LoginSerializer(serializers.Serializer):
     """Login serializer"""
     email = serializers.EmailField()
@@ -213,7 +412,12 @@ class LoginSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError("Invalid email or password")
         
+        # identical retries of a failed attempt skip the password hasher
+        if is_known_failure(email, password, user.password):
+            raise serializers.ValidationError("Invalid email or password")
+        
         if not user.check_password(password):
+            remember_failure(email, password, user.password)
             raise serializers.ValidationError("Invalid email or password")
         
         if not user.is_active:
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import archive, assignments, leaderboard, rollups, search, webhooks
+from .models import ActivityLog, User, WorkoutPlan, WorkoutTask
+from .sync import record_tombstone
+
+
+@receiver(post_delete, sender=WorkoutTask)
+def workout_task_deleted(sender, instance, **kwargs):
+    if archive.in_progress():
+        # moved to the archive, not gone
+        return
+    record_tombstone(instance, branch_id=instance.gym_branch_id, owner_id=instance.member_id)
+    leaderboard.record_deletion(instance)
+
+
+@receiver(post_save, sender=WorkoutTask)
+def workout_task_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        leaderboard.record_completion(
+            instance,
+            getattr(instance, '_previous_completed_at', None),
+            getattr(instance, '_previous_gym_branch_id', None),
+        )
+        webhooks.task_saved(instance, created)
+
+
+@receiver(post_delete, sender=WorkoutPlan)
+def workout_plan_deleted(sender, instance, origin=None, **kwargs):
+    record_tombstone(instance, branch_id=instance.gym_branch_id, owner_id=instance.created_by_id)
+    webhooks.plan_deleted(instance, origin)
+
+
+@receiver(post_save, sender=WorkoutPlan)
+def workout_plan_saved(sender, instance, created=False, raw=False, **kwargs):
+    if not raw:
+        webhooks.plan_saved(instance, created)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    record_tombstone(instance, branch_id=instance.gym_branch_id, owner_id=instance.pk)
+    search.invalidate(instance.gym_branch_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # logins only touch last_login, which autocomplete results do not include
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        search.invalidate(instance.gym_branch_id, getattr(instance, '_previous_gym_branch_id', None))
+    if created:
+        if instance.role == 'member' and instance.gym_branch_id and getattr(settings, 'TRAINER_AUTO_ASSIGN', True):
+            assignments.schedule(instance)
+    elif update_fields is None or {'role', 'gym_branch', 'is_active'} & set(update_fields):
+        assignments.drop_stale(instance)
+
+
+@receiver(post_save, sender=ActivityLog)
+def activity_logged(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        rollups.record(instance)
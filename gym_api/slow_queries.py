@@ -0,0 +1,175 @@
+"""
+Sampled slow query log.
+
+``SlowQueryRecorder`` is installed as a database execute wrapper for the
+duration of a request. It times every statement, samples the ones slower than
+``SLOW_QUERY_THRESHOLD_MS`` and captures their EXPLAIN plan. Samples are
+written at the end of the request as JSON lines to the ``gym_api.slow_queries``
+logger (a rotating file, see ``settings.LOGGING``) and aggregated per SQL
+fingerprint in the ``SlowQuery`` table shown in the admin.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+logger = logging.getLogger('gym_api.slow_queries')
+
+_state = threading.local()
+
+_GYM_API_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {
+    os.path.join(_GYM_API_DIR, name)
+    for name in ('slow_queries.py', 'middleware.py', 'instrumentation.py')
+}
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+_COMMENT_RE = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Replace literals and placeholders so equivalent statements compare equal"""
+    sql = _COMMENT_RE.sub(' ', sql)
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('in (...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip().lower()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize_sql(sql).encode()).hexdigest()
+
+
+def _app_frame():
+    """Innermost stack frame inside gym_api, e.g. ``gym_api/views.py:120 in create``"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(_GYM_API_DIR) and filename not in _SKIP_FILES:
+            relative = os.path.relpath(filename, os.path.dirname(_GYM_API_DIR))
+            return f'{relative}:{frame.lineno} in {frame.name}'
+    return ''
+
+
+def _explain(conn, sql, params):
+    prefix = EXPLAIN_PREFIXES.get(conn.vendor)
+    if prefix is None or not sql.lstrip().lower().startswith('select'):
+        return ''
+    try:
+        with transaction.atomic(using=conn.alias):
+            with conn.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as exc:
+        return f'EXPLAIN failed: {exc}'
+    return '\n'.join(' '.join(str(col) for col in row) for row in rows)
+
+
+class SlowQueryRecorder:
+    """Execute wrapper collecting sampled slow queries for one request"""
+
+    def __init__(self):
+        self.threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200)
+        self.sample_rate = getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+        self.max_samples = getattr(settings, 'SLOW_QUERY_MAX_PER_REQUEST', 20)
+        self.samples = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_state, 'capturing', False):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if (
+            elapsed_ms >= self.threshold_ms
+            and len(self.samples) < self.max_samples
+            and random.random() < self.sample_rate
+        ):
+            _state.capturing = True
+            try:
+                self.samples.append({
+                    'fingerprint': fingerprint(sql),
+                    'normalized_sql': normalize_sql(sql),
+                    'sql': sql,
+                    'duration_ms': round(elapsed_ms, 3),
+                    'many': many,
+                    'frame': _app_frame(),
+                    'explain': '' if many else _explain(context['connection'], sql, params),
+                })
+            finally:
+                _state.capturing = False
+        return result
+
+    def flush(self, view=''):
+        """Write the collected samples to the log file and the summary table"""
+        if not self.samples:
+            return
+        from .models import SlowQuery
+
+        samples, self.samples = self.samples, []
+        _state.capturing = True
+        try:
+            for sample in samples:
+                sample['view'] = view
+                logger.info(json.dumps({'timestamp': timezone.now().isoformat(), **sample}))
+                try:
+                    _store(SlowQuery, sample)
+                except DatabaseError:
+                    logger.exception('Could not store slow query %s', sample['fingerprint'])
+        finally:
+            _state.capturing = False
+
+
+def _store(model, sample):
+    duration = sample['duration_ms']
+    changes = {
+        'count': F('count') + 1,
+        'total_ms': F('total_ms') + duration,
+        'max_ms': Greatest(F('max_ms'), duration),
+        'last_seen': timezone.now(),
+        'sample_sql': sample['sql'],
+        'view': sample['view'][:200],
+        'frame': sample['frame'][:255],
+        'explain': sample['explain'],
+    }
+    if model.objects.filter(fingerprint=sample['fingerprint']).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(
+                fingerprint=sample['fingerprint'],
+                normalized_sql=sample['normalized_sql'],
+                sample_sql=sample['sql'],
+                view=sample['view'][:200],
+                frame=sample['frame'][:255],
+                explain=sample['explain'],
+                count=1,
+                total_ms=duration,
+                max_ms=duration,
+            )
+    except IntegrityError:
+        # another worker inserted the same fingerprint first
+        model.objects.filter(fingerprint=sample['fingerprint']).update(**changes)
@@ -0,0 +1,176 @@
+"""
+Delta sync for offline clients.
+
+A sync cursor is an opaque, URL-safe token holding two keyset positions: the
+last ``(updated_at, id)`` of changed rows the client has seen and the last
+``(deleted_at, id)`` of tombstones. Each call reads forward from both
+positions through ``updated_at``/``deleted_at`` indexes, so its cost is
+proportional to the number of changes, not to the size of the table.
+
+Rows changed in the last ``SYNC_SETTLE_SECONDS`` are held back until the next
+call, so transactions that commit slightly out of timestamp order are not
+skipped. Deletes are recorded as ``Tombstone`` rows by ``post_delete``
+signals, cascades included, and kept for ``SYNC_TOMBSTONE_RETENTION_DAYS``;
+cursors older than that can no longer be served and need a full resync.
+"""
+import base64
+import json
+import threading
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Tombstone
+
+_local = threading.local()
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class ExpiredCursor(Exception):
+    pass
+
+
+class SyncCursor:
+    """Keyset positions of the changed rows and tombstones a client has seen"""
+
+    def __init__(self, changed=None, deleted=None, issued_at=None):
+        self.changed = changed
+        self.deleted = deleted
+        self.issued_at = issued_at
+
+    def encode(self):
+        payload = {
+            'c': _encode_position(self.changed),
+            'd': _encode_position(self.deleted),
+            't': self.issued_at.isoformat(),
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, value):
+        """Parse a cursor token; a plain ISO 8601 timestamp is accepted as well"""
+        moment = _parse_moment(value)
+        if moment is not None:
+            return cls((moment, 0), (moment, 0), moment)
+        try:
+            raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            payload = json.loads(raw)
+            return cls(
+                _decode_position(payload['c']),
+                _decode_position(payload['d']),
+                _parse_moment(payload['t'], required=True),
+            )
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor(value)
+
+
+def _parse_moment(value, required=False):
+    try:
+        moment = parse_datetime(value)
+    except (TypeError, ValueError):
+        moment = None
+    if moment is None:
+        if required:
+            raise InvalidCursor(value)
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def _encode_position(position):
+    if position is None:
+        return None
+    moment, pk = position
+    return [moment.isoformat(), pk]
+
+
+def _decode_position(value):
+    if value is None:
+        return None
+    moment, pk = value
+    return _parse_moment(moment, required=True), int(pk)
+
+
+def _after(position, time_field):
+    moment, pk = position
+    return Q(**{f'{time_field}__gt': moment}) | Q(**{time_field: moment, 'id__gt': pk})
+
+
+def _read_forward(queryset, position, time_field, upper_bound, limit):
+    queryset = queryset.filter(**{f'{time_field}__lte': upper_bound})
+    if position is not None:
+        queryset = queryset.filter(_after(position, time_field))
+    rows = list(queryset.order_by(time_field, 'id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def read_changes(queryset, tombstones, cursor, limit):
+    """
+    Rows changed and ids deleted after ``cursor`` (a ``SyncCursor`` or None
+    for a first sync), plus the cursor to send next and a ``has_more`` flag.
+    """
+    now = timezone.now()
+    upper_bound = now - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+
+    if cursor is None:
+        # first sync: the client starts empty, so earlier deletes are irrelevant
+        cursor = SyncCursor(None, (upper_bound, 0), now)
+    else:
+        retention = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+        if cursor.issued_at < now - retention:
+            raise ExpiredCursor()
+
+    rows, more_rows = _read_forward(queryset, cursor.changed, 'updated_at', upper_bound, limit)
+    deleted, more_deleted = _read_forward(
+        tombstones.only('id', 'object_id', 'deleted_at'), cursor.deleted, 'deleted_at', upper_bound, limit
+    )
+
+    next_cursor = SyncCursor(
+        (rows[-1].updated_at, rows[-1].id) if rows else cursor.changed,
+        (deleted[-1].deleted_at, deleted[-1].id) if deleted else cursor.deleted,
+        now,
+    )
+    return rows, [tombstone.object_id for tombstone in deleted], next_cursor, more_rows or more_deleted
+
+
+def tombstones_for(model):
+    return Tombstone.objects.filter(model_name=model._meta.label_lower)
+
+
+def record_tombstone(instance, branch_id=None, owner_id=None):
+    if getattr(_local, 'suppressed', 0):
+        return
+    Tombstone.objects.create(
+        model_name=instance._meta.label_lower,
+        object_id=instance.pk,
+        branch_id=branch_id,
+        owner_id=owner_id,
+    )
+
+
+@contextmanager
+def tombstones_suppressed():
+    """Delete rows in this thread without recording tombstones"""
+    _local.suppressed = getattr(_local, 'suppressed', 0) + 1
+    try:
+        yield
+    finally:
+        _local.suppressed -= 1
+
+
+def purge_tombstones(older_than=None):
+    """Delete tombstones past the retention window, return how many were removed"""
+    if older_than is None:
+        days = getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30)
+        older_than = timezone.now() - timedelta(days=days)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=older_than).delete()
+    return deleted
@@ -12,6 +12,16 @@ def api_client():
     return APIClient()
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # throttle buckets and cached counts must not leak between tests
+    from django.core.cache import caches
+    from gym_api import caching
+    caches['default'].clear()
+    caches['local'].clear()
+    caching.reset()
+
+
 @pytest.fixture
 def super_admin(db):
     return User.objects.create_user(
@@ -264,3 +274,1756 @@ class TestWorkoutTasks:
         assert response.status_code == 200
         task.refresh_from_db()
         assert task.status == 'completed'
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    """Test the Prometheus metrics endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def metrics_dir(self, settings, tmp_path):
+        from gym_api.metrics import registry
+        settings.METRICS_DIR = str(tmp_path)
+        settings.METRICS_AUTH_TOKEN = 'scrape-secret'
+        registry.reset()
+        yield tmp_path
+        registry.reset()
+
+    def test_request_is_recorded_per_action_and_role(self, api_client, member):
+        api_client.force_authenticate(user=member)
+        api_client.get('/api/v1/workout-tasks/')
+
+        response = api_client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        body = response.content.decode()
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        assert 'gym_http_requests_total{action="workouttask-list",role="member",status="200"} 1' in body
+        assert 'gym_http_request_duration_seconds_count{action="workouttask-list",role="member"} 1' in body
+        assert 'gym_db_queries_per_request_bucket{action="workouttask-list",role="member",le="+Inf"} 1' in body
+
+    def test_samples_from_other_workers_are_merged(self, api_client, metrics_dir):
+        import json
+        (metrics_dir / 'metrics_999999.json').write_text(json.dumps([
+            ['gym_http_requests_total', [['action', 'login'], ['role', 'anonymous'], ['status', '200']], 3.0],
+        ]))
+        body = api_client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').content.decode()
+        assert 'gym_http_requests_total{action="login",role="anonymous",status="200"} 3' in body
+
+    def test_token_is_required(self, api_client, settings):
+        assert api_client.get('/metrics').status_code == 401
+        assert api_client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code == 401
+        response = api_client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        assert response.status_code == 200
+
+    def test_endpoint_is_off_without_a_token(self, api_client, settings):
+        settings.METRICS_AUTH_TOKEN = ''
+        assert api_client.get('/metrics').status_code == 404
+
+
+@pytest.mark.django_db
+class TestSlowQueryLog:
+    """Test the sampled slow query log"""
+
+    def test_fingerprint_ignores_literals_and_in_lists(self):
+        from gym_api.slow_queries import fingerprint, normalize_sql
+        first = "SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'bob' LIMIT 20"
+        second = "select *  from t where id in (%s) and name = 'alice' limit 5"
+        assert fingerprint(first) == fingerprint(second)
+        assert normalize_sql(first) == 'select * from t where id in (...) and name = ? limit ?'
+
+    def test_slow_queries_are_summarised_with_view_and_plan(self, api_client, settings, member, tmp_path):
+        from gym_api.models import SlowQuery
+        settings.SLOW_QUERY_THRESHOLD_MS = 0
+        settings.METRICS_DIR = str(tmp_path)
+        api_client.force_authenticate(user=member)
+        response = api_client.get('/api/v1/workout-tasks/', {'search': 'plan'})
+        assert response.status_code == 200
+
+        task_query = SlowQuery.objects.filter(normalized_sql__contains='gym_api_workouttask').first()
+        assert task_query is not None
+        assert task_query.view == 'workouttask-list'
+        assert task_query.count >= 1
+        assert task_query.explain
+
+    def test_only_super_admin_can_list_slow_queries(self, api_client, super_admin, member):
+        api_client.force_authenticate(user=member)
+        assert api_client.get('/api/v1/slow-queries/').status_code == 403
+        api_client.force_authenticate(user=super_admin)
+        assert api_client.get('/api/v1/slow-queries/').status_code == 200
+
+
+@pytest.mark.django_db
+class TestRequestProfiling:
+    """Test on-demand request profiling"""
+
+    @pytest.fixture(autouse=True)
+    def profile_dir(self, settings, tmp_path):
+        settings.PROFILE_DIR = str(tmp_path / 'profiles')
+        settings.METRICS_DIR = str(tmp_path / 'metrics')
+        return tmp_path / 'profiles'
+
+    def _bearer(self, user):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+    def test_super_admin_can_profile_a_request(self, api_client, super_admin, profile_dir):
+        response = api_client.get(
+            '/api/v1/gym-branches/',
+            HTTP_AUTHORIZATION=self._bearer(super_admin),
+            HTTP_X_PROFILE='1'
+        )
+        assert response.status_code == 200
+        profile_id = response['X-Profile-Id']
+        assert (profile_dir / f'{profile_id}.collapsed').exists()
+
+        api_client.force_authenticate(user=super_admin)
+        listing = api_client.get('/api/v1/profiles/')
+        assert listing.status_code == 200
+        assert listing.data[0]['id'] == profile_id
+        assert listing.data[0]['path'] == '/api/v1/gym-branches/'
+        download = api_client.get(f'/api/v1/profiles/{profile_id}/')
+        assert download.status_code == 200
+
+    def test_flag_is_ignored_for_other_roles(self, api_client, member, profile_dir):
+        response = api_client.get(
+            '/api/v1/workout-tasks/?_profile=1',
+            HTTP_AUTHORIZATION=self._bearer(member)
+        )
+        assert response.status_code == 200
+        assert 'X-Profile-Id' not in response
+        assert not profile_dir.exists()
+
+    def test_members_cannot_list_profiles(self, api_client, member):
+        api_client.force_authenticate(user=member)
+        assert api_client.get('/api/v1/profiles/').status_code == 403
+
+
+@pytest.mark.django_db
+class TestServerTiming:
+    """Test the Server-Timing response header"""
+
+    def test_phases_are_reported_for_list_requests(self, api_client, member, workout_plan, settings, tmp_path):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        settings.METRICS_DIR = str(tmp_path)
+        WorkoutTask.objects.create(
+            workout_plan=workout_plan,
+            member=member,
+            due_date=datetime.now() + timedelta(days=1),
+            created_by=workout_plan.created_by
+        )
+        token = RefreshToken.for_user(member).access_token
+        response = api_client.get(
+            '/api/v1/workout-tasks/',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+            HTTP_ACCEPT='application/json'
+        )
+        assert response.status_code == 200
+        phases = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        assert phases == ['auth', 'perm', 'qs', 'serialize', 'render', 'db', 'total']
+
+    def test_header_can_be_disabled(self, api_client, settings):
+        settings.SERVER_TIMING_ENABLED = False
+        response = api_client.get('/api/v1/')
+        assert 'Server-Timing' not in response
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    """Test ?fields= and ?expand= on list endpoints"""
+
+    @pytest.fixture
+    def task(self, member, workout_plan):
+        return WorkoutTask.objects.create(
+            workout_plan=workout_plan,
+            member=member,
+            due_date=datetime.now() + timedelta(days=1),
+            created_by=workout_plan.created_by
+        )
+
+    def test_full_representation_without_parameters(self, api_client, member, task):
+        api_client.force_authenticate(user=member)
+        row = api_client.get('/api/v1/workout-tasks/').data['results'][0]
+        assert row['member_detail']['email'] == member.email
+        assert row['workout_plan_detail']['description'] == 'Test Description'
+
+    def test_sparse_fields_skip_joins_and_columns(self, api_client, member, task):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        api_client.force_authenticate(user=member)
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get('/api/v1/workout-tasks/', {'fields': 'id,status,due_date'})
+        assert set(response.data['results'][0]) == {'id', 'status', 'due_date'}
+        page_query = [q['sql'] for q in queries.captured_queries if 'LIMIT' in q['sql']][-1]
+        assert 'description' not in page_query
+        assert 'gym_api_user' not in page_query
+
+    def test_expand_includes_nested_object_with_one_query(self, api_client, member, task, django_assert_num_queries):
+        api_client.force_authenticate(user=member)
+        # no COUNT(*): a single, last page is counted from its rows
+        with django_assert_num_queries(1):
+            response = api_client.get('/api/v1/workout-tasks/', {'fields': 'id,status', 'expand': 'member'})
+        row = response.data['results'][0]
+        assert set(row) == {'id', 'status', 'member_detail'}
+        assert row['member_detail']['email'] == member.email
+
+
+@pytest.mark.django_db
+class TestValuesReader:
+    """Test the compiled values_list() read path"""
+
+    @pytest.fixture
+    def tasks(self, member, workout_plan):
+        WorkoutTask.objects.create(
+            workout_plan=workout_plan,
+            member=member,
+            status='in_progress',
+            due_date=datetime.now() + timedelta(days=1),
+            created_by=workout_plan.created_by
+        )
+        WorkoutTask.objects.create(
+            workout_plan=workout_plan,
+            member=member,
+            due_date=datetime.now() + timedelta(days=2),
+            created_by=None
+        )
+        return WorkoutTask.objects.order_by('id')
+
+    def _assert_identical(self, serializer_class, queryset):
+        from gym_api.fast_serializers import compile_reader
+        reader = compile_reader(serializer_class())
+        assert reader is not None
+        expected = serializer_class(queryset, many=True).data
+        assert reader.build_many(reader.prepare(queryset)) == expected
+
+    def test_task_output_is_identical(self, tasks):
+        from gym_api.serializers import WorkoutTaskSerializer
+        self._assert_identical(WorkoutTaskSerializer, tasks)
+
+    def test_user_and_activity_log_output_is_identical(self, member, gym_manager, super_admin):
+        from gym_api.models import ActivityLog
+        from gym_api.serializers import UserSerializer, ActivityLogSerializer
+        ActivityLog.objects.create(
+            user=member, action='update', model_name='WorkoutTask', object_id='1',
+            changes={'status': ['pending', 'completed']}
+        )
+        self._assert_identical(UserSerializer, User.objects.order_by('id'))
+        self._assert_identical(ActivityLogSerializer, ActivityLog.objects.order_by('id'))
+
+    def test_unsupported_method_fields_fall_back(self):
+        from gym_api.fast_serializers import compile_reader
+        from gym_api.serializers import GymBranchSerializer
+        assert compile_reader(GymBranchSerializer()) is None
+
+    def test_compiled_readers_are_bounded(self, api_client, trainer, tasks, settings):
+        from gym_api import fast_serializers
+        settings.VALUES_READER_CACHE_SIZE = 2
+        fast_serializers._cache.clear()
+        api_client.force_authenticate(user=trainer)
+        for fields in ('id', 'id,status', 'id,status,due_date', 'id,nonsense', 'id,status,nonsense'):
+            assert api_client.get('/api/v1/workout-tasks/', {'fields': fields}).status_code == 200
+        # unknown names do not make new keys, and old ones are evicted
+        assert len(fast_serializers._cache) == 2
+        assert [fields for _, fields in fast_serializers._cache] == [('id',), ('id', 'status')]
+
+    def test_list_endpoint_matches_serializer_path(self, api_client, trainer, tasks, settings):
+        api_client.force_authenticate(user=trainer)
+        fast = api_client.get('/api/v1/workout-tasks/', {'ordering': 'due_date'}).json()
+        settings.VALUES_READER_ENABLED = False
+        slow = api_client.get('/api/v1/workout-tasks/', {'ordering': 'due_date'}).json()
+        assert fast == slow
+        assert len(fast['results']) == 2
+
+
+class TestCompression:
+    """Test response compression"""
+
+    def _response(self, body=b'', streaming=None, status=200, content_type='application/json'):
+        from django.http import HttpResponse, StreamingHttpResponse
+        if streaming is not None:
+            return StreamingHttpResponse(streaming, status=status, content_type=content_type)
+        return HttpResponse(body, status=status, content_type=content_type)
+
+    def _request(self, accept_encoding):
+        from django.test import RequestFactory
+        return RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+
+    def test_negotiates_by_q_value(self):
+        from gym_api.compression import choose_encoding
+        assert choose_encoding('gzip;q=0.5, deflate') == 'deflate'
+        assert choose_encoding('identity') is None
+        assert choose_encoding('gzip;q=0, *;q=0.1') == 'deflate'
+
+    def test_large_body_is_gzipped(self):
+        import gzip
+        from gym_api.compression import compress_response
+        body = b'{"results": [' + b'{"status": "pending"},' * 200 + b'{}]}'
+        response = compress_response(self._request('gzip'), self._response(body))
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert gzip.decompress(response.content) == body
+        assert int(response['Content-Length']) == len(response.content)
+
+    def test_small_bodies_and_304_are_skipped(self, settings):
+        from gym_api.compression import compress_response
+        settings.COMPRESSION_MIN_SIZE = 100
+        small = compress_response(self._request('gzip'), self._response(b'{}'))
+        assert not small.has_header('Content-Encoding')
+        not_modified = compress_response(self._request('gzip'), self._response(b'x' * 500, status=304))
+        assert not not_modified.has_header('Content-Encoding')
+
+    def test_html_pages_are_not_compressed(self):
+        from gym_api.compression import compress_response
+        body = b'<input name="csrfmiddlewaretoken" value="secret">' + b'<p>page</p>' * 200
+        response = compress_response(self._request('gzip'), self._response(body, content_type='text/html'))
+        assert not response.has_header('Content-Encoding')
+
+    def test_streaming_chunks_are_flushed_without_buffering(self):
+        import zlib
+        from gym_api.compression import compress_response
+        chunks = [b'data: first\n\n', b'data: second\n\n']
+        response = compress_response(
+            self._request('deflate'), self._response(streaming=iter(chunks), content_type='text/event-stream')
+        )
+        assert response['Content-Encoding'] == 'deflate'
+        decompressor = zlib.decompressobj()
+        stream = iter(response.streaming_content)
+        # each chunk can be decoded as soon as it is produced
+        assert decompressor.decompress(next(stream)) == chunks[0]
+        assert decompressor.decompress(next(stream)) == chunks[1]
+
+
+@pytest.mark.django_db
+class TestDeltaSync:
+    """Test delta sync endpoints and tombstones"""
+    
+    @pytest.fixture(autouse=True)
+    def no_settle_delay(self, settings):
+        settings.SYNC_SETTLE_SECONDS = 0
+    
+    def _task(self, workout_plan, member, trainer):
+        return WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer,
+            due_date=datetime.now() + timedelta(days=1)
+        )
+    
+    def test_sync_returns_only_changes_since_cursor(self, api_client, trainer, member, workout_plan):
+        first = self._task(workout_plan, member, trainer)
+        second = self._task(workout_plan, member, trainer)
+        api_client.force_authenticate(user=member)
+        
+        response = api_client.get('/api/v1/workout-tasks/sync/')
+        assert response.status_code == 200
+        assert [row['id'] for row in response.data['results']] == [first.id, second.id]
+        assert response.data['has_more'] is False
+        cursor = response.data['cursor']
+        
+        response = api_client.get('/api/v1/workout-tasks/sync/', {'updated_since': cursor})
+        assert response.data['results'] == []
+        
+        first.status = 'completed'
+        first.save()
+        response = api_client.get('/api/v1/workout-tasks/sync/', {'updated_since': cursor})
+        assert [row['id'] for row in response.data['results']] == [first.id]
+    
+    def test_cascade_deletes_are_reported(self, api_client, trainer, member, workout_plan):
+        task = self._task(workout_plan, member, trainer)
+        api_client.force_authenticate(user=trainer)
+        cursor = api_client.get('/api/v1/workout-tasks/sync/').data['cursor']
+        plan_cursor = api_client.get('/api/v1/workout-plans/sync/').data['cursor']
+        plan_id = workout_plan.id
+        
+        workout_plan.delete()
+        
+        response = api_client.get('/api/v1/workout-tasks/sync/', {'updated_since': cursor})
+        assert response.data['deleted'] == [task.id]
+        response = api_client.get('/api/v1/workout-plans/sync/', {'updated_since': plan_cursor})
+        assert response.data['deleted'] == [plan_id]
+    
+    def test_tombstones_are_scoped_to_the_member(self, api_client, trainer, member, workout_plan, gym_branch):
+        other = User.objects.create_user(
+            email='other@test.com', username='other', password='test123',
+            role='member', gym_branch=gym_branch
+        )
+        task = self._task(workout_plan, other, trainer)
+        api_client.force_authenticate(user=member)
+        cursor = api_client.get('/api/v1/workout-tasks/sync/').data['cursor']
+        
+        task.delete()
+        
+        response = api_client.get('/api/v1/workout-tasks/sync/', {'updated_since': cursor})
+        assert response.data['deleted'] == []
+    
+    def test_pages_through_changes(self, api_client, gym_manager, trainer, member):
+        api_client.force_authenticate(user=gym_manager)
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {'page_size': 1}
+            if cursor:
+                params['updated_since'] = cursor
+            response = api_client.get('/api/v1/users/sync/', params)
+            seen += [row['id'] for row in response.data['results']]
+            cursor = response.data['cursor']
+            if not response.data['has_more']:
+                break
+        assert sorted(seen) == sorted([gym_manager.id, trainer.id, member.id])
+    
+    def test_invalid_and_expired_cursors(self, api_client, member):
+        from django.utils import timezone
+        api_client.force_authenticate(user=member)
+        
+        response = api_client.get('/api/v1/workout-tasks/sync/', {'updated_since': 'not-a-cursor'})
+        assert response.status_code == 400
+        
+        expired = (timezone.now() - timedelta(days=90)).isoformat()
+        response = api_client.get('/api/v1/workout-tasks/sync/', {'updated_since': expired})
+        assert response.status_code == 410
+    
+    def test_views_must_scope_tombstones(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from rest_framework import viewsets
+        from gym_api.mixins import DeltaSyncMixin
+        
+        with pytest.raises(ImproperlyConfigured):
+            class UnscopedViewSet(DeltaSyncMixin, viewsets.ReadOnlyModelViewSet):
+                queryset = WorkoutTask.objects.all()
+
+
+class TestTaskEvents:
+    """Test the task event broker and stream"""
+    
+    def _collect(self, settings, matches, events_to_publish, count):
+        import asyncio
+        from gym_api.events import LocalBroker, stream
+        settings.EVENTS_HEARTBEAT_SECONDS = 0.05
+        settings.EVENTS_MAX_DURATION = 1
+        broker = LocalBroker()
+        
+        async def run():
+            body = stream(matches, broker)
+            chunks = [await body.__anext__()]
+            for event in events_to_publish:
+                broker.publish(event)
+            while len(chunks) < count + 1:
+                chunk = await body.__anext__()
+                if not chunk.startswith(b':'):
+                    chunks.append(chunk)
+            await body.aclose()
+            return chunks[1:]
+        return asyncio.run(run()), broker
+    
+    def test_events_are_filtered_by_scope(self, settings):
+        from gym_api.events import scope_for
+        trainer = User(id=1, role='trainer', gym_branch_id=7)
+        published = [
+            {'id': 1, 'type': 'task.created', 'branch': 8, 'member': 3},
+            {'id': 2, 'type': 'task.status_changed', 'branch': 7, 'member': 3},
+        ]
+        chunks, broker = self._collect(settings, scope_for(trainer), published, 1)
+        assert chunks[0].startswith(b'id: 2\nevent: task.status_changed\n')
+        assert broker._subscriptions == set()
+    
+    def test_slow_consumer_gets_overflow_and_is_dropped(self, settings):
+        settings.EVENTS_QUEUE_SIZE = 2
+        published = [{'id': i, 'type': 'task.created', 'branch': 1, 'member': 1} for i in range(5)]
+        chunks, broker = self._collect(settings, lambda event: True, published, 1)
+        assert b'event: overflow' in chunks[0]
+    
+    def test_streams_are_off_by_default(self, api_client, member):
+        assert api_client.get('/api/v1/workout-tasks/events/').status_code == 404
+        api_client.force_authenticate(user=member)
+        assert api_client.post('/api/v1/workout-tasks/events/ticket/').status_code == 404
+    
+    def test_stream_requires_ticket_or_header(self, api_client, member, settings):
+        from django.test import RequestFactory
+        from rest_framework_simplejwt.tokens import RefreshToken
+        from gym_api.authentication import authenticate_event_stream
+        
+        settings.EVENTS_ENABLED = True
+        assert api_client.get('/api/v1/workout-tasks/events/').status_code == 401
+        # access tokens in the query string would end up in access logs
+        access = str(RefreshToken.for_user(member).access_token)
+        assert api_client.get('/api/v1/workout-tasks/events/', {'token': access}).status_code == 401
+        
+        api_client.force_authenticate(user=member)
+        response = api_client.post('/api/v1/workout-tasks/events/ticket/')
+        assert response.status_code == 201
+        request = RequestFactory().get('/api/v1/workout-tasks/events/', {'ticket': response.data['ticket']})
+        assert authenticate_event_stream(request) == member
+        assert authenticate_event_stream(request) is None
+
+
+@pytest.mark.django_db
+class TestTaskCalendar:
+    """Test the task calendar endpoint"""
+    
+    def test_tasks_are_grouped_by_local_day(self, api_client, trainer, member, workout_plan):
+        from datetime import timezone as dt_timezone
+        late_evening = datetime(2024, 3, 10, 23, 30, tzinfo=dt_timezone.utc)
+        task = WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, due_date=late_evening
+        )
+        WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer,
+            due_date=late_evening + timedelta(days=30)
+        )
+        api_client.force_authenticate(user=member)
+        
+        response = api_client.get('/api/v1/workout-tasks/calendar/', {'start': '2024-03-10', 'end': '2024-03-11'})
+        assert response.status_code == 200
+        assert [len(day['tasks']) for day in response.data['days']] == [1, 0]
+        
+        response = api_client.get('/api/v1/workout-tasks/calendar/', {
+            'start': '2024-03-10', 'end': '2024-03-11', 'tz': 'Europe/Berlin'
+        })
+        days = response.data['days']
+        assert [len(day['tasks']) for day in days] == [0, 1]
+        assert days[1]['tasks'][0]['id'] == task.id
+        assert days[1]['tasks'][0]['due_date'].startswith('2024-03-11T00:30:00+01:00')
+    
+    def test_invalid_ranges_are_rejected(self, api_client, member, settings):
+        settings.CALENDAR_MAX_DAYS = 31
+        api_client.force_authenticate(user=member)
+        for params in (
+            {'start': '2024-03-10'},
+            {'start': '2024-03-10', 'end': '2024-03-01'},
+            {'start': '2024-01-01', 'end': '2024-03-01'},
+            {'start': '2024-03-01', 'end': '2024-03-02', 'tz': 'Mars/Olympus'},
+        ):
+            response = api_client.get('/api/v1/workout-tasks/calendar/', params)
+            assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestTaskBranch:
+    """Test the denormalized branch on workout tasks"""
+    
+    def test_branch_follows_the_plan(self, trainer, member, workout_plan, gym_branch):
+        task = WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer,
+            due_date=datetime.now() + timedelta(days=1)
+        )
+        assert task.gym_branch_id == gym_branch.id
+        
+        other_branch = GymBranch.objects.create(name='Other Gym', location='Elsewhere')
+        plan = WorkoutPlan.objects.get(pk=workout_plan.pk)
+        plan.gym_branch = other_branch
+        plan.save()
+        
+        assert WorkoutTask.objects.get(pk=task.pk).gym_branch_id == other_branch.id
+    
+    def test_branch_is_required(self, trainer, member, workout_plan):
+        from django.db import IntegrityError, transaction
+        # bulk_create skips save(), so it would otherwise store tasks no branch can see
+        with pytest.raises(IntegrityError), transaction.atomic():
+            WorkoutTask.objects.bulk_create([WorkoutTask(
+                workout_plan=workout_plan, member=member, created_by=trainer,
+                due_date=datetime.now() + timedelta(days=1)
+            )])
+        assert WorkoutTask.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestEstimatedCountPagination:
+    """Test estimated counts on large list endpoints"""
+    
+    def _logs(self, user, count):
+        from gym_api.models import ActivityLog
+        ActivityLog.objects.bulk_create([
+            ActivityLog(user=user, action='login', model_name='User', object_id=str(user.id))
+            for _ in range(count)
+        ])
+    
+    def test_has_next_and_last_page_count(self, api_client, super_admin):
+        self._logs(super_admin, 3)
+        api_client.force_authenticate(user=super_admin)
+        
+        response = api_client.get('/api/v1/activity-logs/', {'page_size': 2})
+        assert response.data['has_next'] is True
+        assert response.data['count'] == 3
+        assert len(response.data['results']) == 2
+        
+        response = api_client.get('/api/v1/activity-logs/', {'page_size': 2, 'page': 2})
+        assert response.data['has_next'] is False
+        assert response.data['next'] is None
+        assert response.data['count'] == 3
+        assert response.data['count_is_estimate'] is False
+    
+    def test_large_counts_are_cached_until_exact_is_requested(self, api_client, super_admin, settings):
+        settings.COUNT_ESTIMATE_THRESHOLD = 3
+        self._logs(super_admin, 3)
+        api_client.force_authenticate(user=super_admin)
+        api_client.get('/api/v1/activity-logs/', {'page_size': 1})
+        
+        self._logs(super_admin, 2)
+        response = api_client.get('/api/v1/activity-logs/', {'page_size': 1})
+        assert response.data['count'] == 3
+        assert response.data['count_is_estimate'] is True
+        
+        response = api_client.get('/api/v1/activity-logs/', {'page_size': 1, 'count': 'exact'})
+        assert response.data['count'] == 5
+        assert response.data['count_is_estimate'] is False
+    
+    def test_unreachable_cache_is_a_miss(self, api_client, super_admin, settings, monkeypatch):
+        from django.core.cache import caches
+        
+        def unreachable(*args, **kwargs):
+            raise ConnectionError('cache down')
+        
+        settings.COUNT_ESTIMATE_THRESHOLD = 3
+        self._logs(super_admin, 4)
+        monkeypatch.setattr(caches['default'], 'get', unreachable)
+        monkeypatch.setattr(caches['default'], 'set', unreachable)
+        api_client.force_authenticate(user=super_admin)
+        response = api_client.get('/api/v1/activity-logs/', {'page_size': 1})
+        assert response.status_code == 200
+        assert (response.data['count'], response.data['count_is_estimate']) == (4, False)
+
+
+@pytest.mark.django_db
+class TestThrottling:
+    """Test token-bucket throttling and the failed-login cache"""
+    
+    def _rates(self, settings, **rates):
+        config = dict(settings.REST_FRAMEWORK)
+        config['DEFAULT_THROTTLE_RATES'] = {**config['DEFAULT_THROTTLE_RATES'], **rates}
+        settings.REST_FRAMEWORK = config
+    
+    def test_login_is_throttled_per_account(self, api_client, gym_manager, settings):
+        self._rates(settings, login_account='2/min')
+        for _ in range(2):
+            response = api_client.post('/api/v1/auth/login/', {'email': 'manager@test.com', 'password': 'wrong'})
+            assert response.status_code == 400
+        response = api_client.post('/api/v1/auth/login/', {'email': 'MANAGER@test.com', 'password': 'wrong'})
+        assert response.status_code == 429
+        assert 'Retry-After' in response
+    
+    def test_repeated_bad_password_skips_hashing(self, api_client, gym_manager, monkeypatch):
+        calls = []
+        check_password = User.check_password
+        monkeypatch.setattr(User, 'check_password', lambda user, raw: calls.append(raw) or check_password(user, raw))
+        for _ in range(3):
+            response = api_client.post('/api/v1/auth/login/', {'email': 'manager@test.com', 'password': 'wrong'})
+            assert response.status_code == 400
+        assert calls == ['wrong']
+        
+        response = api_client.post('/api/v1/auth/login/', {'email': 'manager@test.com', 'password': 'Manager@123'})
+        assert response.status_code == 200
+    
+    def test_writes_are_throttled_per_user(self, api_client, trainer, settings):
+        self._rates(settings, write_user='1/min')
+        api_client.force_authenticate(user=trainer)
+        data = {'title': 'Plan', 'description': 'Plan', 'gym_branch': trainer.gym_branch_id}
+        assert api_client.post('/api/v1/workout-plans/', data).status_code == 201
+        assert api_client.post('/api/v1/workout-plans/', data).status_code == 429
+        assert api_client.get('/api/v1/workout-plans/').status_code == 200
+    
+    @pytest.mark.parametrize('proxies', [None, 1])
+    def test_forwarded_for_rotation_keeps_the_ip_bucket(self, api_client, settings, proxies):
+        self._rates(settings, login_ip='2/min')
+        if proxies is not None:
+            settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': proxies}
+        statuses = [
+            api_client.post(
+                '/api/v1/auth/login/', {'email': f'nobody{index}@test.com', 'password': 'wrong'},
+                HTTP_X_FORWARDED_FOR=f'203.0.113.{index}, 198.51.100.7',
+            ).status_code
+            for index in range(3)
+        ]
+        # only REMOTE_ADDR, or the address the proxy appended, counts
+        assert statuses == [400, 400, 429]
+    
+    def test_concurrent_takes_do_not_overdraw(self, monkeypatch):
+        import threading
+        import time
+        from django.core.cache import caches
+        from gym_api.throttling import consume
+        
+        # caches are per thread, so slow down the reads of the backend class:
+        # every thread then sees the bucket before anyone writes it
+        backend = type(caches['default'])
+        get = backend.get
+        monkeypatch.setattr(backend, 'get', lambda *args, **kwargs: (get(*args, **kwargs), time.sleep(0.01))[0])
+        start = threading.Barrier(10)
+        waits = []
+        
+        def take():
+            start.wait()
+            waits.append(consume('throttle:test:3', 3, 60, now=1000))
+        
+        threads = [threading.Thread(target=take) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert waits.count(0) == 3
+    
+    def test_bucket_refills_over_time(self):
+        from gym_api.throttling import consume
+        assert consume('throttle:test:1', 1, 60, now=1000) == 0
+        assert consume('throttle:test:1', 1, 60, now=1001) == pytest.approx(59)
+        assert consume('throttle:test:1', 1, 60, now=1060) == 0
+    
+    def test_unreachable_cache_is_skipped_for_a_while(self, settings, monkeypatch):
+        from django.core.cache import caches
+        from gym_api import caching
+        from gym_api.throttling import consume
+        
+        calls = []
+        
+        def unreachable(*args, **kwargs):
+            calls.append(args)
+            raise ConnectionError('cache down')
+        
+        monkeypatch.setattr(caches['default'], 'get', unreachable)
+        monkeypatch.setattr(caches['default'], 'set', unreachable)
+        # the local cache takes over, and the shared one is tried once only
+        assert consume('throttle:test:2', 1, 60, now=1000) == 0
+        assert consume('throttle:test:2', 1, 60, now=1001) == pytest.approx(59)
+        assert len(calls) == 1
+        
+        caching.reset()
+        consume('throttle:test:2', 1, 60, now=1002)
+        assert len(calls) == 2
+
+
+@pytest.mark.django_db
+class TestBatch:
+    """Test the batch request endpoint"""
+    
+    def test_runs_sub_requests_as_the_batch_user(self, api_client, trainer, member, workout_plan, settings):
+        settings.BATCH_MAX_WORKERS = 1
+        api_client.force_authenticate(user=trainer)
+        response = api_client.post('/api/v1/batch/', {'requests': [
+            {'method': 'GET', 'path': '/api/v1/auth/profile/'},
+            {'method': 'GET', 'path': '/api/v1/workout-tasks/?status=pending'},
+            {'method': 'GET', 'path': '/api/v1/users/members/'},
+            {'method': 'GET', 'path': '/api/v1/gym-branches/999/'},
+        ]}, format='json')
+        assert response.status_code == 200
+        statuses = [item['status'] for item in response.data['responses']]
+        assert statuses == [200, 200, 403, 404]
+        assert response.data['responses'][0]['body']['email'] == trainer.email
+    
+    def test_transactional_batch_rolls_back_on_failure(self, api_client, trainer, member, workout_plan):
+        api_client.force_authenticate(user=trainer)
+        due = (datetime.now() + timedelta(days=1)).isoformat()
+        task = {'workout_plan': workout_plan.id, 'member': member.id, 'due_date': due}
+        response = api_client.post('/api/v1/batch/', {'transactional': True, 'requests': [
+            {'method': 'POST', 'path': '/api/v1/workout-tasks/', 'body': task},
+            {'method': 'POST', 'path': '/api/v1/workout-tasks/', 'body': {'member': member.id}},
+            {'method': 'GET', 'path': '/api/v1/workout-tasks/'},
+        ]}, format='json')
+        assert response.data['committed'] is False
+        assert [item['status'] for item in response.data['responses']] == [201, 400, 424]
+        assert WorkoutTask.objects.count() == 0
+    
+    def test_rejects_invalid_batches(self, api_client, trainer):
+        api_client.force_authenticate(user=trainer)
+        for body in (
+            {'requests': []},
+            {'requests': [{'method': 'GET', 'path': '/admin/'}]},
+            {'requests': [{'method': 'POST', 'path': '/api/v1/batch/'}]},
+        ):
+            assert api_client.post('/api/v1/batch/', body, format='json').status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_gets_run_concurrently(api_client, trainer, settings):
+    settings.BATCH_MAX_WORKERS = 3
+    api_client.force_authenticate(user=trainer)
+    response = api_client.post('/api/v1/batch/', {'requests': [
+        {'method': 'GET', 'path': '/api/v1/auth/profile/'},
+        {'method': 'GET', 'path': '/api/v1/workout-plans/'},
+        {'method': 'GET', 'path': '/api/v1/gym-branches/'},
+    ]}, format='json')
+    assert [item['status'] for item in response.data['responses']] == [200, 200, 200]
+
+
+@pytest.mark.django_db
+class TestAdminChangelists:
+    """Admin changelists for the large tables"""
+    
+    @pytest.fixture
+    def staff_client(self, super_admin, client):
+        super_admin.is_staff = True
+        super_admin.is_superuser = True
+        super_admin.save()
+        client.force_login(super_admin)
+        return client
+    
+    def test_task_changelist_queries_do_not_grow_with_rows(
+            self, staff_client, workout_plan, member, trainer, django_assert_max_num_queries):
+        from django.utils import timezone
+        
+        for day in range(30):
+            WorkoutTask.objects.create(
+                workout_plan=workout_plan, member=member, created_by=trainer,
+                due_date=timezone.now() + timedelta(days=day)
+            )
+        with django_assert_max_num_queries(12):
+            response = staff_client.get('/admin/gym_api/workouttask/', {'member_email': member.email})
+        assert response.status_code == 200
+        assert 'name="member_email"' in response.content.decode()
+    
+    def test_activity_log_changelist_with_date_drilldown(self, staff_client):
+        now = datetime.now()
+        for params in ({}, {'created_at__year': now.year}, {'created_at__year': now.year, 'created_at__month': now.month}):
+            response = staff_client.get('/admin/gym_api/activitylog/', params)
+            assert response.status_code == 200
+    
+    def test_drilldown_datetimes_skip_empty_periods(self, workout_plan, member, trainer):
+        from django.utils import timezone
+        from gym_api.admin import DrilldownQuerySet
+        
+        first = WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, due_date=timezone.now()
+        )
+        second = WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, due_date=timezone.now()
+        )
+        tz = timezone.get_current_timezone()
+        WorkoutTask.objects.filter(pk=first.pk).update(created_at=datetime(2023, 11, 5, 10, tzinfo=tz))
+        WorkoutTask.objects.filter(pk=second.pk).update(created_at=datetime(2024, 2, 20, 10, tzinfo=tz))
+        
+        queryset = DrilldownQuerySet(WorkoutTask)
+        assert [value.year for value in queryset.datetimes('created_at', 'year')] == [2023, 2024]
+        months = queryset.datetimes('created_at', 'month')
+        assert [(value.year, value.month) for value in months] == [(2023, 11), (2024, 2)]
+        assert list(queryset.datetimes('created_at', 'month')) == list(WorkoutTask.objects.datetimes('created_at', 'month'))
+
+
+@pytest.mark.django_db
+class TestActivityStats:
+    """Activity histograms served from rollup counters"""
+    
+    def log(self, user, action='login', model_name='User', at=None):
+        from gym_api.models import ActivityLog
+        entry = ActivityLog.objects.create(user=user, action=action, model_name=model_name, object_id=str(user.id))
+        if at is not None:
+            # move the entry and its counter back in time
+            from gym_api import rollups
+            from gym_api.models import ActivityRollup
+            ActivityRollup.objects.filter(granularity='hour', bucket=rollups.bucket_start(entry.created_at, 'hour')).update(
+                bucket=rollups.bucket_start(at, 'hour')
+            )
+        return entry
+    
+    def test_entry_and_counter_commit_together(self, trainer, monkeypatch):
+        from gym_api import rollups
+        from gym_api.models import ActivityLog
+        
+        def crash(*args, **kwargs):
+            raise RuntimeError('crashed between the log and its counter')
+        
+        monkeypatch.setattr(rollups, 'increment', crash)
+        with pytest.raises(RuntimeError):
+            self.log(trainer)
+        assert ActivityLog.objects.count() == 0
+    
+    def test_logins_are_counted_per_hour_and_branch(self, api_client, super_admin, trainer, member):
+        from datetime import timezone as dt_timezone
+        
+        self.log(trainer)
+        self.log(member)
+        self.log(super_admin)
+        self.log(trainer, action='update', model_name='WorkoutTask')
+        
+        api_client.force_authenticate(user=super_admin)
+        today = datetime.now(dt_timezone.utc).date().isoformat()
+        response = api_client.get('/api/v1/activity-logs/stats/', {
+            'start': today, 'end': today, 'interval': 'hour', 'action': 'login',
+        })
+        assert response.status_code == 200
+        counts = {item['branch']: item['count'] for item in response.data['results']}
+        assert counts == {trainer.gym_branch_id: 2, None: 1}
+        
+        response = api_client.get('/api/v1/activity-logs/stats/', {
+            'start': today, 'end': today, 'branch': trainer.gym_branch_id, 'model_name': 'WorkoutTask',
+        })
+        assert [(item['action'], item['count']) for item in response.data['results']] == [('update', 1)]
+    
+    def test_compaction_folds_hours_into_days(self, api_client, super_admin, trainer):
+        from datetime import timezone as dt_timezone
+        from gym_api import rollups
+        from gym_api.models import ActivityRollup
+        
+        old = datetime(2024, 3, 10, 8, tzinfo=dt_timezone.utc)
+        self.log(trainer, at=old)
+        self.log(trainer, at=old + timedelta(hours=5))
+        self.log(trainer)
+        
+        assert rollups.compact() == 2
+        day = ActivityRollup.objects.get(granularity='day')
+        assert (day.bucket, day.count) == (datetime(2024, 3, 10, tzinfo=dt_timezone.utc), 2)
+        assert ActivityRollup.objects.filter(granularity='hour').count() == 1
+        
+        api_client.force_authenticate(user=super_admin)
+        response = api_client.get('/api/v1/activity-logs/stats/', {'start': '2024-03-01', 'end': '2024-03-31'})
+        assert [(item['bucket'][:10], item['count']) for item in response.data['results']] == [('2024-03-10', 2)]
+    
+    def test_rejects_invalid_ranges_and_non_admins(self, api_client, super_admin, trainer):
+        api_client.force_authenticate(user=trainer)
+        assert api_client.get('/api/v1/activity-logs/stats/', {'start': '2024-01-01', 'end': '2024-01-02'}).status_code == 403
+        
+        api_client.force_authenticate(user=super_admin)
+        for params in (
+            {},
+            {'start': '2024-01-05', 'end': '2024-01-01'},
+            {'start': '2024-01-01', 'end': '2024-03-01', 'interval': 'hour'},
+            {'start': '2024-01-01', 'end': '2024-01-02', 'interval': 'week'},
+            {'start': '2024-01-01', 'end': '2024-01-02', 'branch': 'x'},
+        ):
+            assert api_client.get('/api/v1/activity-logs/stats/', params).status_code == 400
+
+
+@pytest.mark.django_db
+class TestRecurringTasks:
+    """Recurring tasks expanded on read and stored on first status change"""
+    
+    @pytest.fixture
+    def rule(self, api_client, trainer, member, workout_plan):
+        api_client.force_authenticate(user=trainer)
+        response = api_client.post('/api/v1/recurring-tasks/', {
+            'workout_plan': workout_plan.id, 'member': member.id, 'weekdays': ['mon', 'wed', 'fri'],
+            'time_of_day': '07:30', 'timezone': 'Europe/Berlin', 'start_date': '2024-03-04', 'weeks': 12,
+        }, format='json')
+        assert response.status_code == 201
+        assert response.data['end_date'] == '2024-05-26'
+        assert response.data['weekdays'] == ['mon', 'wed', 'fri']
+        api_client.force_authenticate(user=None)
+        return response.data
+    
+    def test_occurrences_appear_in_calendar_without_rows(self, api_client, member, rule):
+        api_client.force_authenticate(user=member)
+        response = api_client.get('/api/v1/workout-tasks/calendar/', {
+            'start': '2024-03-04', 'end': '2024-03-10', 'tz': 'Europe/Berlin'
+        })
+        assert response.status_code == 200
+        assert [len(day['tasks']) for day in response.data['days']] == [1, 0, 1, 0, 1, 0, 0]
+        monday = response.data['days'][0]['tasks'][0]
+        assert monday['id'] is None
+        assert (monday['recurrence'], monday['occurrence_date']) == (rule['id'], '2024-03-04')
+        assert monday['due_date'].startswith('2024-03-04T07:30:00+01:00')
+        assert WorkoutTask.objects.count() == 0
+        
+        response = api_client.get('/api/v1/workout-tasks/calendar/', {
+            'start': '2024-03-04', 'end': '2024-03-10', 'status': 'completed'
+        })
+        assert sum(len(day['tasks']) for day in response.data['days']) == 0
+    
+    def test_status_change_materializes_one_occurrence(self, api_client, member, rule):
+        api_client.force_authenticate(user=member)
+        url = f"/api/v1/recurring-tasks/{rule['id']}/occurrences/2024-03-06/"
+        response = api_client.patch(url, {'status': 'completed'}, format='json')
+        assert response.status_code == 201
+        assert response.data['status'] == 'completed'
+        assert WorkoutTask.objects.get().occurrence_date.isoformat() == '2024-03-06'
+        
+        assert api_client.patch(url, {'status': 'in_progress'}, format='json').status_code == 200
+        assert WorkoutTask.objects.count() == 1
+        
+        response = api_client.get(f"/api/v1/recurring-tasks/{rule['id']}/occurrences/", {
+            'start': '2024-03-04', 'end': '2024-03-08', 'tz': 'Europe/Berlin'
+        })
+        assert [(item['occurrence_date'], item['status']) for item in response.data] == [
+            ('2024-03-04', 'pending'), ('2024-03-06', 'in_progress'), ('2024-03-08', 'pending'),
+        ]
+    
+    def test_rejects_invalid_occurrences_and_other_members(self, api_client, gym_branch, member, rule):
+        api_client.force_authenticate(user=member)
+        response = api_client.patch(
+            f"/api/v1/recurring-tasks/{rule['id']}/occurrences/2024-03-05/", {'status': 'completed'}, format='json'
+        )
+        assert response.status_code == 400
+        
+        other = User.objects.create_user(
+            email='other@test.com', username='other', password='Other@123', role='member', gym_branch=gym_branch
+        )
+        api_client.force_authenticate(user=other)
+        response = api_client.patch(
+            f"/api/v1/recurring-tasks/{rule['id']}/occurrences/2024-03-06/", {'status': 'completed'}, format='json'
+        )
+        assert response.status_code == 404
+        assert WorkoutTask.objects.count() == 0
+    
+    def test_only_trainers_create_with_bounded_span(self, api_client, trainer, member, workout_plan):
+        payload = {
+            'workout_plan': workout_plan.id, 'member': member.id, 'weekdays': ['mon'],
+            'time_of_day': '07:30', 'timezone': 'UTC', 'start_date': '2024-03-04', 'weeks': 60,
+        }
+        api_client.force_authenticate(user=member)
+        assert api_client.post('/api/v1/recurring-tasks/', payload, format='json').status_code == 403
+        api_client.force_authenticate(user=trainer)
+        assert api_client.post('/api/v1/recurring-tasks/', payload, format='json').status_code == 400
+        payload.update(weeks=4, weekdays=['someday'])
+        assert api_client.post('/api/v1/recurring-tasks/', payload, format='json').status_code == 400
+    
+    def test_weekdays_must_be_exact_names(self):
+        from gym_api.recurrence import parse_weekdays
+        assert parse_weekdays(['Mon', 'friday']) == 1 << 0 | 1 << 4
+        for name in ('monkey', 'friday!!', 'sunburn', 'mo'):
+            with pytest.raises(ValueError):
+                parse_weekdays([name])
+
+
+@pytest.mark.django_db
+class TestUserAutocomplete:
+    """Prefix search over normalized user keys"""
+    
+    @pytest.fixture
+    def people(self, gym_branch):
+        other_branch = GymBranch.objects.create(name='Other Gym', location='456 Side St')
+        rows = [
+            ('jose.nunez@test.com', 'José', 'Núñez', gym_branch),
+            ('anna@test.com', 'Anna', 'Josephs', gym_branch),
+            ('jo@other.com', 'Jo', 'Far', other_branch),
+        ]
+        return [
+            User.objects.create_user(
+                email=email, username=email, password='Member@123', role='member',
+                first_name=first, last_name=last, gym_branch=branch
+            )
+            for email, first, last, branch in rows
+        ]
+    
+    def test_matches_email_then_name_within_branch(self, api_client, gym_manager, people):
+        api_client.force_authenticate(user=gym_manager)
+        response = api_client.get('/api/v1/users/autocomplete/', {'q': 'JOS'})
+        assert response.status_code == 200
+        assert [item['email'] for item in response.data['results']] == ['jose.nunez@test.com', 'anna@test.com']
+        
+        response = api_client.get('/api/v1/users/autocomplete/', {'q': 'nun'})
+        assert [item['email'] for item in response.data['results']] == ['jose.nunez@test.com']
+        response = api_client.get('/api/v1/users/autocomplete/', {'q': 'anna jo', 'role': 'member'})
+        assert [item['email'] for item in response.data['results']] == ['anna@test.com']
+    
+    def test_cached_results_are_invalidated_by_user_changes(
+            self, api_client, gym_manager, people, django_assert_num_queries):
+        api_client.force_authenticate(user=gym_manager)
+        api_client.get('/api/v1/users/autocomplete/', {'q': 'anna'})
+        with django_assert_num_queries(0):
+            response = api_client.get('/api/v1/users/autocomplete/', {'q': 'anna'})
+        assert len(response.data['results']) == 1
+        
+        User.objects.create_user(
+            email='annabel@test.com', username='annabel', password='Member@123',
+            role='member', gym_branch=gym_manager.gym_branch
+        )
+        response = api_client.get('/api/v1/users/autocomplete/', {'q': 'anna'})
+        assert [item['email'] for item in response.data['results']] == ['anna@test.com', 'annabel@test.com']
+    
+    def test_moving_a_user_invalidates_both_branches(self, api_client, gym_manager, people, monkeypatch):
+        from django.core.cache import caches
+        
+        api_client.force_authenticate(user=gym_manager)
+        assert len(api_client.get('/api/v1/users/autocomplete/', {'q': 'anna'}).data['results']) == 1
+        anna = User.objects.get(pk=people[1].pk)
+        anna.gym_branch = people[2].gym_branch
+        anna.save()
+        assert api_client.get('/api/v1/users/autocomplete/', {'q': 'anna'}).data['results'] == []
+        
+        def unreachable(*args, **kwargs):
+            raise ConnectionError('cache down')
+        
+        for method in ('get', 'set', 'get_or_set', 'set_many'):
+            monkeypatch.setattr(caches['default'], method, unreachable)
+        response = api_client.get('/api/v1/users/autocomplete/', {'q': 'jos'})
+        assert response.status_code == 200
+        assert [item['email'] for item in response.data['results']] == ['jose.nunez@test.com']
+    
+    def test_search_keys_follow_partial_saves(self, people):
+        user = people[1]
+        user.last_name = 'Åberg'
+        user.save(update_fields=['last_name'])
+        user.refresh_from_db()
+        assert (user.search_name, user.search_last) == ('anna aberg', 'aberg')
+    
+    def test_permissions_and_parameters(self, api_client, member, super_admin, people):
+        api_client.force_authenticate(user=member)
+        assert api_client.get('/api/v1/users/autocomplete/', {'q': 'jo'}).status_code == 403
+        
+        api_client.force_authenticate(user=super_admin)
+        response = api_client.get('/api/v1/users/autocomplete/', {'q': 'jo', 'limit': 1})
+        assert [item['email'] for item in response.data['results']] == ['jo@other.com']
+        assert api_client.get('/api/v1/users/autocomplete/', {'q': 'jo', 'limit': 0}).status_code == 400
+        assert api_client.get('/api/v1/users/autocomplete/', {'q': 'jo', 'role': 'coach'}).status_code == 400
+        assert api_client.get('/api/v1/users/autocomplete/', {'q': ''}).data['results'] == []
+
+
+
+@pytest.mark.django_db
+class TestLeaderboard:
+    """Completion leaderboard kept up to date on status changes"""
+    
+    @pytest.fixture
+    def runner(self, gym_branch):
+        return User.objects.create_user(
+            email='runner@test.com', username='runner', password='Member@123', role='member', gym_branch=gym_branch
+        )
+    
+    def _tasks(self, plan, member, trainer, count):
+        from django.utils import timezone
+        return [
+            WorkoutTask.objects.create(workout_plan=plan, member=member, created_by=trainer, due_date=timezone.now())
+            for _ in range(count)
+        ]
+    
+    def test_status_changes_move_counters(self, api_client, trainer, member, runner, workout_plan):
+        member_tasks = self._tasks(workout_plan, member, trainer, 2)
+        runner_tasks = self._tasks(workout_plan, runner, trainer, 3)
+        
+        api_client.force_authenticate(user=member)
+        for task in member_tasks:
+            assert api_client.patch(f'/api/v1/workout-tasks/{task.id}/', {'status': 'completed'}).status_code == 200
+        for task in runner_tasks:
+            task.status = 'completed'
+            task.save()
+        # leaving completed takes the completion back, deleting a completed task too
+        runner_tasks[0].status = 'in_progress'
+        runner_tasks[0].save(update_fields=['status'])
+        runner_tasks[1].delete()
+        
+        response = api_client.get('/api/v1/workout-tasks/leaderboard/', {'period': 'month'})
+        assert response.status_code == 200
+        assert [(item['rank'], item['member'], item['completed']) for item in response.data['results']] == [
+            (1, member.id, 2), (2, runner.id, 1),
+        ]
+        assert response.data['me'] == {'rank': 1, 'completed': 2}
+        assert WorkoutTask.objects.get(pk=runner_tasks[0].pk).completed_at is None
+    
+    def test_backfill_replaces_rows_written_meanwhile(self, trainer, member, workout_plan):
+        from importlib import import_module
+        from django.apps import apps
+        from gym_api.models import LeaderboardEntry
+        
+        for task in self._tasks(workout_plan, member, trainer, 3):
+            task.status = 'completed'
+            task.save()
+        # as if the app had counted only its own completions so far
+        LeaderboardEntry.objects.update(completed=1)
+        WorkoutTask.objects.update(completed_at=None)
+        
+        import_module('gym_api.migrations.0014_backfill_leaderboard').backfill_leaderboard(apps, None)
+        assert set(LeaderboardEntry.objects.values_list('period', 'completed')) == {('week', 3), ('month', 3)}
+    
+    def test_completions_follow_branch_changes(self, trainer, member, workout_plan, gym_branch):
+        from gym_api.models import LeaderboardEntry
+        
+        def counts():
+            return dict(
+                LeaderboardEntry.objects.filter(period='month', completed__gt=0)
+                .values_list('gym_branch_id', 'completed')
+            )
+        
+        task, moved = self._tasks(workout_plan, member, trainer, 2)
+        for each in (task, moved):
+            each.status = 'completed'
+            each.save()
+        other_branch = GymBranch.objects.create(name='Other Gym', location='Elsewhere')
+        other_plan = WorkoutPlan.objects.create(
+            title='Other', description='Other plan', created_by=trainer, gym_branch=other_branch
+        )
+        
+        # a task moved to a plan of another branch
+        moved = WorkoutTask.objects.get(pk=moved.pk)
+        moved.workout_plan = other_plan
+        moved.save(update_fields=['workout_plan'])
+        assert counts() == {gym_branch.id: 1, other_branch.id: 1}
+        
+        # a plan moved with its tasks
+        plan = WorkoutPlan.objects.get(pk=workout_plan.pk)
+        plan.gym_branch = other_branch
+        plan.save()
+        assert counts() == {other_branch.id: 2}
+        
+        task = WorkoutTask.objects.get(pk=task.pk)
+        task.status = 'in_progress'
+        task.save()
+        assert counts() == {other_branch.id: 1}
+    
+    def test_ties_share_a_rank_and_rebuild_matches(self, api_client, trainer, member, runner, workout_plan):
+        from gym_api import leaderboard
+        from gym_api.models import LeaderboardEntry
+        
+        for task in self._tasks(workout_plan, member, trainer, 1) + self._tasks(workout_plan, runner, trainer, 1):
+            task.status = 'completed'
+            task.save()
+        counters = set(LeaderboardEntry.objects.values_list('member_id', 'period', 'period_start', 'completed'))
+        
+        api_client.force_authenticate(user=trainer)
+        response = api_client.get('/api/v1/workout-tasks/leaderboard/')
+        assert [item['rank'] for item in response.data['results']] == [1, 1]
+        assert 'me' not in response.data
+        
+        assert leaderboard.rebuild() == 4
+        assert set(LeaderboardEntry.objects.values_list('member_id', 'period', 'period_start', 'completed')) == counters
+    
+    def test_invalid_parameters(self, api_client, super_admin, member):
+        api_client.force_authenticate(user=member)
+        for params in ({'period': 'year'}, {'date': '03/2024'}, {'limit': 0}):
+            assert api_client.get('/api/v1/workout-tasks/leaderboard/', params).status_code == 400
+        api_client.force_authenticate(user=super_admin)
+        assert api_client.get('/api/v1/workout-tasks/leaderboard/').status_code == 400
+        assert api_client.get('/api/v1/workout-tasks/leaderboard/', {'gym_branch': member.gym_branch_id}).status_code == 200
+
+
+@pytest.mark.django_db
+class TestTaskArchive:
+    """Archival of long completed tasks"""
+    
+    def _completed(self, plan, member, trainer, days_ago):
+        from django.utils import timezone
+        task = WorkoutTask.objects.create(
+            workout_plan=plan, member=member, created_by=trainer, due_date=timezone.now(), status='completed'
+        )
+        WorkoutTask.objects.filter(pk=task.pk).update(completed_at=timezone.now() - timedelta(days=days_ago))
+        return task
+    
+    def test_old_completed_tasks_move_in_batches(self, trainer, member, workout_plan, settings):
+        from gym_api.archive import archive_completed
+        from gym_api.models import ArchivedWorkoutTask, LeaderboardEntry, Tombstone
+        
+        settings.TASK_ARCHIVE_AFTER_DAYS = 90
+        old = [self._completed(workout_plan, member, trainer, 200) for _ in range(3)]
+        recent = self._completed(workout_plan, member, trainer, 10)
+        counters = list(LeaderboardEntry.objects.values_list('completed', flat=True))
+        
+        assert archive_completed(batch_size=2) == 3
+        assert list(WorkoutTask.objects.values_list('id', flat=True)) == [recent.id]
+        assert sorted(ArchivedWorkoutTask.objects.values_list('id', flat=True)) == [task.id for task in old]
+        # archiving is not deleting
+        assert Tombstone.objects.count() == 0
+        assert list(LeaderboardEntry.objects.values_list('completed', flat=True)) == counters
+    
+    def test_history_is_only_read_when_asked_for(self, api_client, trainer, member, gym_branch, workout_plan):
+        from gym_api.archive import archive_completed
+        from django.utils import timezone
+        
+        task = self._completed(workout_plan, member, trainer, 200)
+        archive_completed(older_than=timezone.now() - timedelta(days=30))
+        
+        api_client.force_authenticate(user=member)
+        assert api_client.get('/api/v1/workout-tasks/').data['count'] == 0
+        assert api_client.get(f'/api/v1/workout-tasks/{task.id}/').status_code == 404
+        response = api_client.get(f'/api/v1/workout-tasks/{task.id}/', {'history': 1})
+        assert response.status_code == 200
+        assert (response.data['id'], response.data['status']) == (task.id, 'completed')
+        
+        response = api_client.get('/api/v1/workout-tasks/history/')
+        assert [item['id'] for item in response.data['results']] == [task.id]
+        
+        other = User.objects.create_user(
+            email='other@test.com', username='other', password='Other@123', role='member', gym_branch=gym_branch
+        )
+        api_client.force_authenticate(user=other)
+        assert api_client.get('/api/v1/workout-tasks/history/').data['count'] == 0
+        assert api_client.get(f'/api/v1/workout-tasks/{task.id}/', {'history': 1}).status_code == 404
+    
+    def test_archived_occurrences_are_not_stored_again(self, api_client, trainer, member, workout_plan):
+        from gym_api.archive import archive_completed
+        from gym_api.models import ArchivedWorkoutTask, LeaderboardEntry
+        from django.utils import timezone
+        
+        api_client.force_authenticate(user=trainer)
+        rule = api_client.post('/api/v1/recurring-tasks/', {
+            'workout_plan': workout_plan.id, 'member': member.id, 'weekdays': ['wed'],
+            'time_of_day': '07:30', 'timezone': 'Europe/Berlin', 'start_date': '2024-03-04', 'weeks': 2,
+        }, format='json').data
+        api_client.force_authenticate(user=member)
+        url = f"/api/v1/recurring-tasks/{rule['id']}/occurrences/2024-03-06/"
+        assert api_client.patch(url, {'status': 'completed'}, format='json').status_code == 201
+        assert archive_completed(older_than=timezone.now()) == 1
+        
+        response = api_client.get(f"/api/v1/recurring-tasks/{rule['id']}/occurrences/", {
+            'start': '2024-03-04', 'end': '2024-03-18', 'tz': 'Europe/Berlin'
+        })
+        assert [item['occurrence_date'] for item in response.data] == ['2024-03-13']
+        assert api_client.patch(url, {'status': 'completed'}, format='json').status_code == 400
+        assert (WorkoutTask.objects.count(), ArchivedWorkoutTask.objects.count()) == (0, 1)
+        assert set(LeaderboardEntry.objects.values_list('completed', flat=True)) == {1}
+
+
+@pytest.mark.django_db
+class TestAnalyticsSnapshots:
+    """Columnar snapshots and adherence reports"""
+    
+    def _task(self, plan, member, trainer, due, completed_at=None):
+        task = WorkoutTask.objects.create(
+            workout_plan=plan, member=member, created_by=trainer, due_date=due,
+            status='completed' if completed_at else 'pending',
+        )
+        WorkoutTask.objects.filter(pk=task.pk).update(completed_at=completed_at)
+        return task
+    
+    def _fixture(self, trainer, member, gym_branch, workout_plan):
+        from datetime import datetime, timezone as dt_timezone
+        from gym_api.archive import archive_completed
+        
+        utc = dt_timezone.utc
+        due = datetime(2024, 2, 10, 18, tzinfo=utc)
+        late = User.objects.create_user(
+            email='late@test.com', username='late', password='Late@123', role='member', gym_branch=gym_branch
+        )
+        User.objects.filter(pk=member.pk).update(created_at=datetime(2023, 11, 5, tzinfo=utc))
+        User.objects.filter(pk=late.pk).update(created_at=datetime(2024, 1, 20, tzinfo=utc))
+        self._task(workout_plan, member, trainer, due, completed_at=due - timedelta(hours=1))
+        self._task(workout_plan, member, trainer, due, completed_at=due + timedelta(days=1))
+        self._task(workout_plan, late, trainer, due)
+        # outside the quarter
+        self._task(workout_plan, late, trainer, datetime(2024, 4, 2, tzinfo=utc))
+        # archived tasks still count
+        archive_completed(older_than=datetime(2024, 3, 1, tzinfo=utc))
+    
+    def test_snapshot_round_trip(self, trainer, member, gym_branch, workout_plan, tmp_path):
+        np = pytest.importorskip('numpy')
+        from gym_api.analytics import latest_snapshot, load_snapshot, write_snapshot
+        from gym_api.models import ArchivedWorkoutTask
+        
+        self._fixture(trainer, member, gym_branch, workout_plan)
+        assert ArchivedWorkoutTask.objects.count() == 2
+        path = write_snapshot(str(tmp_path), batch_size=2)
+        assert latest_snapshot(str(tmp_path)) == path
+        
+        snapshot = load_snapshot(path)
+        assert snapshot.manifest['tables']['tasks']['rows'] == 4
+        assert isinstance(snapshot.tasks['id'], np.memmap)
+        assert sorted(snapshot.tasks['id'].tolist()) == sorted(
+            list(WorkoutTask.objects.values_list('id', flat=True))
+            + list(ArchivedWorkoutTask.objects.values_list('id', flat=True))
+        )
+        assert snapshot.users['id'].tolist() == list(User.objects.order_by('id').values_list('id', flat=True))
+        assert snapshot.tasks['due_date'].dtype == np.dtype('datetime64[s]')
+        assert np.isnat(snapshot.tasks['completed_at']).sum() == 2
+    
+    def test_adherence_by_cohort_and_trainer(self, trainer, member, gym_branch, workout_plan, tmp_path):
+        pytest.importorskip('numpy')
+        from datetime import date
+        from gym_api.analytics import adherence, load_snapshot, write_snapshot
+        
+        self._fixture(trainer, member, gym_branch, workout_plan)
+        snapshot = load_snapshot(write_snapshot(str(tmp_path)))
+        quarter = (date(2024, 1, 1), date(2024, 4, 1))
+        
+        assert adherence(snapshot, 'cohort', *quarter) == [
+            {'key': '2023-11', 'tasks': 2, 'completed': 2, 'completion_rate': 1.0, 'on_time_rate': 0.5},
+            {'key': '2024-01', 'tasks': 1, 'completed': 0, 'completion_rate': 0.0, 'on_time_rate': 0.0},
+        ]
+        assert adherence(snapshot, 'trainer', *quarter) == [
+            {'key': trainer.id, 'tasks': 3, 'completed': 2, 'completion_rate': 0.6667, 'on_time_rate': 0.3333},
+        ]
+        assert adherence(snapshot, 'plan', *quarter, branch_id=gym_branch.id + 1) == []
+    
+    def test_report_command(self, trainer, member, gym_branch, workout_plan, tmp_path, settings):
+        pytest.importorskip('numpy')
+        import json
+        from io import StringIO
+        from django.core.management import call_command
+        
+        settings.ANALYTICS_SNAPSHOT_DIR = str(tmp_path)
+        self._fixture(trainer, member, gym_branch, workout_plan)
+        call_command('snapshot_analytics', stdout=StringIO())
+        out = StringIO()
+        call_command('analytics_report', '--by', 'plan', '--quarter', '2024Q1', stdout=out)
+        report = json.loads(out.getvalue())
+        assert (report['start'], report['end']) == ('2024-01-01', '2024-04-01')
+        assert [(row['key'], row['tasks']) for row in report['rows']] == [(workout_plan.id, 3)]
+
+
+@pytest.mark.django_db
+class TestTrainerAssignment:
+    """Automatic trainer assignment by load"""
+    
+    def _user(self, name, role, branch):
+        return User.objects.create_user(
+            email=f'{name}@test.com', username=name, password='Secret@123', role=role, gym_branch=branch
+        )
+    
+    def test_members_go_to_least_loaded_trainers(self, trainer, member, gym_branch, workout_plan, settings):
+        from django.db.models import Count
+        from django.utils import timezone
+        from gym_api.assignments import assign_members
+        from gym_api.models import TrainerAssignment
+        
+        # the fixture's transaction never commits, so nothing was assigned yet
+        assert assign_members(gym_branch.id) == ({trainer.id: 1}, 1)
+        member.refresh_from_db()
+        assert member.trainer_assignment.trainer == trainer
+        for _ in range(2):
+            WorkoutTask.objects.create(workout_plan=workout_plan, member=member, created_by=trainer, due_date=timezone.now())
+        second = self._user('second', 'trainer', gym_branch)
+        third = self._user('third', 'trainer', gym_branch)
+        settings.TRAINER_AUTO_ASSIGN = False
+        for index in range(7):
+            self._user(f'imported{index}', 'member', gym_branch)
+        
+        loads, assigned = assign_members(gym_branch.id)
+        assert assigned == 7
+        assert loads == {trainer.id: 4, second.id: 3, third.id: 3}
+        counts = dict(
+            TrainerAssignment.objects.values_list('trainer_id').annotate(total=Count('id')).order_by()
+        )
+        assert counts == {trainer.id: 2, second.id: 3, third.id: 3}
+        # nobody left to assign
+        assert assign_members(gym_branch.id)[1] == 0
+    
+    def test_new_members_are_assigned_after_commit(self, trainer, gym_branch, monkeypatch, django_capture_on_commit_callbacks):
+        from django.db import transaction
+        from gym_api import assignments
+        
+        runs = []
+        assign_members = assignments.assign_members
+        monkeypatch.setattr(
+            assignments, 'assign_members', lambda *args, **kwargs: runs.append(args) or assign_members(*args, **kwargs)
+        )
+        second = self._user('second', 'trainer', gym_branch)
+        with django_capture_on_commit_callbacks(execute=True):
+            with transaction.atomic():
+                imported = [self._user(f'imported{index}', 'member', gym_branch) for index in range(4)]
+                assert not runs
+        
+        # one run for the whole import
+        assert runs == [(gym_branch.id, [user.id for user in imported])]
+        trainers = [User.objects.get(pk=user.pk).trainer_assignment.trainer_id for user in imported]
+        assert sorted(trainers) == sorted([trainer.id, trainer.id, second.id, second.id])
+    
+    def test_branch_change_drops_assignment(self, api_client, trainer, member, gym_branch, gym_manager):
+        from gym_api.assignments import assign_members
+        
+        assign_members(gym_branch.id)
+        api_client.force_authenticate(user=gym_manager)
+        assert api_client.get(f'/api/v1/users/{member.id}/').data['trainer'] == trainer.id
+        
+        member.gym_branch = GymBranch.objects.create(name='Other Gym', location='456 Side St')
+        member.save()
+        # the manager no longer sees the member either
+        assert api_client.get(f'/api/v1/users/{member.id}/').status_code == 404
+        member.refresh_from_db()
+        assert not hasattr(member, 'trainer_assignment')
+    
+    def test_assign_endpoint(self, api_client, trainer, member, gym_branch, gym_manager, settings):
+        from gym_api.assignments import assign_members
+        
+        assign_members(gym_branch.id)
+        settings.TRAINER_AUTO_ASSIGN = False
+        second = self._user('second', 'trainer', gym_branch)
+        newcomer = self._user('newcomer', 'member', gym_branch)
+        
+        api_client.force_authenticate(user=member)
+        assert api_client.post('/api/v1/users/assign-trainers/', {}, format='json').status_code == 403
+        
+        api_client.force_authenticate(user=gym_manager)
+        response = api_client.post(
+            '/api/v1/users/assign-trainers/', {'members': [newcomer.id], 'trainer': second.id}, format='json'
+        )
+        assert response.status_code == 200
+        assert response.data['assigned'] == 1
+        assert {item['id']: item['load'] for item in response.data['trainers']} == {trainer.id: 1, second.id: 1}
+        
+        other_branch = GymBranch.objects.create(name='Other Gym', location='456 Side St')
+        outsider = self._user('outsider', 'trainer', other_branch)
+        response = api_client.post(
+            '/api/v1/users/assign-trainers/', {'members': [newcomer.id], 'trainer': outsider.id}, format='json'
+        )
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestTaskReminders:
+    """Due-date reminder outbox and dispatcher"""
+    
+    def _task(self, plan, member, trainer, hours, status='pending'):
+        from django.utils import timezone
+        return WorkoutTask.objects.create(
+            workout_plan=plan, member=member, created_by=trainer, status=status,
+            due_date=timezone.now() + timedelta(hours=hours),
+        )
+    
+    def test_enqueue_is_idempotent_and_scoped(self, trainer, member, workout_plan):
+        from gym_api.models import TaskReminder
+        from gym_api.reminders import enqueue
+        
+        soon = self._task(workout_plan, member, trainer, 2)
+        same_time = WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, due_date=soon.due_date
+        )
+        self._task(workout_plan, member, trainer, 48)
+        self._task(workout_plan, member, trainer, 2, status='completed')
+        self._task(workout_plan, member, trainer, -2)
+        
+        assert enqueue(batch_size=1) == 2
+        enqueue()
+        assert sorted(TaskReminder.objects.values_list('task_id', flat=True)) == [soon.id, same_time.id]
+    
+    def test_dispatch_sends_cancels_and_throttles(self, trainer, member, workout_plan):
+        from django.core import mail
+        from gym_api.models import TaskReminder
+        from gym_api.reminders import EmailTransport, dispatch, enqueue
+        
+        tasks = [self._task(workout_plan, member, trainer, hours) for hours in (1, 2, 3)]
+        enqueue()
+        tasks[2].status = 'completed'
+        tasks[2].save()
+        
+        sleeps = []
+        totals = dispatch(max_per_second=1, transport=EmailTransport(), sleep=sleeps.append, clock=lambda: 0)
+        assert totals == {'sent': 2, 'retried': 0, 'failed': 0, 'cancelled': 1}
+        assert [message.to for message in mail.outbox] == [['member@test.com'], ['member@test.com']]
+        assert mail.outbox[0].subject.startswith('Reminder: Test Plan is due')
+        # one reminder per claim, paced to one per second
+        assert sleeps == [1, 2, 3]
+        assert dict(TaskReminder.objects.values_list('task_id', 'status')) == {
+            tasks[0].id: 'sent', tasks[1].id: 'sent', tasks[2].id: 'cancelled',
+        }
+    
+    def test_failures_back_off_then_give_up(self, trainer, member, workout_plan, settings):
+        from django.utils import timezone
+        from gym_api.models import TaskReminder
+        from gym_api.reminders import dispatch, enqueue
+        
+        class Down:
+            def send(self, reminders):
+                return {reminder.id: 'connection refused' for reminder in reminders}
+        
+        settings.REMINDER_MAX_ATTEMPTS = 2
+        self._task(workout_plan, member, trainer, 2)
+        enqueue()
+        assert dispatch(transport=Down())['retried'] == 1
+        reminder = TaskReminder.objects.get()
+        assert (reminder.status, reminder.attempts, reminder.last_error) == ('pending', 1, 'connection refused')
+        assert reminder.next_attempt_at > timezone.now() + timedelta(seconds=50)
+        
+        TaskReminder.objects.update(next_attempt_at=timezone.now())
+        assert dispatch(transport=Down())['failed'] == 1
+        assert TaskReminder.objects.get().status == 'failed'
+
+
+@pytest.mark.django_db
+class TestWebhooks:
+    """Webhook outbox and batched, signed delivery"""
+    
+    @pytest.fixture
+    def receiver(self, settings):
+        """Local HTTP/1.1 stand-in that records requests and answers with queued statuses"""
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                self.server.received.append((dict(self.headers), body, self.client_address))
+                self.send_response(self.server.statuses.pop(0) if self.server.statuses else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            
+            def log_message(self, *args):
+                pass
+        
+        settings.WEBHOOK_ALLOW_PRIVATE_URLS = True
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        server.received = []
+        server.statuses = []
+        server.url = f'http://127.0.0.1:{server.server_address[1]}/hooks'
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+    
+    def _subscribe(self, branch, url, events):
+        from gym_api.models import WebhookSubscription
+        return WebhookSubscription.objects.create(gym_branch=branch, url=url, events=events)
+    
+    def test_changes_write_outbox_rows(self, trainer, member, gym_branch, workout_plan):
+        from django.utils import timezone
+        from gym_api.models import WebhookDelivery
+        
+        subscription = self._subscribe(gym_branch, 'http://crm.test/hooks', ['task.status_changed', 'plan.deleted'])
+        other_branch = GymBranch.objects.create(name='Other Gym', location='456 Side St')
+        self._subscribe(other_branch, 'http://other.test/hooks', ['task.status_changed'])
+        
+        task = WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, due_date=timezone.now()
+        )
+        task = WorkoutTask.objects.get(pk=task.pk)
+        task.status = 'in_progress'
+        task.save()
+        task.save()
+        workout_plan.delete()
+        
+        rows = list(WebhookDelivery.objects.order_by('id'))
+        assert [(row.subscription_id, row.event) for row in rows] == [
+            (subscription.id, 'task.status_changed'), (subscription.id, 'plan.deleted'),
+        ]
+        assert rows[0].payload['data']['previous_status'] == 'pending'
+        assert rows[0].payload['data']['status'] == 'in_progress'
+    
+    def test_failed_change_leaves_no_event(self, trainer, gym_branch):
+        from django.db import transaction
+        from gym_api.models import WebhookDelivery
+        
+        self._subscribe(gym_branch, 'http://crm.test/hooks', ['plan.created'])
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                WorkoutPlan.objects.create(title='Doomed', description='', created_by=trainer, gym_branch=gym_branch)
+                raise RuntimeError
+        assert not WebhookDelivery.objects.exists()
+    
+    def test_batched_signed_delivery_with_retry(self, receiver, trainer, gym_branch, settings):
+        import hmac
+        import json
+        from django.utils import timezone
+        from gym_api.models import WebhookDelivery
+        from gym_api.webhooks import deliver, sign
+        
+        settings.WEBHOOK_BATCH_SIZE = 2
+        subscription = self._subscribe(gym_branch, receiver.url, ['plan.created'])
+        for index in range(3):
+            WorkoutPlan.objects.create(title=f'Plan {index}', description='', created_by=trainer, gym_branch=gym_branch)
+        
+        receiver.statuses = [200, 503]
+        totals = deliver()
+        assert totals == {'delivered': 2, 'undelivered': 1, 'batches': 2}
+        headers, body, client = receiver.received[0]
+        expected = sign(subscription.secret, headers['X-Webhook-Timestamp'], body)
+        assert hmac.compare_digest(headers['X-Webhook-Signature'], expected)
+        assert [event['data']['title'] for event in json.loads(body)['events']] == ['Plan 0', 'Plan 1']
+        # one keep-alive connection for both requests
+        assert receiver.received[1][2] == client
+        
+        retry = WebhookDelivery.objects.get(status='pending')
+        assert (retry.attempts, retry.last_error) == (1, 'HTTP 503')
+        assert retry.next_attempt_at > timezone.now()
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        assert deliver()['delivered'] == 1
+        assert not WebhookDelivery.objects.exclude(status='delivered').exists()
+    
+    def test_manager_manages_own_branch_subscriptions(self, api_client, gym_manager, gym_branch, trainer):
+        api_client.force_authenticate(user=trainer)
+        assert api_client.get('/api/v1/webhooks/').status_code == 403
+        
+        api_client.force_authenticate(user=gym_manager)
+        response = api_client.post(
+            '/api/v1/webhooks/', {'url': 'https://93.184.216.34/hooks', 'events': ['task.created', 'task.created']},
+            format='json'
+        )
+        assert response.status_code == 201
+        assert response.data['gym_branch'] == gym_branch.id
+        assert response.data['events'] == ['task.created']
+        assert len(response.data['secret']) == 64
+        
+        response = api_client.post('/api/v1/webhooks/', {'url': 'https://93.184.216.34/hooks', 'events': ['task.deleted']}, format='json')
+        assert response.status_code == 400
+    
+    def test_internal_endpoints_are_refused(self, api_client, gym_manager, trainer, gym_branch, receiver, settings):
+        from gym_api.models import WebhookDelivery
+        from gym_api.webhooks import deliver
+        
+        settings.WEBHOOK_ALLOW_PRIVATE_URLS = False
+        api_client.force_authenticate(user=gym_manager)
+        for url in ('http://127.0.0.1:8000/', 'http://localhost/', 'http://10.0.0.5/', 'http://169.254.169.254/latest/',
+                    'http://[::1]/', 'http://[::ffff:127.0.0.1]/', 'ftp://93.184.216.34/'):
+            response = api_client.post('/api/v1/webhooks/', {'url': url, 'events': ['plan.created']}, format='json')
+            assert response.status_code == 400, url
+        
+        # checked again on delivery, where the name may resolve differently by now
+        self._subscribe(gym_branch, receiver.url, ['plan.created'])
+        WorkoutPlan.objects.create(title='Plan', description='', created_by=trainer, gym_branch=gym_branch)
+        assert deliver() == {'delivered': 0, 'undelivered': 1, 'batches': 1}
+        assert receiver.received == []
+        assert 'non-public' in WebhookDelivery.objects.get().last_error
+
+
+@pytest.mark.django_db
+class TestOptimisticConcurrency:
+    """Versioned, conditional task and plan updates"""
+    
+    def _task(self, workout_plan, member, trainer):
+        from django.utils import timezone
+        return WorkoutTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, due_date=timezone.now()
+        )
+    
+    def test_if_match_guards_task_updates(self, api_client, trainer, member, workout_plan):
+        task = self._task(workout_plan, member, trainer)
+        url = f'/api/v1/workout-tasks/{task.id}/'
+        api_client.force_authenticate(user=trainer)
+        response = api_client.get(url)
+        assert response['ETag'] == '"1"'
+        
+        response = api_client.patch(url, {'status': 'in_progress'}, format='json', HTTP_IF_MATCH='"1"')
+        assert response.status_code == 200
+        assert (response.data['version'], response['ETag']) == (2, '"2"')
+        
+        # the member still holds version 1
+        api_client.force_authenticate(user=member)
+        response = api_client.patch(url, {'status': 'completed'}, format='json', HTTP_IF_MATCH='"1"')
+        assert response.status_code == 412
+        assert 'error' in response.data
+        task.refresh_from_db()
+        assert (task.status, task.version) == ('in_progress', 2)
+        
+        response = api_client.patch(url, {'status': 'completed', 'version': 2}, format='json')
+        assert response.status_code == 200
+        # weak tags (from compressed responses) match too
+        api_client.force_authenticate(user=trainer)
+        assert api_client.patch(url, {'status': 'pending'}, format='json', HTTP_IF_MATCH='W/"3"').status_code == 200
+        assert api_client.patch(url, {'status': 'pending', 'version': 'x'}, format='json').status_code == 400
+    
+    def test_plan_updates_without_precondition_still_bump(self, api_client, trainer, workout_plan):
+        url = f'/api/v1/workout-plans/{workout_plan.id}/'
+        api_client.force_authenticate(user=trainer)
+        response = api_client.patch(url, {'title': 'Renamed'}, format='json')
+        assert (response.status_code, response.data['version']) == (200, 2)
+        response = api_client.patch(url, {'title': 'Stale'}, format='json', HTTP_IF_MATCH='"1"')
+        assert response.status_code == 412
+        workout_plan.refresh_from_db()
+        assert workout_plan.title == 'Renamed'
+    
+    def test_only_conditional_saves_are_refused(self, trainer, member, workout_plan):
+        from gym_api.models import VersionConflict
+        
+        task = self._task(workout_plan, member, trainer)
+        mine = WorkoutTask.objects.get(pk=task.pk)
+        theirs = WorkoutTask.objects.get(pk=task.pk)
+        theirs.status = 'completed'
+        theirs.save()
+        
+        mine.status = 'in_progress'
+        mine.expect_version(1)
+        with pytest.raises(VersionConflict):
+            mine.save(update_fields=['status'])
+        task.refresh_from_db()
+        assert (task.status, task.version, mine.version) == ('completed', 2, 1)
+        
+        # without a precondition the last write wins, and still gets its own version
+        mine.save(update_fields=['status'])
+        task.refresh_from_db()
+        assert (task.status, task.version, mine.version) == ('in_progress', 3, 3)
+    
+    def test_occurrence_updates_are_last_write_wins(self, api_client, trainer, member, workout_plan, monkeypatch):
+        from gym_api import recurrence
+        from gym_api.models import RecurringTask
+        from datetime import date, time
+        
+        rule = RecurringTask.objects.create(
+            workout_plan=workout_plan, member=member, created_by=trainer, weekdays=1 << 2,
+            time_of_day=time(7, 30), timezone='UTC', start_date=date(2024, 3, 4), end_date=date(2024, 3, 31),
+        )
+        recurrence.materialize(rule, date(2024, 3, 6))
+        materialize = recurrence.materialize
+        
+        def racing_materialize(rule, day):
+            # another request changes the occurrence between read and write
+            task, created = materialize(rule, day)
+            WorkoutTask.objects.filter(pk=task.pk).update(version=5)
+            return task, created
+        
+        monkeypatch.setattr(recurrence, 'materialize', racing_materialize)
+        api_client.force_authenticate(user=member)
+        response = api_client.patch(
+            f'/api/v1/recurring-tasks/{rule.id}/occurrences/2024-03-06/', {'status': 'completed'}, format='json'
+        )
+        assert (response.status_code, response.data['version']) == (200, 6)
@@ -0,0 +1,176 @@
+"""
+Token-bucket throttling and a cache of recently failed logins.
+
+Each bucket holds up to N tokens for a rate of ``N/period`` (rates live in
+``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``) and refills continuously, so
+short bursts are allowed while the sustained rate stays bounded. Buckets are
+kept in the ``THROTTLE_CACHE`` cache (shared Redis in production); if that
+cache is unreachable the process-local ``local`` cache takes over rather than
+failing requests, and stays in charge for ``CACHE_BREAKER_SECONDS``.
+
+Taking a token is atomic, otherwise a burst of concurrent requests would all
+read the same full bucket and all pass: on Redis the read, refill and write
+run as one Lua script, on the other caches under a process lock (which covers
+the process-local caches; a shared non-Redis cache is only guarded per
+process).
+
+Failed logins are remembered as an HMAC of the email, the password and the
+account's current password hash, so an identical retry is rejected without
+running the password hasher again, and a password change invalidates it.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import salted_hmac
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from . import caching
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'5/min'`` -> ``(5, 60)``"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def _cache_call(method, *args, **kwargs):
+    alias = getattr(settings, 'THROTTLE_CACHE', 'default')
+    local = caches['local']
+    if alias == 'local':
+        return getattr(local, method)(*args, **kwargs)
+    return caching.call(alias, method, *args, fallback=lambda: getattr(local, method)(*args, **kwargs), **kwargs)
+
+
+# KEYS[1] bucket; ARGV capacity, refill per second, now, ttl. Returns the
+# seconds to wait as a string (Lua numbers come back truncated to integers).
+TAKE_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local capacity, refill, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+if tokens < 1 then
+    return tostring((1 - tokens) / refill)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return '0'
+"""
+
+_take_lock = threading.Lock()
+
+
+def _take(cache, key, capacity, period, now):
+    refill = capacity / period
+    with _take_lock:
+        state = cache.get(key)
+        tokens, updated = state if state is not None else (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        if tokens < 1:
+            return (1 - tokens) / refill
+        cache.set(key, (tokens - 1, now), timeout=int(period) + 1)
+    return 0
+
+
+def _take_redis(cache, key, capacity, period, now):
+    # RedisCache keeps its redis-py clients on the private ``_cache``
+    client = cache._cache.get_client(key, write=True)
+    wait = client.eval(
+        TAKE_SCRIPT, 1, cache.make_and_validate_key(key), capacity, capacity / period, repr(now), int(period) + 1
+    )
+    return float(wait)
+
+
+def consume(key, capacity, period, now=None):
+    """Take one token from a bucket; return the seconds to wait, 0 if allowed"""
+    now = time.time() if now is None else now
+    alias = getattr(settings, 'THROTTLE_CACHE', 'default')
+    local = caches['local']
+    if alias == 'local':
+        return _take(local, key, capacity, period, now)
+
+    def take(cache):
+        if isinstance(cache, RedisCache):
+            return _take_redis(cache, key, capacity, period, now)
+        return _take(cache, key, capacity, period, now)
+
+    return caching.run(alias, take, fallback=lambda: _take(local, key, capacity, period, now))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle with one token bucket per ``(scope, identity)``. By default a
+    request uses one bucket per client IP in ``scope``; subclasses with
+    other buckets override ``get_buckets()``.
+    """
+    scope = None
+
+    def get_buckets(self, request, view):
+        if self.scope is None:
+            raise ImproperlyConfigured(f'{type(self).__name__} needs a scope or its own get_buckets()')
+        return [(self.scope, self.get_ident(request))]
+
+    def allow_request(self, request, view):
+        rates = api_settings.DEFAULT_THROTTLE_RATES
+        self.wait_seconds = None
+        for scope, identity in self.get_buckets(request, view):
+            rate = rates.get(scope)
+            if not rate or identity is None:
+                continue
+            capacity, period = parse_rate(rate)
+            wait = consume(f'throttle:{scope}:{identity}', capacity, period)
+            if wait:
+                self.wait_seconds = wait
+                return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """Per client IP and per account (email) buckets for login attempts"""
+
+    def get_buckets(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        account = email.strip().lower() if isinstance(email, str) and email.strip() else None
+        return [('login_ip', self.get_ident(request)), ('login_account', account)]
+
+
+class RefreshThrottle(TokenBucketThrottle):
+    """Per client IP bucket for token refreshes"""
+    scope = 'refresh_ip'
+
+
+class WriteThrottle(TokenBucketThrottle):
+    """Per user and per client IP buckets for non-safe methods"""
+
+    def get_buckets(self, request, view):
+        if request.method in SAFE_METHODS:
+            return []
+        buckets = [('write_ip', self.get_ident(request))]
+        if request.user and request.user.is_authenticated:
+            buckets.append(('write_user', request.user.pk))
+        return buckets
+
+
+def _failure_key(email, password, password_hash):
+    digest = salted_hmac('gym_api.login_failure', f'{email}\0{password}\0{password_hash}').hexdigest()
+    return f'login-failure:{digest}'
+
+
+def is_known_failure(email, password, password_hash):
+    return _cache_call('get', _failure_key(email, password, password_hash)) is not None
+
+
+def remember_failure(email, password, password_hash):
+    ttl = getattr(settings, 'LOGIN_FAILURE_CACHE_TTL', 300)
+    _cache_call('set', _failure_key(email, password, password_hash), 1, timeout=ttl)
@@ -0,0 +1,66 @@
+"""
+Per-request phase timings, reported in the ``Server-Timing`` response header.
+
+``ServerTimingMiddleware`` opens a collector for each request; the timed
+authentication class, renderer and view mixin add their phases to it through
+``phase()``. Outside a request ``phase()`` does nothing.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('gym_api_server_timing', default=None)
+
+# header order and descriptions
+PHASES = (
+    ('auth', 'JWT authentication'),
+    ('perm', 'Permission checks'),
+    ('qs', 'Queryset evaluation'),
+    ('serialize', 'Serializer data'),
+    ('render', 'Rendering'),
+    ('db', None),
+    ('total', 'Total'),
+)
+
+
+class PhaseTimings:
+    """Accumulated durations (in seconds) per phase for one request"""
+
+    def __init__(self):
+        self.phases = {}
+        self.query_count = 0
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def header(self):
+        parts = []
+        for name, description in PHASES:
+            if name not in self.phases:
+                continue
+            if name == 'db':
+                description = f'{self.query_count} queries'
+            parts.append(f'{name};dur={self.phases[name] * 1000:.2f};desc="{description}"')
+        return ', '.join(parts)
+
+
+def begin():
+    timings = PhaseTimings()
+    return timings, _current.set(timings)
+
+
+def end(token):
+    _current.reset(token)
+
+
+@contextmanager
+def phase(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
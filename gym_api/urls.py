@@ -7,12 +7,20 @@ router.register(r'gym-branches', views.GymBranchViewSet, basename='gymbranch')
 router.register(r'users', views.UserViewSet, basename='user')
 router.register(r'workout-plans', views.WorkoutPlanViewSet, basename='workoutplan')
 router.register(r'workout-tasks', views.WorkoutTaskViewSet, basename='workoutask')
+router.register(r'recurring-tasks', views.RecurringTaskViewSet, basename='recurringtask')
+router.register(r'webhooks', views.WebhookSubscriptionViewSet, basename='webhooksubscription')
 router.register(r'activity-logs', views.ActivityLogViewSet, basename='activitylog')
+router.register(r'slow-queries', views.SlowQueryViewSet, basename='slowquery')
 
 urlpatterns = [
     path('', views.welcome_view, name='welcome'),
     path('auth/login/', views.login_view, name='login'),
     path('auth/refresh/', views.refresh_token_view, name='refresh_token'),
     path('auth/profile/', views.profile_view, name='profile'),
+    path('batch/', views.batch_view, name='batch'),
+    path('profiles/', views.profile_list_view, name='request_profiles'),
+    path('profiles/<str:profile_id>/', views.profile_detail_view, name='request_profile_detail'),
+    path('workout-tasks/events/', views.task_events_view, name='workout_task_events'),
+    path('workout-tasks/events/ticket/', views.task_events_ticket_view, name='workout_task_events_ticket'),
     path('', include(router.urls)),
 ]
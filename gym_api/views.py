@@ -1,21 +1,37 @@
-from rest_framework import viewsets, status, generics
+from rest_framework import mixins, viewsets, status, generics
 from rest_framework.response import Response
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from datetime import date
 
-from .models import User, GymBranch, WorkoutPlan, WorkoutTask, ActivityLog
+from . import archive, assignments, batch, calendars, events, leaderboard, profiling, recurrence, rollups, search, webhooks
+from .authentication import authenticate_event_stream, issue_stream_ticket
+from .pagination import EstimatedCountPagination, StandardResultsSetPagination
+from .mixins import (
+    DeltaSyncMixin, OptimisticConcurrencyMixin, ServerTimingMixin, SparseFieldsetMixin, ValuesListMixin,
+)
+from .models import (
+    User, GymBranch, WorkoutPlan, WorkoutTask, RecurringTask, ActivityLog, SlowQuery, WebhookSubscription,
+)
 from .serializers import (
     UserSerializer, UserDetailSerializer, UserCreateSerializer,
     GymBranchSerializer, WorkoutPlanSerializer, WorkoutTaskSerializer,
-    WorkoutTaskUpdateSerializer, ActivityLogSerializer, LoginSerializer,
-    TokenSerializer, RefreshTokenSerializer
+    WorkoutTaskUpdateSerializer, RecurringTaskSerializer, ArchivedWorkoutTaskSerializer, ActivityLogSerializer, LoginSerializer,
+    TokenSerializer, RefreshTokenSerializer, SlowQuerySerializer, WebhookSubscriptionSerializer
 )
+from .sync import tombstones_for
+from .throttling import LoginThrottle, RefreshThrottle
+from .timing import phase
 from .permissions import (
     IsSuperAdmin, IsGymManager, IsTrainer, IsMember,
     IsSameBranch, IsGymManagerOrSuperAdmin, IsOwnerOrGymManager,
@@ -23,14 +39,9 @@ from .permissions import (
 )
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle])
 def login_view(request):
     """User login endpoint"""
     serializer = LoginSerializer(data=request.data)
@@ -58,6 +69,7 @@ def login_view(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RefreshThrottle])
 def refresh_token_view(request):
     """Refresh token endpoint"""
     serializer = RefreshTokenSerializer(data=request.data)
@@ -84,7 +96,7 @@ def profile_view(request):
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class GymBranchViewSet(viewsets.ModelViewSet):
+class GymBranchViewSet(ServerTimingMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     Gym Branch ViewSet
     - Super Admin: Can create, list, retrieve, update, delete all branches
@@ -122,7 +134,7 @@ class GymBranchViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(DeltaSyncMixin, ValuesListMixin, ServerTimingMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     User ViewSet
     - Super Admin: Can manage all users
@@ -149,6 +161,16 @@ class UserViewSet(viewsets.ModelViewSet):
             # Members and trainers can only view their own profile
             return User.objects.filter(id=user.id)
     
+    def get_tombstone_queryset(self):
+        user = self.request.user
+        tombstones = tombstones_for(User)
+        
+        if user.role == 'super_admin':
+            return tombstones
+        elif user.role == 'gym_manager':
+            return tombstones.filter(branch_id=user.gym_branch_id)
+        return tombstones.filter(owner_id=user.id)
+    
     def get_serializer_class(self):
         if self.action == 'create':
             return UserCreateSerializer
@@ -208,7 +230,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        serializer = UserSerializer(trainers, many=True)
+        serializer = UserSerializer(trainers, many=True, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
@@ -224,11 +246,92 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        serializer = UserSerializer(members, many=True)
+        serializer = UserSerializer(members, many=True, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Top matches whose email, name or last name starts with ``q``"""
+        if request.user.role == 'super_admin':
+            users = User.objects.all()
+            branch_id = request.query_params.get('gym_branch') or search.ALL_BRANCHES
+            if branch_id != search.ALL_BRANCHES:
+                if not branch_id.isdigit():
+                    return Response({'error': 'gym_branch must be a branch id'}, status=status.HTTP_400_BAD_REQUEST)
+                users = users.filter(gym_branch_id=branch_id)
+        elif request.user.role == 'gym_manager':
+            users = User.objects.filter(gym_branch_id=request.user.gym_branch_id)
+            branch_id = request.user.gym_branch_id
+        else:
+            return Response(
+                {'error': 'You do not have permission to search users'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        role = request.query_params.get('role', '')
+        if role:
+            if role not in dict(User.ROLE_CHOICES):
+                return Response({'error': f'Unknown role: {role}'}, status=status.HTTP_400_BAD_REQUEST)
+            users = users.filter(role=role)
+        max_limit = getattr(settings, 'AUTOCOMPLETE_MAX_RESULTS', 20)
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'error': f'limit must be between 1 and {max_limit}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = search.autocomplete(users, request.query_params.get('q', ''), limit, branch_id, role)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['post'], url_path='assign-trainers')
+    def assign_trainers(self, request):
+        """Assign members to the branch's least loaded trainers, or all of them to ``trainer``"""
+        if request.user.role == 'super_admin':
+            try:
+                branch_id = int(request.data.get('gym_branch'))
+            except (TypeError, ValueError):
+                return Response({'error': 'gym_branch must be a branch id'}, status=status.HTTP_400_BAD_REQUEST)
+            if not GymBranch.objects.filter(pk=branch_id).exists():
+                return Response({'error': 'Gym branch not found'}, status=status.HTTP_404_NOT_FOUND)
+        elif request.user.role == 'gym_manager':
+            branch_id = request.user.gym_branch_id
+        else:
+            return Response(
+                {'error': 'You do not have permission to assign trainers'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        member_ids = request.data.get('members')
+        if member_ids is not None and (
+            not isinstance(member_ids, list) or not all(isinstance(member_id, int) for member_id in member_ids)
+        ):
+            return Response({'error': 'members must be a list of user ids'}, status=status.HTTP_400_BAD_REQUEST)
+        trainer_id = request.data.get('trainer')
+        if trainer_id is None:
+            loads, assigned = assignments.assign_members(branch_id, member_ids)
+        else:
+            if member_ids is None:
+                return Response({'error': 'members is required with trainer'}, status=status.HTTP_400_BAD_REQUEST)
+            trainer = User.objects.filter(
+                pk=trainer_id, role='trainer', gym_branch_id=branch_id, is_active=True
+            ).first() if isinstance(trainer_id, int) else None
+            if trainer is None:
+                return Response(
+                    {'error': 'trainer must be an active trainer of the branch'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            assigned = assignments.assign_to_trainer(trainer, member_ids)
+            loads = assignments.trainer_loads(branch_id)
+        
+        return Response({
+            'assigned': assigned,
+            'trainers': [{'id': trainer_id, 'load': load} for trainer_id, load in loads.items()],
+        }, status=status.HTTP_200_OK)
 
 
-class WorkoutPlanViewSet(viewsets.ModelViewSet):
+class WorkoutPlanViewSet(OptimisticConcurrencyMixin, DeltaSyncMixin, ServerTimingMixin, SparseFieldsetMixin,
+                         viewsets.ModelViewSet):
     """
     Workout Plan ViewSet
     - Trainer: Can create plans for their branch
@@ -256,6 +359,16 @@ class WorkoutPlanViewSet(viewsets.ModelViewSet):
             # Members cannot view workout plans directly
             return WorkoutPlan.objects.none()
     
+    def get_tombstone_queryset(self):
+        user = self.request.user
+        tombstones = tombstones_for(WorkoutPlan)
+        
+        if user.role == 'super_admin':
+            return tombstones
+        elif user.role in ['gym_manager', 'trainer']:
+            return tombstones.filter(branch_id=user.gym_branch_id)
+        return tombstones.none()
+    
     def get_permissions(self):
         if self.action == 'create':
             permission_classes = [IsTrainer]
@@ -292,7 +405,8 @@ class WorkoutPlanViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class WorkoutTaskViewSet(viewsets.ModelViewSet):
+class WorkoutTaskViewSet(OptimisticConcurrencyMixin, DeltaSyncMixin, ValuesListMixin, ServerTimingMixin, SparseFieldsetMixin,
+                         viewsets.ModelViewSet):
     """
     Workout Task ViewSet
     - Trainer: Can create, assign, and update tasks in their branch
@@ -300,7 +414,7 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
     - Manager: Can view all tasks in their branch
     """
     queryset = WorkoutTask.objects.all()
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'member', 'workout_plan']
@@ -314,14 +428,26 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
         if user.role == 'super_admin':
             return WorkoutTask.objects.all()
         elif user.role == 'gym_manager':
-            return WorkoutTask.objects.filter(workout_plan__gym_branch=user.gym_branch)
+            return WorkoutTask.objects.filter(gym_branch_id=user.gym_branch_id)
         elif user.role == 'trainer':
-            return WorkoutTask.objects.filter(workout_plan__gym_branch=user.gym_branch)
+            return WorkoutTask.objects.filter(gym_branch_id=user.gym_branch_id)
         elif user.role == 'member':
             # Members can only view their own tasks
             return WorkoutTask.objects.filter(member=user)
         return WorkoutTask.objects.none()
     
+    def get_tombstone_queryset(self):
+        user = self.request.user
+        tombstones = tombstones_for(WorkoutTask)
+        
+        if user.role == 'super_admin':
+            return tombstones
+        elif user.role in ['gym_manager', 'trainer']:
+            return tombstones.filter(branch_id=user.gym_branch_id)
+        elif user.role == 'member':
+            return tombstones.filter(owner_id=user.id)
+        return tombstones.none()
+    
     def get_serializer_class(self):
         if self.action in ['update', 'partial_update']:
             return WorkoutTaskUpdateSerializer
@@ -354,13 +480,13 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
                 member = User.objects.get(id=member_id)
                 workout_plan = WorkoutPlan.objects.get(id=workout_plan_id)
                 
-                if member.gym_branch != request.user.gym_branch:
+                if member.gym_branch_id != request.user.gym_branch_id:
                     return Response(
                         {'error': 'Cannot assign task to member from different branch'},
                         status=status.HTTP_403_FORBIDDEN
                     )
                 
-                if workout_plan.gym_branch != request.user.gym_branch:
+                if workout_plan.gym_branch_id != request.user.gym_branch_id:
                     return Response(
                         {'error': 'Cannot assign task from different branch'},
                         status=status.HTTP_403_FORBIDDEN
@@ -380,8 +506,8 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
                     {'error': 'You can only update your own tasks'},
                     status=status.HTTP_403_FORBIDDEN
                 )
-            # Member can only update status
-            allowed_fields = ['status']
+            # Member can only update status (optionally conditional on the version)
+            allowed_fields = ['status', 'version']
             for field in request.data.keys():
                 if field not in allowed_fields:
                     return Response(
@@ -391,7 +517,7 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
         
         # Trainers can update tasks in their branch
         elif request.user.role == 'trainer':
-            if instance.workout_plan.gym_branch != request.user.gym_branch:
+            if instance.gym_branch_id != request.user.gym_branch_id:
                 return Response(
                     {'error': 'You can only update tasks from your branch'},
                     status=status.HTTP_403_FORBIDDEN
@@ -399,6 +525,42 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
         
         return super().update(request, *args, **kwargs)
     
+    def perform_create(self, serializer):
+        task = serializer.save()
+        events.publish_task_event('task.created', task)
+    
+    def perform_update(self, serializer):
+        self.check_version(serializer.instance)
+        previous_status = serializer.instance.status
+        task = serializer.save()
+        if task.status != previous_status:
+            events.publish_task_event('task.status_changed', task, previous_status)
+    
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # ?history=1 falls through to the archive
+            if request.query_params.get('history') not in ('1', 'true'):
+                raise
+        archived = get_object_or_404(archive.archived_tasks_for(request.user), pk=kwargs['pk'])
+        return Response(ArchivedWorkoutTaskSerializer(archived).data)
+    
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """Archived (long completed) tasks, most recently completed first"""
+        queryset = archive.archived_tasks_for(request.user).order_by('-completed_at', '-id')
+        for field in ('member', 'workout_plan'):
+            value = request.query_params.get(field)
+            if value:
+                if not value.isdigit():
+                    return Response({'error': f'{field} must be an id'}, status=status.HTTP_400_BAD_REQUEST)
+                queryset = queryset.filter(**{f'{field}_id': value})
+        
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(ArchivedWorkoutTaskSerializer(page, many=True).data)
+    
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         
@@ -415,18 +577,389 @@ class WorkoutTaskViewSet(viewsets.ModelViewSet):
             )
         
         return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """Tasks due in a date range, grouped by day in the requested time zone"""
+        try:
+            start, end, tz = calendars.parse_range(request.query_params)
+        except calendars.CalendarRangeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        lower, upper = calendars.bounds(start, end, tz)
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            due_date__gte=lower, due_date__lt=upper
+        ).order_by('due_date', 'id')
+        with phase('qs'):
+            tasks = list(queryset)
+            tasks.extend(self.virtual_occurrences(lower, upper))
+        tasks.sort(key=lambda task: (task.due_date, task.id or 0))
+        
+        # timestamps are rendered in the requested time zone
+        with timezone.override(tz):
+            data = self.serialize(tasks, many=True)
+        grouped = calendars.group_by_day(data, [task.due_date for task in tasks], start, end, tz)
+        return Response({
+            'start': start,
+            'end': end,
+            'timezone': str(tz),
+            'days': [{'date': day, 'tasks': items} for day, items in grouped.items()],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def leaderboard(self, request):
+        """Members of a branch ranked by tasks completed in a week or month, with the caller's rank"""
+        params = request.query_params
+        period = params.get('period', 'week')
+        if period not in leaderboard.PERIODS:
+            return Response({'error': 'period must be week or month'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            day = date.fromisoformat(params['date']) if params.get('date') else timezone.localdate()
+        except ValueError:
+            return Response({'error': 'date must be a YYYY-MM-DD date'}, status=status.HTTP_400_BAD_REQUEST)
+        max_limit = getattr(settings, 'LEADERBOARD_MAX_RESULTS', 100)
+        try:
+            limit = min(int(params.get('limit', 10)), max_limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({'error': f'limit must be between 1 and {max_limit}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if request.user.role == 'super_admin':
+            branch_id = params.get('gym_branch', '')
+            if not branch_id.isdigit():
+                return Response({'error': 'gym_branch is required'}, status=status.HTTP_400_BAD_REQUEST)
+            branch_id = int(branch_id)
+        else:
+            branch_id = request.user.gym_branch_id
+        
+        start = leaderboard.period_start(day, period)
+        results = [
+            {
+                'rank': rank,
+                'member': entry.member_id,
+                'first_name': entry.member.first_name,
+                'last_name': entry.member.last_name,
+                'completed': entry.completed,
+            }
+            for rank, entry in leaderboard.top(branch_id, period, start, limit)
+        ]
+        data = {'period': period, 'period_start': start, 'results': results}
+        if request.user.role == 'member':
+            rank, completed = leaderboard.rank_of(branch_id, request.user.id, period, start)
+            data['me'] = {'rank': rank, 'completed': completed}
+        return Response(data, status=status.HTTP_200_OK)
+    
+    def virtual_occurrences(self, lower, upper):
+        """Unstored recurring task occurrences due in the range, honouring the list filters"""
+        params = self.request.query_params
+        if params.get('status', 'pending') != 'pending':
+            return []
+        rules = recurrence.rules_between(recurrence.recurring_tasks_for(self.request.user), lower, upper)
+        for field in ('member', 'workout_plan'):
+            if params.get(field):
+                rules = rules.filter(**{f'{field}_id': params[field]})
+        return recurrence.expand(rules, lower, upper)
 
 
-class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
+class RecurringTaskViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                           mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Recurring Task ViewSet
+    - Trainer: Can create and delete recurring tasks in their branch
+    - Member: Can view their own and change the status of single occurrences
+    - Manager: Can view all recurring tasks in their branch
+    """
+    serializer_class = RecurringTaskSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['member', 'workout_plan']
+    ordering_fields = ['created_at', 'start_date', 'end_date']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        return recurrence.recurring_tasks_for(self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        if request.user.role != 'trainer':
+            return Response(
+                {'error': 'Only trainers can assign recurring tasks'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data['workout_plan'].gym_branch_id != request.user.gym_branch_id:
+            return Response(
+                {'error': 'Cannot assign task from different branch'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        
+        if request.user.role != 'trainer' or instance.created_by_id != request.user.id:
+            return Response(
+                {'error': 'You can only delete recurring tasks you created'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        return super().destroy(request, *args, **kwargs)
+    
+    @action(detail=True, methods=['get'])
+    def occurrences(self, request, pk=None):
+        """Occurrences due in a date range, stored ones in place of their virtual counterparts"""
+        rule = self.get_object()
+        try:
+            start, end, tz = calendars.parse_range(request.query_params)
+        except calendars.CalendarRangeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        lower, upper = calendars.bounds(start, end, tz)
+        tasks = list(
+            rule.occurrences.filter(due_date__gte=lower, due_date__lt=upper)
+            .select_related('workout_plan', 'member', 'created_by')
+        )
+        tasks.extend(recurrence.expand([rule], lower, upper))
+        tasks.sort(key=lambda task: task.due_date)
+        
+        with timezone.override(tz):
+            data = WorkoutTaskSerializer(tasks, many=True, context=self.get_serializer_context()).data
+        return Response(data)
+    
+    @action(detail=True, methods=['patch'], url_path=r'occurrences/(?P<day>\d{4}-\d{2}-\d{2})')
+    def occurrence(self, request, pk=None, day=None):
+        """Change the status of one occurrence, storing it as a workout task on first change"""
+        rule = self.get_object()
+        
+        if request.user.role == 'member':
+            if rule.member_id != request.user.id:
+                return Response(
+                    {'error': 'You can only update your own tasks'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+        elif request.user.role != 'trainer':
+            return Response(
+                {'error': 'Only members and trainers can update task status'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        if set(request.data.keys()) - {'status'}:
+            return Response({'error': 'You can only update status'}, status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = WorkoutTaskUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            occurrence_date = date.fromisoformat(day)
+        except ValueError:
+            return Response({'error': 'Invalid date'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            try:
+                task, created = recurrence.materialize(rule, occurrence_date)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            previous_status = task.status
+            task.status = serializer.validated_data['status']
+            task.save()
+        
+        if created:
+            events.publish_task_event('task.created', task)
+        if task.status != previous_status:
+            events.publish_task_event('task.status_changed', task, previous_status)
+        data = WorkoutTaskSerializer(task, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class WebhookSubscriptionViewSet(viewsets.ModelViewSet):
+    """
+    Webhook Subscription ViewSet
+    - Gym Manager: Can manage the subscriptions of their branch
+    - Super Admin: Can manage all subscriptions
+    """
+    serializer_class = WebhookSubscriptionSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [IsGymManagerOrSuperAdmin]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['gym_branch', 'is_active']
+    ordering_fields = ['created_at']
+    ordering = ['-created_at']
+    
+    def get_queryset(self):
+        user = self.request.user
+        if user.role == 'super_admin':
+            return WebhookSubscription.objects.all()
+        return WebhookSubscription.objects.filter(gym_branch_id=user.gym_branch_id)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if request.user.role == 'gym_manager':
+            gym_branch = request.user.gym_branch
+        else:
+            gym_branch = serializer.validated_data.get('gym_branch')
+            if gym_branch is None:
+                return Response({'error': 'gym_branch is required'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save(gym_branch=gym_branch, created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def perform_update(self, serializer):
+        if self.request.user.role == 'gym_manager':
+            # managers cannot move subscriptions to another branch
+            serializer.save(gym_branch=self.request.user.gym_branch)
+        else:
+            serializer.save()
+    
+    @action(detail=True, methods=['get'])
+    def deliveries(self, request, pk=None):
+        """Recent deliveries of a subscription, newest first"""
+        subscription = self.get_object()
+        deliveries = subscription.deliveries.order_by('-created_at').values(
+            'id', 'event', 'status', 'attempts', 'next_attempt_at', 'last_error', 'delivered_at', 'created_at'
+        )
+        page = self.paginate_queryset(deliveries)
+        return self.get_paginated_response(page)
+
+
+class ActivityLogViewSet(ValuesListMixin, ServerTimingMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     """Activity log view set for audit trail"""
     queryset = ActivityLog.objects.all()
     serializer_class = ActivityLogSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = EstimatedCountPagination
     permission_classes = [IsAuthenticated, IsSuperAdmin]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['user', 'action', 'model_name']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Activity counts per hour or day, branch, action and model, from the rollup counters"""
+        try:
+            lower, upper, interval = rollups.parse_stats_params(request.query_params)
+        except rollups.StatsRangeError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        branch = request.query_params.get('branch')
+        if branch and not branch.isdigit():
+            return Response({'error': 'branch must be a branch id'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = rollups.histogram(
+            lower, upper, interval,
+            branch_id=int(branch) if branch else None,
+            action=request.query_params.get('action'),
+            model_name=request.query_params.get('model_name'),
+        )
+        return Response({
+            'interval': interval,
+            'start': lower.isoformat(),
+            'end': upper.isoformat(),
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+class SlowQueryViewSet(ServerTimingMixin, viewsets.ReadOnlyModelViewSet):
+    """Slow query summary, aggregated by SQL fingerprint"""
+    queryset = SlowQuery.objects.all()
+    serializer_class = SlowQuerySerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [IsAuthenticated, IsSuperAdmin]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['view']
+    ordering_fields = ['total_ms', 'max_ms', 'count', 'last_seen']
+    ordering = ['-total_ms']
+
+
+@api_view(['GET'])
+@permission_classes([IsSuperAdmin])
+def profile_list_view(request):
+    """List stored request profiles, newest first"""
+    profiles = profiling.list_profiles()
+    for profile in profiles:
+        profile['url'] = request.build_absolute_uri(f"{request.path}{profile['id']}/")
+    return Response(profiles, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsSuperAdmin])
+def profile_detail_view(request, profile_id):
+    """Download the collapsed stacks of one request profile"""
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        raise Http404('Profile not found')
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=f'{profile_id}.collapsed',
+        content_type='text/plain; charset=utf-8'
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_view(request):
+    """Run several API requests in one round trip"""
+    try:
+        items = batch.parse_requests(request.data)
+    except batch.BatchError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if request.data.get('transactional'):
+        results, committed = batch.run_atomic(request, items)
+        return Response({'committed': committed, 'responses': results}, status=status.HTTP_200_OK)
+    return Response({'responses': batch.run(request, items)}, status=status.HTTP_200_OK)
+
+
+EVENTS_DISABLED = 'Event streams are not enabled on this server'
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def task_events_ticket_view(request):
+    """Single-use ticket for opening an event stream with EventSource"""
+    if not getattr(settings, 'EVENTS_ENABLED', False):
+        return Response({'error': EVENTS_DISABLED}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        ticket = issue_stream_ticket(request.user)
+    except Exception:
+        return Response(
+            {'error': 'Event streams are temporarily unavailable'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    return Response(
+        {'ticket': ticket, 'expires_in': getattr(settings, 'EVENTS_TICKET_TTL', 30)},
+        status=status.HTTP_201_CREATED
+    )
+
+
+async def task_events_view(request):
+    """Server-Sent Events stream of task creations and status changes"""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not getattr(settings, 'EVENTS_ENABLED', False):
+        return JsonResponse({'error': EVENTS_DISABLED}, status=status.HTTP_404_NOT_FOUND)
+    
+    user = await sync_to_async(authenticate_event_stream)(request)
+    if user is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    if not isinstance(request, ASGIRequest):
+        # a WSGI worker would be tied up for the whole stream
+        return JsonResponse(
+            {'error': 'Event streams are only served by the ASGI application'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    
+    response = StreamingHttpResponse(
+        events.stream(events.scope_for(user)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @api_view(['GET'])
@@ -440,11 +973,22 @@ def welcome_view(request):
             'login': '/api/v1/auth/login/',
             'refresh_token': '/api/v1/auth/refresh/',
             'profile': '/api/v1/auth/profile/',
+            'batch': '/api/v1/batch/',
             'gym_branches': '/api/v1/gym-branches/',
             'users': '/api/v1/users/',
+            'user_autocomplete': '/api/v1/users/autocomplete/?q=',
+            'assign_trainers': '/api/v1/users/assign-trainers/',
+            'webhooks': '/api/v1/webhooks/',
             'workout_plans': '/api/v1/workout-plans/',
             'workout_tasks': '/api/v1/workout-tasks/',
-            'activity_logs': '/api/v1/activity-logs/'
+            'workout_task_events': '/api/v1/workout-tasks/events/',
+            'workout_task_events_ticket': '/api/v1/workout-tasks/events/ticket/',
+            'workout_task_leaderboard': '/api/v1/workout-tasks/leaderboard/',
+            'workout_task_history': '/api/v1/workout-tasks/history/',
+            'recurring_tasks': '/api/v1/recurring-tasks/',
+            'activity_logs': '/api/v1/activity-logs/',
+            'activity_stats': '/api/v1/activity-logs/stats/',
+            'slow_queries': '/api/v1/slow-queries/'
         },
         'test_credentials': {
             'super_admin': {
@@ -0,0 +1,290 @@
+"""
+Webhooks for task and plan events.
+
+Model signals write one ``WebhookDelivery`` per matching subscription of the
+branch, inside the transaction of the change itself (a transactional
+outbox): an event exists if and only if its change committed. Changes made
+with bulk ``update()`` send no events.
+
+``deliver`` drains the outbox per endpoint. For each subscription with due
+events it claims up to ``WEBHOOK_BATCH_SIZE`` of them with ``FOR UPDATE
+SKIP LOCKED``, leases them for ``WEBHOOK_LEASE_SECONDS`` and POSTs them as
+one JSON body ``{"events": [...]}``, outside any transaction, over a
+keep-alive connection per host. The body is signed with the subscription's
+secret::
+
+    X-Webhook-Timestamp: <unix seconds>
+    X-Webhook-Signature: sha256=<hex HMAC-SHA256 of "<timestamp>." + body>
+
+A 2xx response delivers the whole batch; anything else schedules it again
+with exponential backoff until ``WEBHOOK_MAX_ATTEMPTS``. Delivery is at least
+once and not strictly ordered; receivers deduplicate on the event ``id``.
+
+Endpoints must be public: hosts resolving to private, loopback, link-local
+or otherwise non-global addresses are refused when a subscription is saved
+and again when connecting (the connection goes to the checked address), so
+subscriptions cannot probe the internal network.
+``WEBHOOK_ALLOW_PRIVATE_URLS`` lifts this for local development.
+"""
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import socket
+import time
+import uuid
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from . import outbox
+from .models import GymBranch, WebhookDelivery, WebhookSubscription
+from .outbox import setting as _setting
+
+USER_AGENT = 'gym-api-webhooks/1'
+
+
+def record(event_type, branch_id, data):
+    """Add ``event_type`` to the outbox of every subscription of the branch that wants it"""
+    if branch_id is None:
+        return 0
+    subscriptions = [
+        subscription_id
+        for subscription_id, events in WebhookSubscription.objects.filter(gym_branch_id=branch_id, is_active=True)
+        .values_list('id', 'events')
+        if event_type in events
+    ]
+    if not subscriptions:
+        return 0
+    now = timezone.now()
+    payload = {'id': uuid.uuid4().hex, 'type': event_type, 'created_at': now.isoformat(), 'data': data}
+    WebhookDelivery.objects.bulk_create([
+        WebhookDelivery(subscription_id=subscription_id, event=event_type, payload=payload, next_attempt_at=now)
+        for subscription_id in subscriptions
+    ])
+    return len(subscriptions)
+
+
+def task_data(task, previous_status=None):
+    return {
+        'id': task.id,
+        'workout_plan': task.workout_plan_id,
+        'member': task.member_id,
+        'status': task.status,
+        'previous_status': previous_status,
+        'due_date': task.due_date.isoformat() if task.due_date else None,
+        'gym_branch': task.gym_branch_id,
+    }
+
+
+def plan_data(plan):
+    return {'id': plan.id, 'title': plan.title, 'created_by': plan.created_by_id, 'gym_branch': plan.gym_branch_id}
+
+
+def task_saved(task, created):
+    previous_status = getattr(task, '_previous_status', None)
+    if created:
+        record('task.created', task.gym_branch_id, task_data(task))
+    elif previous_status is not None and task.status != previous_status:
+        record('task.status_changed', task.gym_branch_id, task_data(task, previous_status))
+
+
+def plan_saved(plan, created):
+    if created:
+        record('plan.created', plan.gym_branch_id, plan_data(plan))
+
+
+def plan_deleted(plan, origin=None):
+    # a deleted branch takes its subscriptions along
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is not GymBranch:
+        record('plan.deleted', plan.gym_branch_id, plan_data(plan))
+
+
+class UnsafeURL(ValueError):
+    """The webhook URL is not a public http(s) endpoint"""
+
+
+def public_address(host, port):
+    """An address of ``host`` to connect to; raises UnsafeURL if any is not public"""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeURL(f'{host} cannot be resolved')
+    addresses = [info[4][0] for info in infos]
+    if not _setting('WEBHOOK_ALLOW_PRIVATE_URLS', False):
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split('%')[0])
+            if not ip.is_global or ip.is_multicast:
+                raise UnsafeURL(f'{host} resolves to a non-public address')
+    return addresses[0]
+
+
+def check_url(url):
+    """Raise UnsafeURL unless ``url`` is an http(s) URL of a public host"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise UnsafeURL('Webhook URLs must use http or https')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        raise UnsafeURL('Invalid port')
+    public_address(parts.hostname, port)
+
+
+class _CheckedConnection(http.client.HTTPConnection):
+    """Connects to an address vetted by ``public_address``, not a second lookup"""
+
+    def connect(self):
+        address = public_address(self.host, self.port)
+        self.sock = socket.create_connection((address, self.port), self.timeout, self.source_address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection, _CheckedConnection):
+    # HTTPSConnection.connect() wraps the socket of _CheckedConnection.connect()
+    pass
+
+
+def sign(secret, timestamp, body):
+    message = f'{timestamp}.'.encode() + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, one per scheme and host"""
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or _setting('WEBHOOK_TIMEOUT', 10)
+        self._connections = {}
+
+    def _connect(self, scheme, netloc):
+        if scheme == 'https':
+            return _CheckedHTTPSConnection(netloc, timeout=self.timeout)
+        return _CheckedConnection(netloc, timeout=self.timeout)
+
+    def post(self, url, body, headers):
+        """POST and return the response status"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        reused = key in self._connections
+        while True:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = self._connections[key] = self._connect(*key)
+            try:
+                connection.request('POST', path, body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (http.client.HTTPException, OSError):
+                self._drop(key)
+                if reused:
+                    # the server closed the idle connection; retry once on a new one
+                    reused = False
+                    continue
+                raise
+            if response.will_close:
+                self._drop(key)
+            return response.status
+
+    def _drop(self, key):
+        connection = self._connections.pop(key, None)
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        for key in list(self._connections):
+            self._drop(key)
+
+
+def backoff(attempts):
+    """Seconds to wait after the ``attempts``-th failed attempt"""
+    return outbox.backoff(
+        attempts, _setting('WEBHOOK_RETRY_BASE_SECONDS', 30), _setting('WEBHOOK_RETRY_MAX_SECONDS', 3600)
+    )
+
+
+def due_endpoints(now, limit=100):
+    return list(
+        WebhookDelivery.objects.filter(status='pending', next_attempt_at__lte=now, subscription__is_active=True)
+        .values_list('subscription_id', flat=True).distinct().order_by('subscription_id')[:limit]
+    )
+
+
+def claim(subscription_id, batch_size, now=None):
+    """Lease the oldest due events of one endpoint that no other worker holds"""
+    ids = outbox.claim(
+        WebhookDelivery.objects.filter(subscription_id=subscription_id), batch_size,
+        _setting('WEBHOOK_LEASE_SECONDS', 120), now,
+    )
+    return list(WebhookDelivery.objects.filter(id__in=ids).order_by('id'))
+
+
+def send_batch(subscription, deliveries, pool, now=None):
+    """POST one batch and record the outcome; return True if it was delivered"""
+    now = now or timezone.now()
+    body = json.dumps({'events': [delivery.payload for delivery in deliveries]}, separators=(',', ':')).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': USER_AGENT,
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Signature': sign(subscription.secret, timestamp, body),
+    }
+    try:
+        status = pool.post(subscription.url, body, headers)
+        error = None if 200 <= status < 300 else f'HTTP {status}'
+    except (http.client.HTTPException, OSError, UnsafeURL) as exc:
+        error = str(exc) or type(exc).__name__
+
+    ids = [delivery.id for delivery in deliveries]
+    if error is None:
+        WebhookDelivery.objects.filter(id__in=ids).update(status='delivered', delivered_at=now, last_error='')
+        return True
+    by_attempts = {}
+    for delivery in deliveries:
+        by_attempts.setdefault(delivery.attempts, []).append(delivery.id)
+    for attempts, group in by_attempts.items():
+        outbox.retry(
+            WebhookDelivery, group, attempts, error, _setting('WEBHOOK_MAX_ATTEMPTS', 8),
+            _setting('WEBHOOK_RETRY_BASE_SECONDS', 30), _setting('WEBHOOK_RETRY_MAX_SECONDS', 3600), now,
+        )
+    return False
+
+
+def deliver(batch_size=None, pool=None):
+    """Deliver due events, batched per endpoint, until none are left; return counts"""
+    batch_size = batch_size or _setting('WEBHOOK_BATCH_SIZE', 100)
+    own_pool = pool is None
+    pool = pool or ConnectionPool()
+    totals = {'delivered': 0, 'undelivered': 0, 'batches': 0}
+    try:
+        while True:
+            claimed = False
+            for subscription_id in due_endpoints(timezone.now()):
+                deliveries = claim(subscription_id, batch_size)
+                if not deliveries:
+                    # another worker holds them
+                    continue
+                claimed = True
+                subscription = WebhookSubscription.objects.get(pk=subscription_id)
+                outcome = 'delivered' if send_batch(subscription, deliveries, pool) else 'undelivered'
+                totals[outcome] += len(deliveries)
+                totals['batches'] += 1
+            if not claimed:
+                return totals
+    finally:
+        if own_pool:
+            pool.close()
+
+
+def purge(older_than=None, batch_size=1000):
+    """Delete finished deliveries created before ``older_than``, one chunk at a time"""
+    if older_than is None:
+        older_than = timezone.now() - timedelta(days=_setting('WEBHOOK_RETENTION_DAYS', 14))
+    finished = WebhookDelivery.objects.filter(status__in=('delivered', 'failed'), created_at__lt=older_than)
+    return outbox.purge(finished, batch_size)
@@ -27,11 +27,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'gym_api.middleware.CompressionMiddleware',
+    'gym_api.middleware.SlowQueryMiddleware',
+    'gym_api.middleware.MetricsMiddleware',
+    'gym_api.middleware.ServerTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gym_api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,14 +100,57 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches: shared Redis when REDIS_URL is set, process memory otherwise.
+# 'local' is always process memory and backs up the throttle state.
+REDIS_URL = config('REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gym-default',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gym-local',
+    },
+}
+if REDIS_URL:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {'socket_connect_timeout': 0.5, 'socket_timeout': 0.5},
+    }
+
+# Throttling state and failed-login cache (see gym_api/throttling.py)
+THROTTLE_CACHE = config('THROTTLE_CACHE', default='default')
+# after a cache error, skip that cache for this long (gym_api.caching)
+CACHE_BREAKER_SECONDS = config('CACHE_BREAKER_SECONDS', default=30, cast=int)
+LOGIN_FAILURE_CACHE_TTL = config('LOGIN_FAILURE_CACHE_TTL', default=300, cast=int)
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'gym_api.authentication.TimedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'gym_api.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'gym_api.throttling.WriteThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': config('THROTTLE_LOGIN_IP', default='20/min'),
+        'login_account': config('THROTTLE_LOGIN_ACCOUNT', default='5/min'),
+        'refresh_ip': config('THROTTLE_REFRESH_IP', default='60/min'),
+        'write_ip': config('THROTTLE_WRITE_IP', default='600/min'),
+        'write_user': config('THROTTLE_WRITE_USER', default='120/min'),
+    },
+    # proxies in front of the app that append to X-Forwarded-For (1 behind
+    # Render or nginx); client IPs for throttling come from REMOTE_ADDR at 0
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
@@ -131,9 +179,120 @@ CORS_ALLOWED_ORIGINS = config(
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_EXPOSE_HEADERS = ['Server-Timing']
+
 # Custom User Model
 AUTH_USER_MODEL = 'gym_api.User'
 
+# On-demand request profiling (super admins, X-Profile header or ?_profile=1)
+PROFILE_DIR = config('PROFILE_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILE_SAMPLE_INTERVAL = config('PROFILE_SAMPLE_INTERVAL', default=0.001, cast=float)
+PROFILE_MAX_FILES = config('PROFILE_MAX_FILES', default=200, cast=int)
+
+# Server-Timing header (auth, perm, qs, serialize, render, db, total)
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=True, cast=bool)
+
+# Compiled values_list() read path for task, user and activity log lists
+VALUES_READER_ENABLED = config('VALUES_READER_ENABLED', default=True, cast=bool)
+# compiled readers kept per process, one per serializer and sparse field set
+VALUES_READER_CACHE_SIZE = config('VALUES_READER_CACHE_SIZE', default=256, cast=int)
+
+# Response compression (br needs the optional brotli package)
+COMPRESSION_ENABLED = config('COMPRESSION_ENABLED', default=True, cast=bool)
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_LEVEL = config('COMPRESSION_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=4, cast=int)
+
+# Delta sync (GET <list>/sync/?updated_since=<cursor>)
+SYNC_PAGE_SIZE = config('SYNC_PAGE_SIZE', default=200, cast=int)
+SYNC_MAX_PAGE_SIZE = config('SYNC_MAX_PAGE_SIZE', default=1000, cast=int)
+SYNC_SETTLE_SECONDS = config('SYNC_SETTLE_SECONDS', default=2, cast=float)
+SYNC_TOMBSTONE_RETENTION_DAYS = config('SYNC_TOMBSTONE_RETENTION_DAYS', default=30, cast=int)
+
+# Estimated counts on the task and activity log lists (?count=exact to force)
+COUNT_ESTIMATE_THRESHOLD = config('COUNT_ESTIMATE_THRESHOLD', default=10000, cast=int)
+COUNT_CACHE_TTL = config('COUNT_CACHE_TTL', default=60, cast=int)
+
+# POST /api/v1/batch/
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=20, cast=int)
+BATCH_MAX_WORKERS = config('BATCH_MAX_WORKERS', default=4, cast=int)
+
+# Longest range accepted by /workout-tasks/calendar/
+CALENDAR_MAX_DAYS = config('CALENDAR_MAX_DAYS', default=62, cast=int)
+
+# GET /users/autocomplete/
+AUTOCOMPLETE_MAX_RESULTS = config('AUTOCOMPLETE_MAX_RESULTS', default=20, cast=int)
+AUTOCOMPLETE_CACHE_TTL = config('AUTOCOMPLETE_CACHE_TTL', default=30, cast=int)
+
+# archive_tasks: completed tasks move to the archive table this long after completion
+TASK_ARCHIVE_AFTER_DAYS = config('TASK_ARCHIVE_AFTER_DAYS', default=180, cast=int)
+TASK_ARCHIVE_BATCH_SIZE = config('TASK_ARCHIVE_BATCH_SIZE', default=1000, cast=int)
+
+# GET /workout-tasks/leaderboard/
+LEADERBOARD_MAX_RESULTS = config('LEADERBOARD_MAX_RESULTS', default=100, cast=int)
+
+# snapshot_analytics / analytics_report (need the optional numpy package)
+ANALYTICS_SNAPSHOT_DIR = config('ANALYTICS_SNAPSHOT_DIR', default=os.path.join(BASE_DIR, 'analytics'))
+
+# New members get the least loaded trainer of their branch (see assign_trainers)
+TRAINER_AUTO_ASSIGN = config('TRAINER_AUTO_ASSIGN', default=True, cast=bool)
+
+# Due-date reminders (enqueue_reminders / dispatch_reminders)
+REMINDER_TRANSPORT = config('REMINDER_TRANSPORT', default='gym_api.reminders.EmailTransport')
+REMINDER_FILE_PATH = config('REMINDER_FILE_PATH', default=os.path.join(BASE_DIR, 'reminders.log'))
+REMINDER_LEAD_HOURS = config('REMINDER_LEAD_HOURS', default=24, cast=int)
+REMINDER_BATCH_SIZE = config('REMINDER_BATCH_SIZE', default=500, cast=int)
+REMINDER_MAX_PER_SECOND = config('REMINDER_MAX_PER_SECOND', default=50, cast=float)
+REMINDER_LEASE_SECONDS = config('REMINDER_LEASE_SECONDS', default=300, cast=int)
+REMINDER_MAX_ATTEMPTS = config('REMINDER_MAX_ATTEMPTS', default=5, cast=int)
+REMINDER_RETRY_BASE_SECONDS = config('REMINDER_RETRY_BASE_SECONDS', default=60, cast=int)
+REMINDER_RETRY_MAX_SECONDS = config('REMINDER_RETRY_MAX_SECONDS', default=3600, cast=int)
+REMINDER_RETENTION_DAYS = config('REMINDER_RETENTION_DAYS', default=30, cast=int)
+
+# Webhook delivery (deliver_webhooks)
+WEBHOOK_BATCH_SIZE = config('WEBHOOK_BATCH_SIZE', default=100, cast=int)
+WEBHOOK_TIMEOUT = config('WEBHOOK_TIMEOUT', default=10, cast=float)
+WEBHOOK_LEASE_SECONDS = config('WEBHOOK_LEASE_SECONDS', default=120, cast=int)
+WEBHOOK_MAX_ATTEMPTS = config('WEBHOOK_MAX_ATTEMPTS', default=8, cast=int)
+WEBHOOK_RETRY_BASE_SECONDS = config('WEBHOOK_RETRY_BASE_SECONDS', default=30, cast=int)
+WEBHOOK_RETRY_MAX_SECONDS = config('WEBHOOK_RETRY_MAX_SECONDS', default=3600, cast=int)
+WEBHOOK_RETENTION_DAYS = config('WEBHOOK_RETENTION_DAYS', default=14, cast=int)
+# endpoints on private, loopback or link-local addresses (development only)
+WEBHOOK_ALLOW_PRIVATE_URLS = config('WEBHOOK_ALLOW_PRIVATE_URLS', default=False, cast=bool)
+
+# Outgoing mail (reminders)
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='no-reply@gym.local')
+
+# Longest span of one recurring task assignment
+RECURRING_TASK_MAX_WEEKS = config('RECURRING_TASK_MAX_WEEKS', default=52, cast=int)
+
+# Task event streams (GET /api/v1/workout-tasks/events/). Off by default: they need
+# the ASGI application, and RedisBroker when it runs more than one worker process
+EVENTS_ENABLED = config('EVENTS_ENABLED', default=False, cast=bool)
+EVENT_BROKER_BACKEND = config('EVENT_BROKER_BACKEND', default='gym_api.events.LocalBroker')
+EVENTS_REDIS_CHANNEL = config('EVENTS_REDIS_CHANNEL', default='gym-api:task-events')
+EVENTS_TICKET_TTL = config('EVENTS_TICKET_TTL', default=30, cast=int)
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=100, cast=int)
+EVENTS_HEARTBEAT_SECONDS = config('EVENTS_HEARTBEAT_SECONDS', default=15, cast=float)
+EVENTS_MAX_DURATION = config('EVENTS_MAX_DURATION', default=300, cast=float)
+EVENTS_RETRY_MS = config('EVENTS_RETRY_MS', default=3000, cast=int)
+
+# Activity rollups behind /activity-logs/stats/ (compact_activity_rollups folds old hours into days)
+ACTIVITY_ROLLUP_HOURLY_DAYS = config('ACTIVITY_ROLLUP_HOURLY_DAYS', default=14, cast=int)
+ACTIVITY_STATS_MAX_DAYS = config('ACTIVITY_STATS_MAX_DAYS', default=366, cast=int)
+
+# Slow query log
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=float)
+SLOW_QUERY_SAMPLE_RATE = config('SLOW_QUERY_SAMPLE_RATE', default=1.0, cast=float)
+SLOW_QUERY_MAX_PER_REQUEST = config('SLOW_QUERY_MAX_PER_REQUEST', default=20, cast=int)
+SLOW_QUERY_LOG_FILE = config('SLOW_QUERY_LOG_FILE', default=os.path.join(BASE_DIR, 'slow_queries.log'))
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -142,9 +301,31 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'gym_api.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
         'level': 'INFO',
     },
 }
+
+# Metrics (Prometheus text format at /metrics)
+# Each worker dumps its samples into METRICS_DIR, so every gunicorn worker
+# must see the same directory. Clear it when deploying a new release.
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(BASE_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+# scrapers send it as a Bearer token; /metrics is off (404) while it is empty
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
@@ -8,6 +8,7 @@ from django.conf.urls.static import static
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
+from gym_api.metrics import metrics_view
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -26,6 +27,7 @@ def root_welcome(request):
 urlpatterns = [
     path('', root_welcome, name='root'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/v1/', include('gym_api.urls')),
 ]
 